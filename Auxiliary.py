@@ -3,52 +3,610 @@
 import os
 import abc
 import time
+import queue
+import atexit
+import asyncio
+import heapq
+import bisect
+import weakref
+import itertools
 import logging
 import logging.handlers
-from threading import Thread, Event, Lock
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Condition, Event, Lock
 
-class Timer(Thread):
-    """The Timer is used to perform periodic tasks."""
+# number of worker threads executing the timer functions, see configure()
+TIMER_WORKERS = 4
 
-    def __init__(self, name: str, period: [float, int]):
+# handling of missed periods when timer_fcn() took longer than the period, see configure()
+TIMER_OVERRUN = 'skip'
+
+# threads: the TimerScheduler executes the timers, asyncio: the AsyncTimerScheduler executes the timers
+RUNTIME_MODES = ['threads', 'asyncio']
+
+
+def validate_config(config: dict):
+    """Checks the optional 'runtime' section of the config.
+
+    example config:
+
+        runtime:
+          mode: asyncio
+          timer-workers: 4
+          timer-overrun: skip
+          statistics-period: 60
+
+    :param config: (mandatory, dict) the loaded config as dictionary
+    :raises ValueError: Config did not contain valid information
+    """
+
+    runtime_cfg = config.get('runtime', dict())
+
+    workers = runtime_cfg.get('timer-workers', TIMER_WORKERS)
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+        raise ValueError('The timer-workers of the runtime section need to be a positive integer.')
+
+    if runtime_cfg.get('mode', 'threads') not in RUNTIME_MODES:
+        raise ValueError(f'The mode of the runtime section needs to be one of {", ".join(RUNTIME_MODES)}.')
+
+    if runtime_cfg.get('timer-overrun', TIMER_OVERRUN) not in Timer.OVERRUN_POLICIES:
+        raise ValueError(f'The timer-overrun of the runtime section needs to be one of '
+                         f'{", ".join(Timer.OVERRUN_POLICIES)}.')
+
+    period = runtime_cfg.get('statistics-period', 60)
+    if not isinstance(period, (float, int)) or isinstance(period, bool) or period <= 0:
+        raise ValueError('The statistics-period of the runtime section needs to be a positive number of seconds.')
+
+
+def configure(config: dict):
+    """Applies the optional 'runtime' section of the config. Call it before any timer is started.
+
+    :param config: (mandatory, dict) the loaded config as dictionary
+    """
+
+    global TIMER_WORKERS, TIMER_OVERRUN
+    TIMER_WORKERS = config.get('runtime', dict()).get('timer-workers', TIMER_WORKERS)
+    TIMER_OVERRUN = config.get('runtime', dict()).get('timer-overrun', TIMER_OVERRUN)
+
+
+_scheduler = None
+_scheduler_lock = Lock()
+
+# all started timers, see get_timer_statistics()
+_timers = weakref.WeakSet()
+
+
+class PhasePlan():
+    """The PhasePlan staggers the periodic executions of the timers. All deadlines are on the grid reference + phase +
+    n * period of the timer. Each timer is assigned the phase in the middle of the largest gap between the executions
+    of the other timers, whose expected bus time (load) is reserved. Timers with other periods are projected onto the
+    period of the new timer, which is exact when one period is a multiple of the other."""
+
+    # max number of executions of a timer with a shorter period projected onto the period of the new timer
+    _MAX_PROJECTIONS = 64
+
+    instance = None
+
+    def __new__(cls):  # __new__ always a classmethod
+        if not PhasePlan.instance:
+            PhasePlan.instance = super().__new__(cls)
+            PhasePlan.instance._lock = Lock()
+            PhasePlan.instance._reference = time.monotonic_ns()
+            PhasePlan.instance._reservations = dict()
+        return PhasePlan.instance
+
+    def assign(self, timer, period: [float, int], load: [float, int]):
+        """Assigns the phase of the timer and returns its first deadline.
+
+        :param timer: (mandatory, Timer) the timer
+        :param period: (mandatory, float or int) the period of the timer in seconds
+        :param load: (mandatory, float or int) the expected bus time of an execution in seconds
+        :return: int, the first deadline after now in ns
+        """
+
+        period = round(period * 1e9)
+        load = round(load * 1e9)
+
+        with self._lock:
+            busy = list()
+            for other_period, other_phase, other_load in self._reservations.values():
+                for k in range(min(max(1, round(period / other_period)), self._MAX_PROJECTIONS)):
+                    busy.append(((other_phase + k * other_period) % period, other_load))
+            phase = PhasePlan._largest_gap(period, load, busy)
+            self._reservations[timer] = (period, phase, load)
+
+        # the first deadline of the grid which is not in the past
+        now = time.monotonic_ns()
+        return now + (self._reference + phase - now) % period
+
+    def release(self, timer):
+        """Releases the phase of the stopped timer.
+
+        :param timer: (mandatory, Timer) the timer
+        """
+
+        with self._lock:
+            self._reservations.pop(timer, None)
+
+    @staticmethod
+    def _largest_gap(period: int, load: int, busy: list):
+        """Returns the phase which centers the load in the largest gap between the busy (start, duration) intervals."""
+
+        if not busy:
+            return 0
+
+        busy.sort()
+        gap_start, gap_len = 0, -1
+        end = busy[0][0] + busy[0][1]
+        for start, duration in busy[1:] + [(busy[0][0] + period, 0)]:
+            if start - end > gap_len:
+                gap_start, gap_len = end, start - end
+            end = max(end, start + duration)
+
+        return (gap_start + max(gap_len - load, 0) // 2) % period
+
+
+def set_scheduler(scheduler):
+    """Replaces the scheduler of the timers. Call it before any timer is started.
+
+    :param scheduler: (mandatory, TimerScheduler or AsyncTimerScheduler) the scheduler
+    """
+
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+
+
+def get_scheduler():
+    """Returns the scheduler of the timers, a TimerScheduler is started by the first call if no scheduler was set.
+
+    :return: TimerScheduler or AsyncTimerScheduler
+    """
+
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TimerScheduler(workers=TIMER_WORKERS)
+            _scheduler.start()
+        return _scheduler
+
+
+class TimerScheduler(Thread):
+    """The TimerScheduler keeps the due times of all timers in a heap and hands the due timers to a pool of worker
+    threads, which execute their timer_fcn(). The executions of the same timer never overlap. A timer_fcn() blocking for
+    a long time (e.g. watering) occupies one worker for that time."""
+
+    def __init__(self, workers: int):
+        """Constructor
+
+        :param workers: (mandatory, int) number of worker threads
+        """
+
+        super().__init__(name='TimerScheduler', daemon=True)
+
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='TimerWorker')
+
+        # heap of (due time in ns, sequence number, timer, periodic)
+        self._condition = Condition()
+        self._heap = list()
+        self._sequence = itertools.count()
+
+    def schedule(self, timer, due: float, periodic: bool = True):
+        """Schedules the execution of the timer.
+
+        :param timer: (mandatory, Timer) the timer
+        :param due: (mandatory, int) time of the execution as returned by time.monotonic_ns()
+        :param periodic: (optional, bool) periodic execution, otherwise triggered (Default: True)
+        """
+
+        with self._condition:
+            heapq.heappush(self._heap, (due, next(self._sequence), timer, periodic))
+            self._condition.notify()
+
+    def run(self):
+        """The Thread method."""
+
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                sleep_time = self._heap[0][0] - time.monotonic_ns()
+                if sleep_time > 0:
+                    # new timers may be due earlier
+                    self._condition.wait(sleep_time / 1e9)
+                    continue
+                _, _, timer, periodic = heapq.heappop(self._heap)
+
+            if timer._timer_due(periodic):
+                try:
+                    self.executor.submit(timer._timer_work)
+                except RuntimeError:
+                    # the executor has been shut down at the exit of the interpreter
+                    return
+
+
+class AsyncTimerScheduler():
+    """The AsyncTimerScheduler executes the timers as tasks of an asyncio event loop. The timer_fcn_async() of a
+    timer is awaited on the loop, timer_fcn() is executed by a pool of worker threads because the drivers and the
+    database client are blocking. The executions of the same timer never overlap."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, workers: int):
+        """Constructor
+
+        :param loop: (mandatory, asyncio.AbstractEventLoop) the running event loop
+        :param workers: (mandatory, int) number of worker threads
+        """
+
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='TimerWorker')
+        self._loop = loop
+
+        # the loop only keeps weak references to its tasks
+        self._tasks = set()
+        self._closing = False
+
+    def schedule(self, timer, due: float, periodic: bool = True):
+        """Schedules the execution of the timer, may be called by any thread.
+
+        :param timer: (mandatory, Timer) the timer
+        :param due: (mandatory, int) time of the execution as returned by time.monotonic_ns()
+        :param periodic: (optional, bool) periodic execution, otherwise triggered (Default: True)
+        """
+
+        if self._closing:
+            return
+
+        try:
+            self._loop.call_soon_threadsafe(self._call_at, timer, due, periodic)
+        except RuntimeError:
+            # the loop has been closed
+            pass
+
+    def _call_at(self, timer, due: float, periodic: bool):
+        """Converts the due time to the clock of the loop."""
+
+        self._loop.call_at(self._loop.time() + max(due - time.monotonic_ns(), 0) / 1e9, self._due, timer, periodic)
+
+    def _due(self, timer, periodic: bool):
+        """Starts a task executing the timer unless the timer is running already."""
+
+        if self._closing:
+            return
+
+        if timer._timer_due(periodic):
+            task = self._loop.create_task(timer._timer_work_async(self.executor))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def shutdown(self):
+        """Cancels the running timers and waits for their tasks, call it on the loop before it is closed. No timer is
+        executed afterwards."""
+
+        self._closing = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+
+def get_timer_statistics():
+    """Returns the statistics of all started timers.
+
+    :return: dict with the names of the timers as keys and their statistics as values
+    """
+
+    return {timer.name: timer.get_statistics() for timer in list(_timers)}
+
+
+class Histogram():
+    """Histogram of durations with fixed buckets. Adding a value takes a binary search of the bucket bounds, nothing is
+    allocated. The percentiles are estimated by the upper bounds of the buckets."""
+
+    # upper bounds of the buckets in ms, the last bucket takes all longer durations
+    BOUNDS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+    def __init__(self):
+        self._bounds = [round(bound * 1e6) for bound in Histogram.BOUNDS]
+        self.counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, duration: int):
+        """Adds the duration.
+
+        :param duration: (mandatory, int) duration in ns
+        """
+
+        self.counts[bisect.bisect_left(self._bounds, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, fraction: float):
+        """Returns the upper bound of the bucket holding the percentile in ms, at most the max.
+
+        :param fraction: (mandatory, float) the percentile as fraction, e.g. 0.95
+        :return: float or None when the histogram is empty
+        """
+
+        if not self.count:
+            return None
+
+        cumulated = 0
+        for idx, count in enumerate(self.counts):
+            cumulated += count
+            if cumulated >= fraction * self.count:
+                return min(float(Histogram.BOUNDS[idx]), self.max / 1e6) if idx < len(Histogram.BOUNDS) \
+                    else self.max / 1e6
+
+    def get_statistics(self, prefix: str):
+        """Returns the statistics in ms as dictionary.
+
+        :param prefix: (mandatory, str) prefix of the keys, e.g. jitter
+        :return: dict
+        """
+
+        if not self.count:
+            return dict()
+
+        return {
+            f'{prefix}-mean': self.total / self.count / 1e6,
+            f'{prefix}-p50': self.percentile(0.5),
+            f'{prefix}-p95': self.percentile(0.95),
+            f'{prefix}-p99': self.percentile(0.99),
+            f'{prefix}-max': self.max / 1e6,
+        }
+
+
+async def run_blocking(fcn, *args):
+    """Executes the blocking function by a worker of the AsyncTimerScheduler and returns its result.
+
+    :param fcn: (mandatory, callable) the blocking function
+    :param args: the arguments of the function
+    """
+
+    return await asyncio.get_running_loop().run_in_executor(get_scheduler().executor, fcn, *args)
+
+
+class Timer():
+    """The Timer is used to perform periodic tasks. All timers share the threads of the TimerScheduler, the Timer keeps
+    the interface of a thread (start, join, name). In the asyncio runtime mode a timer implementing
+    timer_fcn_async() is awaited on the event loop instead of executing timer_fcn().
+
+    The executions are due at absolute deadlines of the monotonic clock (start + n * period), hence the timer does not
+    drift and is not affected by steps of the wall clock. When timer_fcn() took longer than a period, the missed
+    executions are handled by the overrun policy:
+        - skip: the missed executions are dropped, the next execution is due at the next deadline
+        - catch-up: the missed executions are executed one after another
+        - coalesce: the missed executions are executed once, the next execution is due at the next deadline
+    """
+
+    OVERRUN_POLICIES = ['skip', 'catch-up', 'coalesce']
+
+    # coroutine function executed instead of timer_fcn() by the AsyncTimerScheduler
+    timer_fcn_async = None
+
+    def __init__(self, name: str, period: [float, int], overrun: str = None, load: [float, int] = 0):
         """
 
         :param name: (mandatory, string) name of the timer
         :param period: (mandatory, float or int) timer period in seconds
+        :param overrun: (optional, str) one of OVERRUN_POLICIES (Default: runtime setting timer-overrun, skip)
+        :param load: (optional, float or int) expected bus time of an execution in seconds, see PhasePlan (Default: 0)
         """
 
-        # init Thread super class
-        super().__init__(name=name)
+        if overrun is not None and overrun not in Timer.OVERRUN_POLICIES:
+            raise ValueError(f'Unknown overrun policy {overrun}, use one of {", ".join(Timer.OVERRUN_POLICIES)}.')
+
+        self.name = name
+        self.overrun = overrun
+        self.load = load
 
         # some internal attributes
         self._timer_period = period
         self._timer_lock = Lock()
         self._timer_stop = Event()
-        self._timer_next_execution = time.time()
+        self._timer_done = Event()
+        self._timer_started = False
+        self._timer_running = False
+        self._timer_periodic_pending = False
+        self._timer_trigger_pending = False
+        self._timer_next_execution = time.monotonic_ns()
+
+        # statistics: delay of the periodic executions after their deadline, duration of timer_fcn() and overruns
+        self._timer_jitter = Histogram()
+        self._timer_duration = Histogram()
+        self._timer_overruns = 0
+        self._timer_missed = 0
+
         self._timer_logger = get_logger(f'Timer_{name}', level=logging.WARNING)
 
-    def run(self):
-        """The Thread method."""
+    def start(self):
+        """Starts the periodic execution of timer_fcn(), the first execution is due at the phase assigned by the
+        PhasePlan."""
+
+        with self._timer_lock:
+            if self._timer_started:
+                raise RuntimeError(f'The timer {self.name} can only be started once.')
+            self._timer_started = True
 
-        # store information about the next call
-        self._timer_next_execution = time.time()
+            # store information about the next call
+            self._timer_next_execution = PhasePlan().assign(self, self._timer_period, self.load)
+        _timers.add(self)
+        get_scheduler().schedule(self, self._timer_next_execution)
 
-        # run until the timer is marked to be destroyed
-        while not self._timer_stop.is_set():
-            try:
-                self.timer_fcn()
-            except Exception:
-                self._timer_logger.exception('Unknown exception while executing ''timer_fcn()''.')
-
-            # sleep until the next execution is due
-            with self._timer_lock: # acquire the lock because the timer period may have changed
-                self._timer_next_execution = self._timer_next_execution + self._timer_period
-            sleep_time = self._timer_next_execution - time.time()
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+    def stop(self):
+        """Stops the periodic execution immediately, a running timer_fcn() is finished. Use join() to wait for it."""
+
+        self._timer_stop.set()
+        PhasePlan().release(self)
+        with self._timer_lock:
+            started = self._timer_started
+
+        if started:
+            # wake the timer to retire it now instead of at the next deadline
+            get_scheduler().schedule(self, time.monotonic_ns(), periodic=False)
+        else:
+            self._timer_done.set()
+
+    def join(self, timeout: float = None):
+        """Waits until the timer has been stopped and its last execution has finished.
+
+        :param timeout: (optional, float) timeout in seconds (Default: None)
+        """
+
+        self._timer_done.wait(timeout)
+
+    def is_alive(self):
+        """Returns whether the timer has been started and not finished yet."""
+
+        return self._timer_started and not self._timer_done.is_set()
+
+    def _timer_due(self, periodic: bool):
+        """Marks the execution as pending, called by the TimerScheduler. Returns True when the timer needs a worker,
+        otherwise its running worker takes the pending execution."""
+
+        with self._timer_lock:
+            if periodic:
+                self._timer_periodic_pending = True
             else:
-                self._timer_next_execution = time.time() + self._timer_period
-                self._timer_logger.warning(f'Exceeded timer period by {abs(sleep_time)*1000:.2f}ms.')
+                self._timer_trigger_pending = True
+
+            if self._timer_running:
+                return False
+            self._timer_running = True
+            return True
+
+    def _timer_work(self):
+        """Executes the pending executions, called by a worker of the TimerScheduler."""
+
+        periodic = self._timer_take()
+        while periodic is not None:
+            self._timer_execute(self._timer_next_execution if periodic else None)
+            if periodic:
+                self._timer_reschedule()
+            periodic = self._timer_take()
+
+    async def _timer_work_async(self, executor):
+        """Executes the pending executions, a task of the AsyncTimerScheduler."""
+
+        try:
+            periodic = self._timer_take()
+            while periodic is not None:
+                deadline = self._timer_next_execution if periodic else None
+                if self.timer_fcn_async is None:
+                    await asyncio.get_running_loop().run_in_executor(executor, self._timer_execute, deadline)
+                else:
+                    await self._timer_execute_async(deadline)
+                if periodic:
+                    self._timer_reschedule()
+                periodic = self._timer_take()
+        except asyncio.CancelledError:
+            # the scheduler shuts down, the timer will not be executed anymore
+            self._timer_stop.set()
+            with self._timer_lock:
+                self._timer_running = False
+                self._timer_done.set()
+            raise
+
+    def _timer_take(self):
+        """Takes the pending executions. Returns whether a periodic execution was pending or None when there is
+        nothing left to execute."""
+
+        with self._timer_lock:
+            # run until the timer is marked to be destroyed
+            if self._timer_stop.is_set():
+                self._timer_running = False
+                self._timer_done.set()
+                return None
+
+            periodic = self._timer_periodic_pending
+            if not periodic and not self._timer_trigger_pending:
+                self._timer_running = False
+                return None
+            self._timer_periodic_pending = False
+            self._timer_trigger_pending = False
+            return periodic
+
+    def _timer_reschedule(self):
+        """Schedules the next periodic execution, triggered executions do not shift the schedule."""
+
+        if self._timer_stop.is_set():
+            return
+
+        with self._timer_lock:  # acquire the lock because the timer period may have changed
+            period = round(self._timer_period * 1e9)
+            self._timer_next_execution = self._timer_next_execution + period
+            now = time.monotonic_ns()
+            if self._timer_next_execution <= now:
+                missed = (now - self._timer_next_execution) // period + 1
+                self._timer_overruns += 1
+                self._timer_missed += missed
+                overrun = TIMER_OVERRUN if self.overrun is None else self.overrun
+                self._timer_logger.warning(f'Exceeded timer period by {(now - self._timer_next_execution) / 1e6:.2f}ms,'
+                                           f' {overrun} {missed} execution(s).')
+                if overrun == 'skip':
+                    self._timer_next_execution += missed * period
+                elif overrun == 'coalesce':
+                    self._timer_next_execution += (missed - 1) * period
+        get_scheduler().schedule(self, self._timer_next_execution)
+
+    def _timer_execute(self, deadline: int = None):
+        """Executes timer_fcn() and logs all exceptions.
+
+        :param deadline: (optional, int) deadline of a periodic execution in ns (Default: None, triggered)
+        """
+
+        start = time.monotonic_ns()
+        if deadline is not None:
+            self._timer_jitter.add(start - deadline)
+        try:
+            self.timer_fcn()
+        except Exception:
+            self._timer_logger.exception('Unknown exception while executing ''timer_fcn()''.')
+        self._timer_duration.add(time.monotonic_ns() - start)
+
+    async def _timer_execute_async(self, deadline: int = None):
+        """Awaits timer_fcn_async() and logs all exceptions.
+
+        :param deadline: (optional, int) deadline of a periodic execution in ns (Default: None, triggered)
+        """
+
+        start = time.monotonic_ns()
+        if deadline is not None:
+            self._timer_jitter.add(start - deadline)
+        try:
+            await self.timer_fcn_async()
+        except Exception:
+            self._timer_logger.exception('Unknown exception while executing ''timer_fcn_async()''.')
+        self._timer_duration.add(time.monotonic_ns() - start)
+
+    def get_statistics(self):
+        """Returns the statistics of the timer as dictionary: the number of executions, overruns and missed periods,
+        the jitter (delay of the periodic executions after their deadline) and the duration of the executions in ms.
+
+        :return: dict
+        """
+
+        with self._timer_lock:
+            stats = {
+                'executions': self._timer_duration.count,
+                'overruns': self._timer_overruns,
+                'missed': self._timer_missed,
+            }
+        stats.update(self._timer_jitter.get_statistics('jitter'))
+        stats.update(self._timer_duration.get_statistics('duration'))
+        return stats
+
+    def trigger(self):
+        """Executes timer_fcn() as soon as possible without waiting for the next period."""
+
+        if self._timer_started:
+            get_scheduler().schedule(self, time.monotonic_ns(), periodic=False)
 
     def set_period(self, period: [float, int]):
         """Change the current timer period to the wanted value.
@@ -84,7 +642,7 @@ class DbAttachedSensor(Timer):
         if sensor is None:
             raise ValueError('The input Sensor can not be of NoneType.')
 
-        super().__init__(name=name, period=period)
+        super().__init__(name=name, period=period, load=sensor.bus_time)
 
         # store the handle to the sensor
         self.sensor = sensor
@@ -133,37 +691,173 @@ class DbAttachedSensor(Timer):
         """
         pass
 
-def get_logger(name, level=logging.DEBUG, path=os.path.join(os.getcwd(), 'log')):
-    """
+class RateLimitFilter(logging.Filter):
+    """Passes one warning, error or exception per call site and interval. The number of the suppressed records is
+    appended to the next passed record of the call site."""
+
+    # interval in seconds
+    INTERVAL = 60
+
+    def __init__(self):
+        super().__init__()
+        self._lock = Lock()
+        # (passed time, suppressed records) by call site
+        self._sites = dict()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        site = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            passed, suppressed = self._sites.get(site, (None, 0))
+            if passed is not None and now - passed < self.INTERVAL:
+                self._sites[site] = (passed, suppressed + 1)
+                return False
+            self._sites[site] = (now, 0)
+
+        if suppressed:
+            record.msg = f'{record.getMessage()} ({suppressed} similar messages suppressed)'
+            record.args = None
+        return True
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Puts the records of all loggers into the queue of the LogListener. Only the message is merged with its
+    arguments, the formatting (e.g. of exceptions) is done by the listener thread."""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class BatchedFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Rotating file handler, which is flushed by the LogDispatcher once the queue is drained instead of after each
+    record."""
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class LogDispatcher(logging.Handler):
+    """Handler of the LogListener: writes each record to the console and to the file of its logger. The files are
+    flushed when the queue is empty, hence bursts of records are written at once."""
+
+    def __init__(self, log_queue):
+        super().__init__()
+        self._queue = log_queue
+        self._stream_handler = logging.StreamHandler()
+        self._file_handlers = dict()
+        self._files_by_logger = dict()
+        self._dirty = set()
+
+        # create formatter
+        format_str = '%(asctime)s.%(msecs)03d - %(levelname)-8s - %(message)s'
+        date_format = '%Y-%d-%m %H:%M:%S'
+        self._stream_handler.setFormatter(logging.Formatter(format_str, date_format))
+
+    def add_logger(self, name: str, file: str):
+        """Writes the records of the logger to the file, all loggers of the same file share one handle.
+
+        :param name: (mandatory, str) name of the logger
+        :param file: (mandatory, str) path of the log file
+        """
+
+        with self.lock:
+            if file not in self._file_handlers:
+                # time rotating file handler
+                self._file_handlers[file] = BatchedFileHandler(file, when="midnight", interval=1, backupCount=7)
+            self._files_by_logger[name] = self._file_handlers[file]
+
+    def emit(self, record):
+        self._stream_handler.handle(record)
+
+        file_handler = self._files_by_logger.get(record.name)
+        if file_handler is not None:
+            file_handler.handle(record)
+            self._dirty.add(file_handler)
+
+        if self._queue.empty():
+            self.flush()
+
+    def flush(self):
+        """Flushes the files written since the last flush."""
+
+        for file_handler in self._dirty:
+            file_handler.flush_batch()
+        self._dirty.clear()
+
+
+# the records of all loggers are written by one listener thread
+_log_queue = queue.SimpleQueue()
+_log_handler = LogQueueHandler(_log_queue)
+_log_handler.addFilter(RateLimitFilter())
+_log_dispatcher = LogDispatcher(_log_queue)
+_log_listener = None
+# (logger, path of its log files) by name
+_loggers = dict()
+_loggers_lock = Lock()
+
+
+def stop_logging():
+    """Writes the queued records and stops the listener thread."""
+
+    global _log_listener
+    with _loggers_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+            _log_listener = None
+            _log_dispatcher.flush()
+
+
+# directory of the log files, see get_logger()
+LOG_PATH = os.path.join(os.getcwd(), 'log')
+
+
+def get_logger(name, level=logging.DEBUG, path=None):
+    """Returns the logger of the name. The records of all loggers are passed by one queue to a background thread, which
+    writes them to the console and to the file of the logger, and flushes the files once the queue is drained. Repeated
+    warnings and exceptions of a call site are rate limited (see RateLimitFilter). The level and path only apply to a
+    new logger, a warning is logged when an existing logger is requested with different ones.
 
     :param name: (mandatory, string) name of the logger
-    :param level: (optional, default: logging.DEBUG) the logging level
-    :param path: (optional, default: './log/') path to the log files
+    :param level: (optional, default: logging.DEBUG) the logging level of a new logger
+    :param path: (optional, default: LOG_PATH, './log/') path to the log files
     :return: logging.Logger
     """
 
-    the_logger = logging.Logger(name=name, level=level)
+    global _log_listener
+
+    path = os.path.abspath(LOG_PATH if path is None else path)
+
+    with _loggers_lock:
+        if name in _loggers:
+            the_logger, the_path = _loggers[name]
+            if the_logger.level != level or the_path != path:
+                the_logger.warning(f'Logger {name} is already configured with level '
+                                   f'{logging.getLevelName(the_logger.level)} and path {the_path}, ignoring level '
+                                   f'{logging.getLevelName(level)} and path {path}.')
+            return the_logger
 
-    # check path
-    if not os.path.isdir(path):
-        os.makedirs(path)
+        # check path
+        if not os.path.isdir(path):
+            os.makedirs(path)
 
-    # create formatter
-    format_str = '%(asctime)s.%(msecs)03d - %(levelname)-8s - %(message)s'
-    date_format = '%Y-%d-%m %H:%M:%S'
-    formatter = logging.Formatter(format_str, date_format)
+        _log_dispatcher.add_logger(name, os.path.join(path, f'{name}.log'))
 
-    # add stream handler
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    the_logger.addHandler(stream_handler)
+        if _log_listener is None:
+            _log_listener = logging.handlers.QueueListener(_log_queue, _log_dispatcher)
+            _log_listener.start()
+            atexit.register(stop_logging)
 
-    # time rotating file handler
-    file_handler = logging.handlers.TimedRotatingFileHandler(os.path.join(path, f'{name}.log'),
-                                       when="midnight",
-                                       interval=1,
-                                       backupCount=7)
-    the_logger.addHandler(file_handler)
+        the_logger = logging.Logger(name=name, level=level)
+        the_logger.addHandler(_log_handler)
+        _loggers[name] = (the_logger, path)
 
     return the_logger
 
@@ -177,3 +871,138 @@ def convert_to_seconds(s: str):
     """
 
     return float(s[:-1]) * seconds_per_unit[s[-1]]
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+
+    # the log files of the benchmarks are not kept
+    LOG_PATH = tempfile.mkdtemp(prefix='carlos-log-')
+    import threading
+
+    # threads and resident memory of timers sampling every 100ms, each timer_fcn() takes 1ms
+    def rss():
+        with open('/proc/self/status', 'r') as status:
+            for line in status:
+                if line.startswith('VmRSS'):
+                    return int(line.split()[1])
+
+    class Sampler(Timer):
+        def timer_fcn(self):
+            time.sleep(0.001)
+
+    class ThreadSampler(Thread):
+        """A thread per timer like the Timer before the TimerScheduler."""
+
+        def __init__(self, name, period):
+            super().__init__(name=name, daemon=True)
+            self.period = period
+            self._timer_logger = get_logger(f'Timer_{name}', level=logging.WARNING)
+
+        def run(self):
+            while True:
+                time.sleep(0.001)
+                time.sleep(self.period)
+
+    class AsyncSampler(Timer):
+        async def timer_fcn_async(self):
+            await asyncio.sleep(0.001)
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'scheduler'
+    cls = {'threads': ThreadSampler, 'asyncio': AsyncSampler}.get(mode, Sampler)
+    async def main():
+        scheduler = AsyncTimerScheduler(asyncio.get_running_loop(), workers=TIMER_WORKERS)
+        set_scheduler(scheduler)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, measure)
+        finally:
+            await scheduler.shutdown()
+
+    def measure():
+        print(f'### {cls.__name__}')
+        baseline = rss()
+        timers = list()
+        for cnt in [10, 50, 100, 200]:
+            while len(timers) < cnt:
+                timers.append(cls(name=f'sampler-{len(timers)}', period=0.1))
+                timers[-1].start()
+            time.sleep(1)
+            print(f'{cnt:4d} timers : {threading.active_count():4d} threads, {(rss() - baseline) / 1024:6.1f}MB rss')
+
+    # peak wait for the bus of 8 timers sampling every 100ms, each execution occupies the bus for 5ms
+    def phases():
+        bus = Lock()
+
+        class BusSampler(Timer):
+            def __init__(self, name):
+                super().__init__(name=name, period=0.1, load=0.005)
+                self.wait_max = 0
+
+            def timer_fcn(self):
+                t0 = time.monotonic()
+                with bus:
+                    self.wait_max = max(self.wait_max, time.monotonic() - t0)
+                    time.sleep(0.005)
+
+        assign = PhasePlan.assign
+        for title in ['same phase', 'phase plan']:
+            if title == 'same phase':
+                # all timers start at once like before the PhasePlan
+                PhasePlan.assign = lambda plan, timer, period, load: time.monotonic_ns()
+            else:
+                PhasePlan.assign = assign
+            timers = [BusSampler(name=f'bus-sampler-{i}') for i in range(8)]
+            for timer in timers:
+                timer.start()
+            time.sleep(2)
+            for timer in timers:
+                timer.stop()
+            print(f'{title.ljust(10)} : {max(timer.wait_max for timer in timers) * 1000:.1f}ms peak wait for the bus')
+
+    # time the sampling thread spends per logged record
+    def logs():
+        calls = 10000
+        direct = logging.Logger(name='direct', level=logging.DEBUG)
+        direct.addHandler(logging.handlers.TimedRotatingFileHandler(os.path.join(LOG_PATH, 'direct.log'),
+                                                                    when="midnight", interval=1, backupCount=7))
+        queued = get_logger('queued')
+        # keep the console quiet
+        _log_dispatcher._stream_handler.setStream(open(os.devnull, 'w'))
+
+        for title, logger in [('direct', direct), ('queued', queued)]:
+            durations = list()
+            for i in range(calls):
+                t0 = time.perf_counter()
+                logger.debug('sample %d of %s', i, title)
+                durations.append(time.perf_counter() - t0)
+            durations.sort()
+            print(f'{title} : {sum(durations) / calls * 1e6:.1f}us mean, {durations[int(0.99 * calls)] * 1e6:.1f}us p99,'
+                  f' {durations[-1] * 1e6:.0f}us max per record')
+
+        t0 = time.perf_counter()
+        for i in range(calls):
+            try:
+                raise IOError('Error accessing 0x48')
+            except IOError:
+                queued.exception('Unknown error while gathering measurement data.')
+        print(f'repeated exception : {(time.perf_counter() - t0) / calls * 1e6:.1f}us per record (rate limited)')
+
+    if mode == 'asyncio':
+        asyncio.run(main())
+    elif mode == 'logging':
+        logs()
+    elif mode == 'phases':
+        TIMER_WORKERS = 8
+        phases()
+    else:
+        measure()
+
+    # overhead of the statistics per execution
+    import timeit
+    histogram = Histogram()
+    calls = 100000
+    overhead = timeit.timeit(lambda: histogram.add(1234567), number=calls) / calls
+    print(f'histogram : {overhead * 1e9:.0f}ns per value')
+    for name, stats in list(get_timer_statistics().items())[:1]:
+        print(f'{name} : ' + ', '.join(f'{key} {value:.2f}' for key, value in stats.items()))
@@ -2,12 +2,15 @@
 
 import time
 import os
+import asyncio
 import yaml
 import ifcInflux
+import Auxiliary
 from Environment import Environment
 from Irrigation import Irrigation
 from Pump import PumpControl
-from sensors.i2c import i2cLock
+from sensors import gpio
+from sensors import i2c
 import sensors.auxiliary
 
 SENSOR_PERIOD = sensors.auxiliary.SENSOR_PERIOD
@@ -31,14 +34,12 @@ class CarlosOnEdge():
             :param config_file: (optional, str) path to the config file. Default is: config.yaml
             """
 
-            # acquire the lock once
-            self._i2c_lock = i2cLock()
-
             # prepare attributes
             self.config = dict()
             self.environment = None
             self.irrigation_loops = None
             self.pump_controller = None
+            self.runtime_statistics = None
 
             # config ###############################
 
@@ -57,6 +58,15 @@ class CarlosOnEdge():
             # validate the config
             CarlosOnEdge.validate_config(self.config)
 
+            # select the gpio backend before any pin is used
+            gpio.set_backend(gpio.get_backend(self.config))
+
+            # enable the i2c scheduler before any device is created
+            i2c.configure(self.config)
+
+            # size the worker pool of the timers before any timer is started
+            Auxiliary.configure(self.config)
+
             # create classes ########################
             self.environment = Environment(self.config)
 
@@ -65,6 +75,12 @@ class CarlosOnEdge():
 
             self.irrigation_loops = Irrigation(self.config, self.pump_controller)
 
+            # optional statistics of the timers
+            runtime_cfg = self.config.get('runtime', dict())
+            if 'statistics-period' in runtime_cfg:
+                self.runtime_statistics = ifcInflux.RuntimeStatistics(period=runtime_cfg['statistics-period'],
+                                                                      dbclient=ifcInflux.get_client(self.config))
+
         def start(self):
             """Vamos! Let carlos start its work.
 
@@ -76,6 +92,23 @@ class CarlosOnEdge():
             self.environment.start()
             self.irrigation_loops.start()
             self.pump_controller.start()
+            if self.runtime_statistics is not None:
+                self.runtime_statistics.start()
+
+        async def run_async(self):
+            """Vamos! Runs carlos in the asyncio runtime mode: the timers are tasks of the running event loop and
+            blocking work is done by the workers of the AsyncTimerScheduler. Returns when carlos has done it's job."""
+
+            loop = asyncio.get_running_loop()
+            scheduler = Auxiliary.AsyncTimerScheduler(loop, workers=Auxiliary.TIMER_WORKERS)
+            Auxiliary.set_scheduler(scheduler)
+
+            try:
+                # starting the sensors takes a while, the timers are scheduled on the loop meanwhile
+                await loop.run_in_executor(None, self.start)
+                await loop.run_in_executor(None, self.wait)
+            finally:
+                await scheduler.shutdown()
 
         def stop(self):
             """Tops the data acquisition, moisture control and pump controls"""
@@ -83,6 +116,8 @@ class CarlosOnEdge():
             self.environment.stop()
             self.irrigation_loops.stop()
             self.pump_controller.stop()
+            if self.runtime_statistics is not None:
+                self.runtime_statistics.stop()
 
         def wait(self):
             """Wait until carlos has done it's job.
@@ -92,6 +127,8 @@ class CarlosOnEdge():
             self.environment.join()
             self.irrigation_loops.join()
             self.pump_controller.join()
+            if self.runtime_statistics is not None:
+                self.runtime_statistics.join()
 
         def read_config(self):
             """Reads the config from the configured file.
@@ -114,6 +151,15 @@ class CarlosOnEdge():
         # influxdb
         ifcInflux.validate_config(config)
 
+        # gpio
+        gpio.validate_config(config)
+
+        # i2c
+        i2c.validate_config(config)
+
+        # runtime
+        Auxiliary.validate_config(config)
+
         # environment
         Environment.validate_config(config)
 
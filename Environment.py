@@ -1,6 +1,5 @@
 #!/usr/bin/python
 
-import time
 from sensors.light import validate_config as validate_light_config
 from sensors.light import get_sensor as get_light_sensor
 from sensors.temperature import validate_config as validate_temp_config
@@ -46,8 +45,8 @@ class Environment(object):
     def start(self):
         """Starts the data acquisition of the environment."""
 
+        # the sensors are staggered by their phases, see Auxiliary.PhasePlan
         for sensor in self.sensors:
-            time.sleep(1)
             sensor.start()
 
     def stop(self):
@@ -1,10 +1,15 @@
 #!/usr/bin/python
 
 import time
+import logging
+from datetime import datetime, timezone
+from threading import Event, Thread
 
-from Auxiliary import Timer, convert_to_seconds
+from Auxiliary import Timer, convert_to_seconds, get_logger
 from Pump import Valve
 from ifcInflux import InfluxAttachedSensor, get_client
+from sensors import gpio
+from sensors.ad_converter import ADConverter, ADSampler, ADScanner
 from sensors.auxiliary import SENSOR_PERIOD
 from sensors.moisture import CapacitiveSoilMoistureSensor
 
@@ -23,32 +28,67 @@ class Irrigation():
         self.loops = dict()
         self.pump_controller = pump_controller
 
+        # the moisture sensors grouped by the i2c address of their a/d converter
+        self.moisture_sensor_groups = dict()
+        ad_cfgs = config.get('ad-converters', dict())
+
+        # the comparator alerts by the i2c address of their a/d converter
+        self.moisture_alerts = dict()
+
         irrs_cfg = config['irrigation-loops']
 
         for irr_cfg in irrs_cfg:
             name = list(irr_cfg.keys())[0]
             loop_cfg = irr_cfg[name]
-            self.loops[name] = IrrigationLoop(name=name, config=loop_cfg, main_config=config,
-                                              pump_controller=pump_controller)
+            loop = IrrigationLoop(name=name, config=loop_cfg, main_config=config, pump_controller=pump_controller)
+            self.loops[name] = loop
+
+            address = loop_cfg['moisture-sensor']['i2c-address']
+            if address not in self.moisture_sensor_groups:
+                self.moisture_sensor_groups[address] = MoistureSensorGroup(address=address, period=SENSOR_PERIOD,
+                                                                           config=ad_cfgs.get(address, dict()))
+            self.moisture_sensor_groups[address].add(loop.moisture_sensor)
+
+            if ad_cfgs.get(address, dict()).get('mode', 'single-shot') == 'comparator':
+                loop.moisture_alert = MoistureAlert(irrigation_loop=loop, config=ad_cfgs[address])
+                self.moisture_alerts[address] = loop.moisture_alert
 
     def start(self):
-        """Starts the data acquisition of the environment."""
+        """Starts the comparator alerts, the data acquisition of the moisture sensors and the irrigation loops."""
+
+        for alert in self.moisture_alerts.values():
+            alert.start()
+
+        for group in self.moisture_sensor_groups.values():
+            group.start()
 
         for loop in self.loops.values():
             loop.start()
 
     def stop(self):
-        """Stops the data acquisition of the environment."""
+        """Stops the irrigation loops, the data acquisition of the moisture sensors and the comparator alerts."""
 
         for loop in self.loops.values():
             loop.stop()
 
+        for group in self.moisture_sensor_groups.values():
+            group.stop()
+
+        for alert in self.moisture_alerts.values():
+            alert.stop()
+
     def join(self):
-        """Wait for all sensors to stop the data acquisition."""
+        """Wait for all loops and sensors to stop."""
 
         for loop in self.loops.values():
             loop.join()
 
+        for group in self.moisture_sensor_groups.values():
+            group.join()
+
+        for alert in self.moisture_alerts.values():
+            alert.join()
+
     @staticmethod
     def validate_config(config: dict):
         """Checks whether the config is valid. If the config does not contain valid information, a exception will be
@@ -67,6 +107,19 @@ class Irrigation():
         for irr_cfg in irrs_cfg:
             IrrigationLoop.validate_config(irr_cfg)
 
+        # optional settings of the a/d converters
+        for address, ad_cfg in config.get('ad-converters', dict()).items():
+            ADConverter.validate_config(address)
+            ADSampler.validate_config(ad_cfg)
+
+            # the comparator watches a single channel
+            if ad_cfg.get('mode', 'single-shot') == 'comparator':
+                sensors_cnt = sum(list(irr_cfg.values())[0]['moisture-sensor']['i2c-address'] == address
+                                  for irr_cfg in irrs_cfg)
+                if sensors_cnt != 1:
+                    raise ValueError(f'The comparator mode of the a/d converter 0x{address:02X} requires exactly one '
+                                     f'moisture sensor, but {sensors_cnt} are connected.')
+
 
 class IrrigationLoop(Timer):
 
@@ -90,7 +143,7 @@ class IrrigationLoop(Timer):
         # the db client read data
         self.db_df_client = get_client(main_config)
 
-        # the moisture sensor
+        # the moisture sensor (the data acquisition is done by the MoistureSensorGroup of its a/d converter)
         self.moisture_sensor = InfluxAttachedSensor(name=f'{name}-moisture-sensor', period=SENSOR_PERIOD,
                                                     measurement=self.measurement,
                                                     sensor=CapacitiveSoilMoistureSensor.from_config(
@@ -114,22 +167,8 @@ class IrrigationLoop(Timer):
         # the watering rules
         self.watering_rule = WateringRule(irrigation_loop=self, config=config['watering-rule'])
 
-    def start(self):
-        """Starts the data acquisition of the irrigation loop."""
-
-        self.moisture_sensor.start()
-
-        super().start()
-
-    def stop(self):
-        """Stops the data acquisition of the irrigation loop."""
-
-        self.moisture_sensor.stop()
-
-    def join(self):
-        """Wait for all sensors to stop the data acquisition."""
-
-        self.moisture_sensor.join()
+        # the comparator alert of the moisture sensor (optional, set by Irrigation)
+        self.moisture_alert = None
 
     def timer_fcn(self):
         """Check the watering rule."""
@@ -138,6 +177,10 @@ class IrrigationLoop(Timer):
         if time.time() - self.last_pump_actv < self.watering_rule.interval:
             return
 
+        # with a comparator alert the watering rule only needs to be checked while the moisture level is too low
+        if self.moisture_alert is not None and not self.moisture_alert.asserted:
+            return
+
         # get the query string
         field = f'{self.moisture_sensor.name}-percentage'
         query = self.watering_rule.build_query(measurement=self.measurement, field=field)
@@ -152,8 +195,10 @@ class IrrigationLoop(Timer):
         # check if all data points are smaller as the wanted threshold
         if self.watering_rule.check_moisture(data_list):
             # create a new pump job and submit it afterwards
+            urgency = self.watering_rule.get_urgency(moisture_data=data_list, last_watering=self.last_pump_actv)
             if self.pump_controller.add_job(pump=self.pump_name, valve=self.valve,
-                                            duration=self.watering_rule.time):
+                                            duration=self.watering_rule.time, loop=self.name, urgency=urgency,
+                                            deadline=self.watering_rule.deadline):
                 # set the time stamp of the last successful pump job submission
                 self.last_pump_actv = time.time()
 
@@ -190,8 +235,189 @@ class IrrigationLoop(Timer):
         WateringRule.validate_config(loop_cfg['watering-rule'])
 
 
+class MoistureSensorGroup(Timer):
+    """The MoistureSensorGroup reads all moisture sensors connected to the same ADS1x15 in one sweep and hands each
+    reading to the sensor of its irrigation loop. All readings of a sweep share the same time stamp. In continuous mode
+    an ADSampler converts the channels in the background and the sweep only takes the buffered values. In comparator
+    mode the single channel is converted continuously and the sweep takes the last conversion result. Loops sharing a
+    moisture sensor get the same readings, the channel is converted with the settings of the first loop's sensor."""
+
+    def __init__(self, address: int, period: [float, int], config: dict = None):
+        """
+
+        :param address: (mandatory, hex) the i2c address of the ADS1x15 a/d converter
+        :param period: (mandatory, float or int) the wanted data acquisition period in seconds
+        :param config: (optional, dict) the config of the a/d converter
+        """
+
+        super().__init__(name=f'moisture-sensors-0x{address:02X}', period=period)
+
+        self.address = address
+        self.logger = get_logger(self.name, level=logging.DEBUG)
+
+        # the InfluxAttachedSensors of each channel, the first one converts the channel
+        self.sensors = dict()
+        self._scanner = None
+
+        self._config = dict() if config is None else config
+        self._burst = False
+        self._sampler = None
+
+    def add(self, sensor: InfluxAttachedSensor):
+        """Adds the moisture sensor to the group.
+
+        :param sensor: (mandatory, InfluxAttachedSensor) sensor attached to a CapacitiveSoilMoistureSensor
+        """
+
+        self.sensors.setdefault(sensor.sensor.channel, list()).append(sensor)
+        self._burst |= self.sensors[sensor.sensor.channel][0].sensor.samples > 1
+
+        # each channel is converted with the (tuned) settings of its sensor
+        channels = [(sensors[0].sensor.adconv, channel, sensors[0].sensor.pga, sensors[0].sensor.sps)
+                    for channel, sensors in self.sensors.items()]
+        self._scanner = ADScanner(channels)
+
+    def start(self):
+        """Starts the sampler of the a/d converter in continuous mode and the data acquisition."""
+
+        if self._config.get('mode', 'single-shot') == 'continuous':
+            some_sensor = next(iter(self.sensors.values()))[0].sensor
+            # the data rate is a setting of the a/d converter, the gain is taken from each sensor
+            self._sampler = ADSampler.from_config(some_sensor.adconv, list(self.sensors.keys()),
+                                                  pga={channel: s[0].sensor.pga for channel, s in self.sensors.items()},
+                                                  config=self._config)
+            self._sampler.start()
+        elif self._config.get('mode', 'single-shot') == 'single-shot':
+            # the sweep converts all channels one after another
+            self.load = sum(sensors[0].sensor.bus_time for sensors in self.sensors.values())
+
+        super().start()
+
+    def stop(self):
+        """Stops the data acquisition and the sampler of the a/d converter."""
+
+        if self._sampler is not None:
+            self._sampler.stop()
+        super().stop()
+
+    def timer_fcn(self):
+        """Reads all channels and writes the data of each sensor to the database."""
+
+        try:
+            if self._config.get('mode', 'single-shot') == 'comparator':
+                # the comparator keeps converting the channel, see MoistureAlert
+                volts = {(self.address, channel): sensors[0].sensor.adconv.getLastConversionResults()
+                         for channel, sensors in self.sensors.items()}
+            elif self._sampler is None and not self._burst:
+                volts = self._scanner.scan()
+            else:
+                volts = None
+
+            # the data of each sensor
+            readings = list()
+            for channel, sensors in self.sensors.items():
+                if volts is None:
+                    # the sensors take the values buffered by the sampler or convert a burst each
+                    data = sensors[0].sensor.measure()
+                else:
+                    millivolts = volts[(self.address, channel)]
+                    # convert from mV to V, conversions lost to bus errors are None
+                    data = sensors[0].sensor.convert(None if millivolts is None else millivolts / 1000)
+                readings.extend((sensor, data) for sensor in sensors)
+        except Exception:
+            self.logger.exception(f'{self.name}: Unknown error while reading the a/d converter.')
+            return None
+        timestamp = datetime.now(timezone.utc)
+
+        for sensor, data in readings:
+            try:
+                sensor.add_measurement(data, timestamp=timestamp)
+            except Exception:
+                sensor.logger.exception(f'{sensor.name}: Unknown error while gathering measurement data.')
+                continue
+
+            try:
+                sensor.write_db()
+            except Exception:
+                sensor.logger.exception(f'{sensor.name}: Unknown error while writing measurement data to database.')
+
+
+class MoistureAlert(Thread):
+    """The MoistureAlert lets the comparator of the ADS1x15 watch the moisture sensor of an irrigation loop. The
+    comparator asserts the ALERT/RDY pin as soon as the moisture level falls below the low level of the watering rule
+    and releases it once the level has recovered. The falling edge wakes the irrigation loop, which only checks the
+    watering rule while the alert is asserted."""
+
+    # the moisture level in % above the low level at which the alert is released
+    _HYSTERESIS = 2
+
+    # the number of consecutive conversions beyond the threshold which assert the alert (1, 2 or 4)
+    _READINGS = 4
+
+    def __init__(self, irrigation_loop: IrrigationLoop, config: dict):
+        """
+
+        :param irrigation_loop: (mandatory, IrrigationLoop) the irrigation loop to wake
+        :param config: (mandatory, dict) the config of the a/d converter
+        """
+
+        super().__init__(name=f'{irrigation_loop.name}-moisture-alert', daemon=True)
+
+        self.irrigation_loop = irrigation_loop
+        self.pin = config['alert-gpio']
+        self.sps = config.get('sps', 8)
+        self.logger = get_logger(self.name, level=logging.DEBUG)
+
+        self._stop_event = Event()
+
+    @property
+    def asserted(self):
+        """True while the moisture level is below the low level of the watering rule."""
+        return gpio.input(self.pin) == gpio.LOW
+
+    def start(self):
+        """Programs the comparator and starts waiting for alerts."""
+
+        sensor = self.irrigation_loop.moisture_sensor.sensor
+        low_level = self.irrigation_loop.watering_rule.trigger_low_level
+
+        # dry soil results in high voltages, the moisture levels are stored in % 0-100
+        threshold_high = 1000 * sensor.convertMoistureToVoltage(low_level / 100)
+        threshold_low = 1000 * sensor.convertMoistureToVoltage(min(low_level + self._HYSTERESIS, 100) / 100)
+
+        # ALERT/RDY is an open drain output
+        gpio.setup(self.pin, gpio.IN, pull=gpio.PUD_UP)
+        sensor.adconv.startSingleEndedComparator(sensor.channel, threshold_high, threshold_low, pga=sensor.pga,
+                                                 sps=self.sps, activeLow=True, traditionalMode=True, latching=False,
+                                                 numReadings=self._READINGS)
+
+        super().start()
+
+    def stop(self):
+        """Stops waiting for alerts."""
+
+        self._stop_event.set()
+
+    def run(self):
+        """The Thread method."""
+
+        # the level may have been too low already when the comparator was programmed
+        if self.asserted:
+            self.irrigation_loop.trigger()
+
+        while not self._stop_event.is_set():
+            # the timeout only limits the time until stop() takes effect
+            if gpio.capture_edges(self.pin, count=1, timeout=1, edge=gpio.FALLING, pull=gpio.PUD_UP):
+                self.logger.info(f'{self.name}: Moisture level fell below '
+                                 f'{self.irrigation_loop.watering_rule.trigger_low_level}%.')
+                self.irrigation_loop.trigger()
+
+
 class WateringRule():
 
+    # the max contribution of the time since the last watering to the urgency in hours
+    _MAX_URGENCY_HOURS = 24
+
     def __init__(self, irrigation_loop: IrrigationLoop, config: dict):
         """
 
@@ -208,6 +434,8 @@ class WateringRule():
         self.time = convert_to_seconds(config['time'])
         # the minimal time between two consecutive pump activations in seconds
         self.interval = convert_to_seconds(config['interval'])
+        # the time in seconds a submitted pump job may wait for its execution (defaults to the interval)
+        self.deadline = convert_to_seconds(config.get('deadline', config['interval']))
 
     def build_query(self, measurement: str, field: str) -> str:
         """The Query string which can be used to check the watering rule.
@@ -240,6 +468,24 @@ class WateringRule():
 
         return limit_violated
 
+    def get_urgency(self, moisture_data: list, last_watering: [float, int]):
+        """Rates how urgent the irrigation loop requires water. The urgency is the sum of the moisture level deficit
+        in % below the trigger low level and the hours passed since the last watering (limited to one day).
+
+        :param moisture_data: (mandatory, list) the moisture levels
+        :param last_watering: (mandatory, float or int) time stamp of the last pump activation
+        :return float: the urgency
+        """
+
+        # moisture level is stored in % 0-1 and the low level is stored in % 0-100
+        deficit = 0
+        if moisture_data:
+            deficit = max(self.trigger_low_level - 100 * sum(moisture_data) / len(moisture_data), 0)
+
+        hours = min((time.time() - last_watering) / 3600, self._MAX_URGENCY_HOURS)
+
+        return deficit + hours
+
     @staticmethod
     def validate_config(config: dict):
         """Checks whether the config is valid. If the config does not contain valid information, a exception will be
@@ -253,6 +499,7 @@ class WateringRule():
                 time: 30m
               time: 3s
               interval: 15m
+              deadline: 10m  # optional
 
         :param config: (mandatory, dict) the loaded config as dictionary
         :raises KeyError: Mandatory field is missing
@@ -295,3 +542,9 @@ class WateringRule():
         except (KeyError, ValueError):
             raise ValueError(f"Configured interval '{config['interval']}' of the watering-rule could not be "
                              f"interpreted.")
+        if 'deadline' in config:
+            try:
+                convert_to_seconds(config['deadline'])
+            except (KeyError, ValueError):
+                raise ValueError(f"Configured deadline '{config['deadline']}' of the watering-rule could not be "
+                                 f"interpreted.")
@@ -1,11 +1,16 @@
 #!/usr/bin/python
-import RPi.GPIO as GPIO
 import time
+import asyncio
+import logging
+import heapq
 import datetime
+import itertools
+from collections import deque
 from threading import Lock
 
-from Auxiliary import Timer
+from Auxiliary import Timer, get_logger, run_blocking
 from ifcInflux import InfluxAttachedSensor, get_client
+from sensors import gpio
 from sensors.auxiliary import SmartSensor
 from sensors.distance import SeeedUltraSonicRanger
 
@@ -17,6 +22,9 @@ class PumpControl():
 
     class __PumpControl(Timer):
 
+        # min time in seconds between two writes of the queue statistics
+        STATISTICS_INTERVAL = 60
+
         def __init__(self, config: dict):
             """
 
@@ -26,11 +34,16 @@ class PumpControl():
             # set the period to one to make sure to execute the pump jobs as fast as possible
             super().__init__(name='PumpControl', period=1)
 
-            # the lock to sync the threads
-            self._job_lock = Lock()
+            self.logger = get_logger(self.name, level=logging.DEBUG)
+
+            # the queue of pumps jobs which need to be carried out (most urgent first)
+            self.pump_jobs = PumpJobQueue()
 
-            # the list of pumps jobs which need to be carried out
-            self.pump_jobs = list()
+            # the queue statistics are written to the db when they changed
+            self.measurement = 'pump-control'
+            self._dbclient = get_client(config)
+            self._last_statistics = None
+            self._last_statistics_time = None
 
             # dictionary of available pumps
             self.pumps = dict()
@@ -38,12 +51,18 @@ class PumpControl():
                 name = list(pump.keys())[0]
                 self.pumps[name] = Pump(name=name, config=pump[name], main_config=config)
 
-        def add_job(self, pump: str, valve: int, duration: [float, int]):
+        def add_job(self, pump: str, valve: int, duration: [float, int], loop: str = None, urgency: float = 0,
+                    deadline: [float, int] = None):
             """
 
             :param pump: (mandatory, str) name of the pump
             :param valve: (mandatory, int) gpio pin of the valve
             :param duration: (mandatory, float or int) duration where the pump shall be active in seconds
+            :param loop: (optional, str) name of the irrigation loop submitting the job. Only one job per loop will
+            be queued at the same time.
+            :param urgency: (optional, float) the higher the urgency the earlier the job will be executed
+            :param deadline: (optional, float or int) time in seconds after which the job is dropped when it has not
+            been executed yet
             :return: true when the job could be created successfully
             """
 
@@ -52,16 +71,13 @@ class PumpControl():
 
             # create new pump job
             try:
-                pj = PumpJob(pump=self.pumps[pump], valve=valve, duration=duration)
+                pj = PumpJob(pump=self.pumps[pump], valve=valve, duration=duration, loop=loop, urgency=urgency,
+                             deadline=deadline)
             except Exception:
                 return False
 
-            # add the job to the list of jobs
-            with self._job_lock:
-                self.pump_jobs.append(pj)
-                return True
-
-            return False
+            # add the job to the queue of jobs
+            return self.pump_jobs.push(pj)
 
         def start(self):
             """Starts the cyclic work of each pump."""
@@ -74,11 +90,13 @@ class PumpControl():
             super().start()
 
         def stop(self):
-            """Stops the cyclic work of each pump."""
+            """Stops the cyclic work of each pump and the execution of the pump jobs."""
 
             for pump in self.pumps.values():
                 pump.stop()
 
+            super().stop()
+
         def join(self):
             """Wait for pumps to be finished with their cyclic work."""
 
@@ -88,22 +106,67 @@ class PumpControl():
             super().join()
 
         def timer_fcn(self):
-            """Will regularly check for new pump jobs. And execute them.
+            """Will regularly check for new pump jobs. And execute them. The queue statistics are written after every
+            job, hence the queue depth also shows the backlog while the pumps are running, and at the end of the tick
+            (see _write_statistics()).
 
             :return: None
             """
 
-            # get copy of job list
-            with self._job_lock:
-                # empty the class wide job que
-                cur_jobs = self.pump_jobs[:]
-                self.pump_jobs = list()
-
-            # execute the local job que
-            for job in cur_jobs:
+            # always execute the most urgent job next, jobs submitted meanwhile may overtake waiting ones
+            job = self.pump_jobs.pop()
+            while job is not None:
                 job.execute()
+                self._write_statistics()
                 # wait at least 1 second before executing the next job
                 time.sleep(1)
+                job = self.pump_jobs.pop()
+
+            self._write_statistics()
+
+        async def timer_fcn_async(self):
+            """Executes the pump jobs like timer_fcn() in the asyncio runtime mode. No thread is blocked while the
+            pumps are running.
+
+            :return: None
+            """
+
+            job = self.pump_jobs.pop()
+            while job is not None:
+                await job.execute_async()
+                await run_blocking(self._write_statistics)
+                # wait at least 1 second before executing the next job
+                await asyncio.sleep(1)
+                job = self.pump_jobs.pop()
+
+            await run_blocking(self._write_statistics)
+
+        def _write_statistics(self):
+            """Writes the statistics of the pump job queue to the db when they changed since the last write, but at
+            most every STATISTICS_INTERVAL seconds. Errors of the db are logged, they must not stop the pump jobs."""
+
+            stats = self.pump_jobs.get_statistics()
+            now = time.monotonic()
+            if stats == self._last_statistics or \
+                    (self._last_statistics_time is not None and
+                     now - self._last_statistics_time < self.STATISTICS_INTERVAL):
+                return
+
+            try:
+                self._dbclient.write_points([
+                    {
+                        "measurement": self.measurement,
+                        "tags": {},
+                        "time": str(datetime.datetime.now(datetime.timezone.utc)),
+                        "fields": stats,
+                    }
+                ])
+                self._last_statistics = stats
+            except Exception:
+                self.logger.exception(f'{self.name}: Unknown error while writing the queue statistics to the db.')
+
+            # failed writes are retried after the interval
+            self._last_statistics_time = now
 
     @staticmethod
     def validate_config(config: dict):
@@ -162,9 +225,7 @@ class Pump:
         self.pin = config['gpio-pin']
 
         # setup the GPIO
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        GPIO.setup(self.pin, GPIO.OUT)
+        gpio.setup(self.pin, gpio.OUT)
 
     def activate(self):
         """Activates the pump: Start the flow of water"""
@@ -176,14 +237,14 @@ class Pump:
         self.active = True
 
         # activate the pump
-        GPIO.output(self.pin, GPIO.LOW)
+        gpio.output(self.pin, gpio.LOW)
 
 
     def deactivate(self):
         """Deactivates the pump: Stops the flow of water."""
 
         # deactivate the pump
-        GPIO.output(self.pin, GPIO.HIGH)
+        gpio.output(self.pin, gpio.HIGH)
 
         # set the active flag (this will also write the status to the DB)
         self.active = False
@@ -288,9 +349,7 @@ class Valve:
         self._active = False
 
         # setup the GPIO
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        GPIO.setup(self.pin, GPIO.OUT)
+        gpio.setup(self.pin, gpio.OUT)
 
     def activate(self):
         """Activates the pump: Start the flow of water"""
@@ -299,14 +358,14 @@ class Valve:
         self.active = True
 
         # activate the pump
-        GPIO.output(self.pin, GPIO.LOW)
+        gpio.output(self.pin, gpio.LOW)
 
 
     def deactivate(self):
         """Deactivates the pump: Stops the flow of water."""
 
         # deactivate the pump
-        GPIO.output(self.pin, GPIO.HIGH)
+        gpio.output(self.pin, gpio.HIGH)
 
         # set the active flag (this will also write the status to the DB)
         self.active = False
@@ -350,51 +409,201 @@ class Valve:
 
 class PumpJob():
 
-    def __init__(self, pump: Pump, valve: [Valve, int], duration: [float, int]):
+    def __init__(self, pump: Pump, valve: [Valve, int], duration: [float, int], loop: str = None,
+                 urgency: float = 0, deadline: [float, int] = None):
         """
 
         :param pump: (mandatory, Pump) the actual class of the pump
         :param valve: (mandatory, int) gpio pin of the valve
         :param duration: (mandatory, float or int) duration where the pump shall be active in seconds
+        :param loop: (optional, str) name of the irrigation loop the job belongs to
+        :param urgency: (optional, float) the higher the urgency the earlier the job will be executed
+        :param deadline: (optional, float or int) time in seconds after which the job expires. None: never expires
         :return: true when the job could be created
         """
 
         self.pump = pump
         self.valve = valve
         self.duration = duration
+        self.loop = loop
+        self.urgency = urgency
 
-        # setup the GPIO
+        # time stamps of the submission and expiration of the job
+        self.submitted = time.monotonic()
+        self.expires = None if deadline is None else self.submitted + deadline
+
+        # setup the GPIO (only done once per pin)
         if isinstance(self.valve, int):
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            GPIO.setup(self.valve, GPIO.OUT)
+            gpio.setup(self.valve, gpio.OUT)
 
     def execute(self):
         """Executes the pump job."""
 
+        self._start()
+
+        # wait the wanted time
+        time.sleep(self.duration)
+
+        self._stop()
+
+    async def execute_async(self):
+        """Executes the pump job without blocking a thread while the pump is running. The pump and the valve are
+        switched by a worker because their status is written to the db."""
+
+        await run_blocking(self._start)
+
+        # wait the wanted time
+        await asyncio.sleep(self.duration)
+
+        await run_blocking(self._stop)
+
+    def _start(self):
+        """Opens the valve and starts the pump."""
+
         # open the value first to allow the water to flow as soon as the pump runs
         try:
             self.valve.activate()
         except AttributeError:
             if self.valve is not None:
-                GPIO.output(self.valve, GPIO.LOW)
+                gpio.output(self.valve, gpio.LOW)
 
         # start the pump
         self.pump.activate()
 
-        # wait the wanted time
-        time.sleep(self.duration)
+    def _stop(self):
+        """Closes the valve and stops the pump."""
 
         # close the valve first to shut down the flow as fast as possible
         try:
             self.valve.deactivate()
         except AttributeError:
             if self.valve is not None:
-                GPIO.output(self.valve, GPIO.HIGH)
+                gpio.output(self.valve, gpio.HIGH)
 
         # stop the pump
         self.pump.deactivate()
 
+    @property
+    def expired(self):
+        """True when the deadline of the job has passed."""
+
+        return self.expires is not None and time.monotonic() > self.expires
+
+
+class PumpJobQueue():
+    """Priority queue of pump jobs. The job with the highest urgency is executed first, jobs of the same urgency in
+    the order of their submission. Each irrigation loop can only have one waiting job: submitting another job of the
+    same loop will only raise the urgency of the waiting one. Jobs which exceeded their deadline are dropped."""
+
+    # number of wait times kept for the statistics
+    _WAIT_TIMES_CNT = 100
+
+    def __init__(self):
+        """Constructor."""
+
+        self._lock = Lock()
+
+        # heap of [-urgency, sequence number, job]
+        self._heap = list()
+        self._sequence = itertools.count()
+
+        # waiting job per irrigation loop
+        self._loop_jobs = dict()
+
+        # statistics
+        self._wait_times = deque(maxlen=self._WAIT_TIMES_CNT)
+        self._executed_cnt = 0
+        self._duplicate_cnt = 0
+        self._expired_cnt = 0
+
+    def __len__(self):
+        """Number of waiting jobs."""
+
+        with self._lock:
+            return len(self._heap) - self._stale_cnt()
+
+    def _stale_cnt(self):
+        """Number of heap entries which have been superseded by an entry with a higher urgency."""
+
+        return sum(1 for entry in self._heap if entry[2] is None)
+
+    def push(self, job: PumpJob):
+        """Adds the job to the queue.
+
+        :param job: (mandatory, PumpJob) the job which shall be executed
+        :return: true when the job is queued (either as new job or merged into the waiting job of the same loop)
+        """
+
+        with self._lock:
+            if job.loop is not None and job.loop in self._loop_jobs:
+                entry = self._loop_jobs[job.loop]
+                waiting = entry[2]
+                self._duplicate_cnt += 1
+
+                # keep the waiting job, but take over the more urgent priority and the later deadline
+                if job.expires is None or (waiting.expires is not None and job.expires > waiting.expires):
+                    waiting.expires = job.expires
+                if job.urgency <= waiting.urgency:
+                    return True
+                waiting.urgency = job.urgency
+
+                # invalidate the old heap entry and reinsert the job with its new priority
+                entry[2] = None
+                job = waiting
+
+            entry = [-job.urgency, next(self._sequence), job]
+            heapq.heappush(self._heap, entry)
+            if job.loop is not None:
+                self._loop_jobs[job.loop] = entry
+            return True
+
+    def pop(self):
+        """Removes the most urgent job from the queue.
+
+        :return: PumpJob or None when the queue is empty
+        """
+
+        with self._lock:
+            while self._heap:
+                job = heapq.heappop(self._heap)[2]
+                if job is None:
+                    continue
+
+                if job.loop is not None:
+                    del self._loop_jobs[job.loop]
+
+                if job.expired:
+                    self._expired_cnt += 1
+                    continue
+
+                self._executed_cnt += 1
+                self._wait_times.append(time.monotonic() - job.submitted)
+                return job
+
+            return None
+
+    def get_statistics(self):
+        """Returns the statistics of the queue as dictionary.
+
+        :return: dict
+        """
+
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            stats = {
+                'queue-depth': len(self._heap) - self._stale_cnt(),
+                'executed-jobs': self._executed_cnt,
+                'duplicate-jobs': self._duplicate_cnt,
+                'expired-jobs': self._expired_cnt,
+            }
+
+        if wait_times:
+            stats['wait-time-mean'] = sum(wait_times) / len(wait_times)
+            stats['wait-time-median'] = wait_times[len(wait_times) // 2]
+            stats['wait-time-max'] = wait_times[-1]
+
+        return stats
+
 
 class WaterTank(SmartSensor):
     """
@@ -409,7 +618,7 @@ class WaterTank(SmartSensor):
 
         self.level_warning = config['low-level-warning']
         self.level_alarm = config['low-level-alarm']
-        self.level_sensor = SeeedUltraSonicRanger(config['gpio-pin'])
+        self.level_sensor = SeeedUltraSonicRanger(config['gpio-pin'], samples=config.get('samples', 1))
 
     def get_level(self):
         """Get the tank level, low level warning and low level alarm.
@@ -460,6 +669,11 @@ class WaterTank(SmartSensor):
             raise ValueError(f'Can not use gpio-pins {config["gpio-pin"]} as digital input. Check the GPIO layout of '
                              f'your raspberry. And note that pin 1 & 2 is used for I2C bus.')
 
+        # check the number of samples per measurement
+        samples = config.get('samples', 1)
+        if not isinstance(samples, int) or samples < 1:
+            raise ValueError('The number of water tank samples per measurement has to be an integer of at least one.')
+
         # check the plausibility of the of the low-level thresholds
         if config['low-level-alarm'] < 0:
             raise ValueError('The water tank low level alarm can not be set to a negative value.')
@@ -4,7 +4,7 @@ from datetime import datetime, timezone
 from threading import Lock
 
 from influxdb import InfluxDBClient, DataFrameClient
-from Auxiliary import DbAttachedSensor
+from Auxiliary import DbAttachedSensor, Timer, get_timer_statistics
 
 
 def validate_config(config: dict):
@@ -192,7 +192,15 @@ class InfluxAttachedSensor(DbAttachedSensor):
         """
 
         # get the actual measurement values as dictionary
-        data = self.sensor.measure()
+        self.add_measurement(self.sensor.measure(), timestamp=datetime.now(timezone.utc))
+
+    def add_measurement(self, data: dict, timestamp):
+        """Stores the measurement values of the sensor in the _db_data field.
+
+        :param data: (mandatory, dict) the measurement values as returned by the sensor.measure() method
+        :param timestamp: (mandatory) utc time stamp of the measurement
+        :return:
+        """
 
         self.print_sensor_data(data)
 
@@ -203,7 +211,7 @@ class InfluxAttachedSensor(DbAttachedSensor):
         values = list(data.values())
 
         # store the data in the buffer
-        self.add_data(field=fields, value=values, timestamp=datetime.now(timezone.utc))
+        self.add_data(field=fields, value=values, timestamp=timestamp)
 
     def print_sensor_data(self, sensor_data: dict):
         """Prints the sensor data into the command line.
@@ -242,3 +250,41 @@ class InfluxAttachedSensor(DbAttachedSensor):
         successfully."""
 
         self._db_data = list()
+
+
+class RuntimeStatistics(Timer):
+    """RuntimeStatistics periodically writes the statistics of all timers (see Timer.get_statistics()) to the InfluxDB,
+    tagged by the name of the timer."""
+
+    def __init__(self, period: [float, int], dbclient: InfluxDBClient):
+        """
+
+        :param period: (mandatory, float or int) the period of the writes in seconds
+        :param dbclient: (mandatory, InfluxDBClient) the client to the Influx data base. Make sure the database is
+        already pre selected!
+        """
+
+        super().__init__(name='carlos-runtime', period=period)
+
+        self.measurement = 'carlos-runtime'
+        self._dbclient = dbclient
+
+    def timer_fcn(self):
+        """Writes the statistics of all timers which have been executed."""
+
+        timestamp = str(datetime.now(timezone.utc))
+        points = [
+            {
+                "measurement": self.measurement,
+                "tags": {"timer": name},
+                "time": timestamp,
+                "fields": stats,
+            }
+            for name, stats in get_timer_statistics().items() if stats['executions']
+        ]
+
+        # no timer has been executed yet
+        if not points:
+            return
+
+        self._dbclient.write_points(points)
@@ -1,8 +1,14 @@
 #!/usr/bin/python
 
+import os
 import time
-from threading import RLock
-from sensors.i2c import Adafruit_I2C, i2cLock
+import numpy as np
+import yaml
+from collections import deque
+from contextlib import ExitStack
+from threading import Event, Lock, RLock, Thread
+from sensors import gpio
+from sensors.i2c import Adafruit_I2C, i2cLock, PRIORITY_CONTROL
 
 
 class ADS1x15:
@@ -17,7 +23,8 @@ class ADS1x15:
     # should be
     #              __ADS1015_REG_CONFIG_DR_920SPS    = 0x0060
     #
-    # NOT IMPLEMENTED: Conversion ready pin, page 15 datasheet.
+    # flxdot: single-shot conversions poll the OS bit and only lock the i2c bus for the actual transactions
+    # flxdot: conversion ready pin (page 15 datasheet) is used by the ADSampler
     # ===========================================================================
 
     """
@@ -143,13 +150,15 @@ class ADS1x15:
     CHANNELS = [0, 1, 2, 3]
 
     # Constructor
-    def __init__(self, address=0x48, ic=__IC_ADS1115, debug=False):
+    def __init__(self, address=0x48, ic=__IC_ADS1115, debug=False, i2c=None):
         # Depending on if you have an old or a new Raspberry Pi, you
         # may need to change the I2C bus.  Older Pis use SMBus 0,
         # whereas new Pis use SMBus 1.  If you see an error like:
         # 'Error accessing 0x48: Check your I2C address '
         # change the SMBus number in the initializer below!
-        self.i2c = Adafruit_I2C(address)
+        # Any object with the interface of Adafruit_I2C can be passed as i2c device (e.g. a simulation).
+        # The moisture sensors connected to the ADS1x15 control the irrigation.
+        self.i2c = Adafruit_I2C(address, priority=PRIORITY_CONTROL) if i2c is None else i2c
         self.address = address
         self.debug = debug
         # Make sure the IC specified is valid
@@ -162,7 +171,70 @@ class ADS1x15:
         # any function that accepts a pga value must update this.
         self.pga = 6144
 
-        self._i2c_lock = i2cLock()
+        self._i2c_lock = i2cLock(address)
+
+        # Held from the start of a conversion until its result has been read, to prevent other threads from
+        # starting a conversion on the same chip in between. The i2c bus is free during the conversion.
+        self._conversion_lock = RLock()
+
+        # bytes of the config register by (channel, pga, sps, continuous, conversionReady)
+        self._configCache = dict()
+
+        # bytes of the conversion registers read by read_channels() and their view as signed big endian words
+        self._rawBuffer = bytearray(2 * len(self.CHANNELS))
+        self._rawWords = np.frombuffer(self._rawBuffer, dtype='>i2')
+
+        # bytes of the config and the conversion register read by _pollConversion() and of the conversion register
+        # read by _readConversion(), both are read by combined transactions of the i2c device (see readInto())
+        self._pollBuffer = bytearray(4)
+        self._pollResult = memoryview(self._pollBuffer)[2:]
+        self._conversionBuffer = bytearray(2)
+
+    def _startConversion(self, bytes):
+        "Writes the config register, which starts the conversion in single-shot mode. Returns -1 on bus errors."
+
+        with self._i2c_lock:
+            return self.i2c.writeList(self.__ADS1015_REG_POINTER_CONFIG, bytes)
+
+    def _pollConversion(self):
+        "Reads the config and the conversion register in one combined transaction. Returns the bytes of the \
+        conversion register when the OS bit of the config register is 1, i.e. the device is not performing a \
+        conversion, otherwise None. The returned bytes are overwritten by the next poll."
+
+        with self._i2c_lock:
+            registers = self.i2c.readInto(((self.__ADS1015_REG_POINTER_CONFIG, 2),
+                                           (self.__ADS1015_REG_POINTER_CONVERT, 2)), self._pollBuffer)
+
+        # readInto() returns -1 on bus errors
+        if registers is self._pollBuffer and \
+                ((registers[0] << 8) & self.__ADS1015_REG_CONFIG_OS_MASK) == self.__ADS1015_REG_CONFIG_OS_NOTBUSY:
+            return self._pollResult
+        return None
+
+    def _waitForConversion(self, sps):
+        "Waits until the single-shot conversion is complete without locking the i2c bus and returns the bytes of \
+        the conversion register. Sleeps most of the nominal conversion time (the oscillator is accurate to 10%, \
+        see datasheet page 7) and polls the OS bit afterwards, the result is read by the same transaction. \
+        Returns -1 when the conversion did not complete in twice the nominal time or the polls failed due to bus \
+        errors, the conversion register still holds the previous (possibly other channel's) result then."
+
+        delay = 1.0 / sps
+        time.sleep(0.9 * delay)
+
+        deadline = time.monotonic() + 1.1 * delay
+        result = self._pollConversion()
+        while result is None:
+            if time.monotonic() > deadline:
+                return -1
+            time.sleep(0.05 * delay)
+            result = self._pollConversion()
+        return result
+
+    def _readConversion(self):
+        "Reads the conversion register. The returned bytes are overwritten by the next read. Returns -1 on bus errors."
+
+        with self._i2c_lock:
+            return self.i2c.readInto(((self.__ADS1015_REG_POINTER_CONVERT, 2), ), self._conversionBuffer)
 
     # SwitchDoc Labs Mod - added readRaw
     def readRaw(self, channel=0, pga=6144, sps=250):
@@ -179,7 +251,7 @@ class ADS1x15:
         :param channel: (optional, uint) select analog channel 0-3 (Default: 0)
         :param pga: (optional, uint) Voltage gain (Default: 6144)
         :param sps: (optional, uiint) samples per second
-        :return: 
+        :return: the raw value or -1 on bus errors or when the conversion did not complete
         """
 
         # return raw AD Value
@@ -189,58 +261,15 @@ class ADS1x15:
                 print("ADS1x15: Invalid channel specified: {}".format(channel))
             return -1
 
-        # Disable comparator, Non-latching, Alert/Rdy active low
-        # traditional comparator, single-shot mode
-        config = self.__ADS1015_REG_CONFIG_CQUE_NONE | \
-                 self.__ADS1015_REG_CONFIG_CLAT_NONLAT | \
-                 self.__ADS1015_REG_CONFIG_CPOL_ACTVLOW | \
-                 self.__ADS1015_REG_CONFIG_CMODE_TRAD | \
-                 self.__ADS1015_REG_CONFIG_MODE_SINGLE
-
-        # Set sample per seconds, defaults to 250sps
-        # If sps is in the dictionary (defined in init) it returns the value of the constant
-        # otherwise it returns the value for 250sps. This saves a lot of if/elif/else code!
-        if (self.ic == self.__IC_ADS1015):
-            config |= self.spsADS1015.setdefault(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
-        else:
-            if ((sps not in self.spsADS1115) & self.debug):
-                print("ADS1x15: Invalid pga specified: %d, using 6144mV".format(sps))
-            config |= self.spsADS1115.setdefault(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
-
-        # Set PGA/voltage range, defaults to +-6.144V
-        if ((pga not in self.pgaADS1x15) & self.debug):
-            print("ADS1x15: Invalid pga specified: %d, using 6144mV".format(sps))
-        config |= self.pgaADS1x15.setdefault(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
-        self.pga = pga
-
-        # Set the channel to be converted
-        if channel == 3:
-            config |= self.__ADS1015_REG_CONFIG_MUX_SINGLE_3
-        elif channel == 2:
-            config |= self.__ADS1015_REG_CONFIG_MUX_SINGLE_2
-        elif channel == 1:
-            config |= self.__ADS1015_REG_CONFIG_MUX_SINGLE_1
-        else:
-            config |= self.__ADS1015_REG_CONFIG_MUX_SINGLE_0
-
-        # Set 'start single-conversion' bit
-        config |= self.__ADS1015_REG_CONFIG_OS_SINGLE
-
-        # Write config register to the ADC
-        bytes = [(config >> 8) & 0xFF, config & 0xFF]
-
-        with self._i2c_lock:
-            self.i2c.writeList(self.__ADS1015_REG_POINTER_CONFIG, bytes)
-
-            # Wait for the ADC conversion to complete
-            # The minimum delay depends on the sps: delay >= 1/sps
-            # We add 0.1ms to be sure
-            delay = 1.0 / sps + 0.0001
-            time.sleep(delay)
+        bytes = self._singleEndedConfig(channel, pga, sps)
 
-            # Read the conversion results
-            result = self.i2c.readList(self.__ADS1015_REG_POINTER_CONVERT, 2)
+        # the i2c bus is only locked for the actual transactions, not while the ADC is converting
+        with self._conversion_lock:
+            self._startConversion(bytes)
+            result = self._waitForConversion(sps)
 
+        if result == -1:
+            return -1
         return ((result[0] << 8) | (result[1]))
 
     def readADCSingleEnded(self, channel=0, pga=6144, sps=250):
@@ -248,7 +277,8 @@ class ADS1x15:
         The sample rate for this mode (single-shot) can be used to lower the noise \
         (low sps) or to lower the power consumption (high sps) by duty cycling, \
         see datasheet page 14 for more info. \
-        The pga must be given in mV, see page 13 for the supported values."
+        The pga must be given in mV, see page 13 for the supported values. \
+        Returns None when the conversion could not be read due to a bus error or did not complete."
 
 
         # With invalid channel return -1
@@ -257,6 +287,80 @@ class ADS1x15:
                 print("ADS1x15: Invalid channel specified: %d".format(channel))
             return -1
 
+        bytes = self._singleEndedConfig(channel, pga, sps)
+
+        # the i2c bus is only locked for the actual transactions, not while the ADC is converting
+        with self._conversion_lock:
+            self._startConversion(bytes)
+            result = self._waitForConversion(sps)
+
+        if result == -1:
+            return None
+        return self._convertResult(result, pga)
+
+    def read_channels(self, channels, pga=6144, sps=250, out=None):
+        """Converts the single-ended channels one after another and returns the voltages. The chip is owned for all
+        conversions and the results are collected in preallocated buffers.
+
+        :param channels: (mandatory, list) the channels to convert
+        :param pga: (optional, uint) Voltage gain (Default: 6144)
+        :param sps: (optional, uint) samples per second (Default: 250)
+        :param out: (optional, numpy.ndarray) float array of len(channels) to store the voltages in (Default: None)
+        :return: numpy.ndarray with the voltages in mV, NaN for the conversions lost to bus errors or timeouts
+        """
+
+        cnt = len(channels)
+        for channel in channels:
+            self.validate_channel(channel)
+
+        if out is None:
+            out = np.empty(cnt)
+
+        # the i2c bus is only locked for the actual transactions, not while the ADC is converting
+        with self._conversion_lock:
+            if len(self._rawWords) < cnt:
+                self._rawBuffer = bytearray(2 * cnt)
+                self._rawWords = np.frombuffer(self._rawBuffer, dtype='>i2')
+            buffer = self._rawBuffer
+            i2c, i2c_lock = self.i2c, self._i2c_lock
+            failed = list()
+            for i, channel in enumerate(channels):
+                with i2c_lock:
+                    i2c.writeList(self.__ADS1015_REG_POINTER_CONFIG, self._singleEndedConfig(channel, pga, sps))
+                result = self._waitForConversion(sps)
+                if result == -1:
+                    failed.append(i)
+                    continue
+                buffer[2 * i:2 * i + 2] = result
+
+            if (self.ic == self.__IC_ADS1015):
+                # the 12-bit result of the ADS1015 is left aligned
+                np.multiply(self._rawWords[:cnt] >> 4, pga / 2048.0, out=out)
+            else:
+                np.multiply(self._rawWords[:cnt], pga / 32768.0, out=out)
+
+        if failed:
+            out[failed] = np.nan
+        return out
+
+    def _singleEndedConfig(self, channel, pga, sps, continuous=False, conversionReady=False):
+        "Returns the bytes of the config register to start the conversion of the channel. The bytes are built once \
+        per combination of the arguments and cached afterwards, the returned list must not be modified. With \
+        continuous the channel is converted continuously, with conversionReady the comparator asserts ALERT/RDY \
+        after every conversion (see _enableConversionReady())."
+
+        self.pga = pga
+
+        key = (channel, pga, sps, continuous, conversionReady)
+        bytes = self._configCache.get(key)
+        if bytes is None:
+            bytes = self._configCache[key] = self._buildSingleEndedConfig(channel, pga, sps, continuous,
+                                                                         conversionReady)
+        return bytes
+
+    def _buildSingleEndedConfig(self, channel, pga, sps, continuous, conversionReady):
+        "Builds the bytes of the config register, see _singleEndedConfig()."
+
         # Disable comparator, Non-latching, Alert/Rdy active low
         # traditional comparator, single-shot mode
         config = self.__ADS1015_REG_CONFIG_CQUE_NONE | \
@@ -265,21 +369,25 @@ class ADS1x15:
                  self.__ADS1015_REG_CONFIG_CMODE_TRAD | \
                  self.__ADS1015_REG_CONFIG_MODE_SINGLE
 
+        if continuous:
+            config = (config & ~self.__ADS1015_REG_CONFIG_MODE_MASK) | self.__ADS1015_REG_CONFIG_MODE_CONTIN
+        if conversionReady:
+            config = (config & ~self.__ADS1015_REG_CONFIG_CQUE_MASK) | self.__ADS1015_REG_CONFIG_CQUE_1CONV
+
         # Set sample per seconds, defaults to 250sps
         # If sps is in the dictionary (defined in init) it returns the value of the constant
         # otherwise it returns the value for 250sps. This saves a lot of if/elif/else code!
         if (self.ic == self.__IC_ADS1015):
-            config |= self.spsADS1015.setdefault(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
+            config |= self.spsADS1015.get(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
         else:
             if ((sps not in self.spsADS1115) & self.debug):
                 print("ADS1x15: Invalid pga specified: %d, using 6144mV".format(sps))
-            config |= self.spsADS1115.setdefault(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
+            config |= self.spsADS1115.get(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
 
         # Set PGA/voltage range, defaults to +-6.144V
         if ((pga not in self.pgaADS1x15) & self.debug):
             print("ADS1x15: Invalid pga specified: %d, using 6144mV".format(sps))
-        config |= self.pgaADS1x15.setdefault(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
-        self.pga = pga
+        config |= self.pgaADS1x15.get(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
 
         # Set the channel to be converted
         if channel == 3:
@@ -297,18 +405,10 @@ class ADS1x15:
         # Write config register to the ADC
         bytes = [(config >> 8) & 0xFF, config & 0xFF]
 
-        # acquire i2c lock to prevent multiple threads trying to use the i2c bus at the same time
-        with self._i2c_lock:
-            self.i2c.writeList(self.__ADS1015_REG_POINTER_CONFIG, bytes)
+        return bytes
 
-            # Wait for the ADC conversion to complete
-            # The minimum delay depends on the sps: delay >= 1/sps
-            # We add 0.1ms to be sure
-            delay = 1.0 / sps + 0.0001
-            time.sleep(delay)
-
-            # Read the conversion results
-            result = self.i2c.readList(self.__ADS1015_REG_POINTER_CONVERT, 2)
+    def _convertResult(self, result, pga):
+        "Converts the bytes of the conversion register to mV."
 
         if (self.ic == self.__IC_ADS1015):
             # Shift right 4 bits for the 12-bit ADS1015 and convert to mV
@@ -322,12 +422,22 @@ class ADS1x15:
             else:
                 return ((result[0] << 8) | (result[1])) * pga / 32768.0
 
+    def _enableConversionReady(self):
+        "Turns ALERT/RDY into a conversion ready pin by setting the MSB of the high threshold register and clearing \
+        the MSB of the low threshold register. In continuous mode the pin pulses low at the end of each conversion, \
+        see datasheet page 15."
+
+        with self._i2c_lock:
+            self.i2c.writeList(self.__ADS1015_REG_POINTER_HITHRESH, [0x80, 0x00])
+            self.i2c.writeList(self.__ADS1015_REG_POINTER_LOWTHRESH, [0x00, 0x00])
+
     def readADCDifferential(self, chP=0, chN=1, pga=6144, sps=250):
         "Gets a differential ADC reading from channels chP and chN in mV. \
         The sample rate for this mode (single-shot) can be used to lower the noise \
         (low sps) or to lower the power consumption (high sps) by duty cycling, \
         see data sheet page 14 for more info. \
-        The pga must be given in mV, see page 13 for the supported values."
+        The pga must be given in mV, see page 13 for the supported values. \
+        Returns None when the conversion could not be read due to a bus error or did not complete."
 
 
 
@@ -358,16 +468,16 @@ class ADS1x15:
         # If sps is in the dictionary (defined in init()) it returns the value of the constant
         # othewise it returns the value for 250sps. This saves a lot of if/elif/else code!
         if (self.ic == self.__IC_ADS1015):
-            config |= self.spsADS1015.setdefault(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
+            config |= self.spsADS1015.get(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
         else:
             if ((sps not in self.spsADS1115) & self.debug):
                 print("ADS1x15: Invalid pga specified: {}, using 6144mV".format(sps))
-            config |= self.spsADS1115.setdefault(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
+            config |= self.spsADS1115.get(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
 
         # Set PGA/voltage range, defaults to +-6.144V
         if ((pga not in self.pgaADS1x15) & self.debug):
             print("ADS1x15: Invalid pga specified: {}, using 6144mV".format(sps))
-        config |= self.pgaADS1x15.setdefault(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
+        config |= self.pgaADS1x15.get(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
         self.pga = pga
 
         # Set 'start single-conversion' bit
@@ -376,18 +486,13 @@ class ADS1x15:
         # Write config register to the ADC
         bytes = [(config >> 8) & 0xFF, config & 0xFF]
 
-        with self._i2c_lock:
-            self.i2c.writeList(self.__ADS1015_REG_POINTER_CONFIG, bytes)
-
-            # Wait for the ADC conversion to complete
-            # The minimum delay depends on the sps: delay >= 1/sps
-            # We add 0.5ms to be sure
-            delay = 1.0 / sps + 0.0005
-            time.sleep(delay)
-
-            # Read the conversion results
-            result = self.i2c.readList(self.__ADS1015_REG_POINTER_CONVERT, 2)
+        # the i2c bus is only locked for the actual transactions, not while the ADC is converting
+        with self._conversion_lock:
+            self._startConversion(bytes)
+            result = self._waitForConversion(sps)
 
+        if result == -1:
+            return None
         if (self.ic == self.__IC_ADS1015):
             # Shift right 4 bits for the 12-bit ADS1015 and convert to mV
             return (((result[0] << 8) | (result[1] & 0xFF)) >> 4) * pga / 2048.0
@@ -405,7 +510,8 @@ class ADS1x15:
         The sample rate for this mode (single-shot) can be used to lower the noise \
         (low sps) or to lower the power consumption (high sps) by duty cycling, \
         see data sheet page 14 for more info. \
-        The pga must be given in mV, see page 13 for the supported values."
+        The pga must be given in mV, see page 13 for the supported values. \
+        Returns None when the conversion could not be read due to a bus error or did not complete."
         return self.readADCDifferential(0, 1, pga, sps)
 
     def readADCDifferential03(self, pga=6144, sps=250):
@@ -413,7 +519,8 @@ class ADS1x15:
         The sample rate for this mode (single-shot) can be used to lower the noise \
         (low sps) or to lower the power consumption (high sps) by duty cycling, \
         see data sheet page 14 for more info. \
-        The pga must be given in mV, see page 13 for the supported values."
+        The pga must be given in mV, see page 13 for the supported values. \
+        Returns None when the conversion could not be read due to a bus error or did not complete."
         return self.readADCDifferential(0, 3, pga, sps)
 
     def readADCDifferential13(self, pga=6144, sps=250):
@@ -421,7 +528,8 @@ class ADS1x15:
         The sample rate for this mode (single-shot) can be used to lower the noise \
         (low sps) or to lower the power consumption (high sps) by duty cycling, \
         see data sheet page 14 for more info. \
-        The pga must be given in mV, see page 13 for the supported values."
+        The pga must be given in mV, see page 13 for the supported values. \
+        Returns None when the conversion could not be read due to a bus error or did not complete."
         return self.__readADCDifferential(1, 3, pga, sps)
 
     def readADCDifferential23(self, pga=6144, sps=250):
@@ -429,7 +537,8 @@ class ADS1x15:
         The sample rate for this mode (single-shot) can be used to lower the noise \
         (low sps) or to lower the power consumption (high sps) by duty cycling, \
         see data sheet page 14 for more info. \
-        The pga must be given in mV, see page 13 for the supported values."
+        The pga must be given in mV, see page 13 for the supported values. \
+        Returns None when the conversion could not be read due to a bus error or did not complete."
         return self.readADCDifferential(2, 3, pga, sps)
 
     def startContinuousConversion(self, channel=0, pga=6144, sps=250):
@@ -438,7 +547,7 @@ class ADS1x15:
         The sps controls the sample rate. \
         The pga must be given in mV, see datasheet page 13 for the supported values. \
         Use getLastConversionResults() to read the next values and \
-        stopContinuousConversion() to stop converting."
+        stopContinuousConversion() to stop converting. Returns None on bus errors."
 
         # Default to channel 0 with invalid channel, or return -1?
         if (channel > 3):
@@ -459,16 +568,16 @@ class ADS1x15:
         # If sps is in the dictionary (defined in init()) it returns the value of the constant
         # othewise it returns the value for 250sps. This saves a lot of if/elif/else code!
         if (self.ic == self.__IC_ADS1015):
-            config |= self.spsADS1015.setdefault(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
+            config |= self.spsADS1015.get(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
         else:
             if ((sps not in self.spsADS1115) & self.debug):
                 print("ADS1x15: Invalid pga specified: {}, using 6144mV".format(sps))
-            config |= self.spsADS1115.setdefault(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
+            config |= self.spsADS1115.get(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
 
         # Set PGA/voltage range, defaults to +-6.144V
         if ((pga not in self.pgaADS1x15) & self.debug):
             print("ADS1x15: Invalid pga specified: {}, using 6144mV".format(sps))
-        config |= self.pgaADS1x15.setdefault(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
+        config |= self.pgaADS1x15.get(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
         self.pga = pga
 
         # Set the channel to be converted
@@ -490,18 +599,18 @@ class ADS1x15:
         # we can read the next values using getLastConversionResult
         bytes = [(config >> 8) & 0xFF, config & 0xFF]
 
-        with self._i2c_lock:
-            self.i2c.writeList(self.__ADS1015_REG_POINTER_CONFIG, bytes)
+        with self._conversion_lock:
+            self._startConversion(bytes)
 
-            # Wait for the ADC conversion to complete
+            # Wait for the first conversion to complete, the OS bit can not be polled in continuous mode
             # The minimum delay depends on the sps: delay >= 1/sps
             # We add 0.5ms to be sure
-            delay = 1.0 / sps + 0.0005
-            time.sleep(delay)
+            time.sleep(1.0 / sps + 0.0005)
 
-            # Read the conversion results
-            result = self.i2c.readList(self.__ADS1015_REG_POINTER_CONVERT, 2)
+            result = self._readConversion()
 
+        if result == -1:
+            return None
         if (self.ic == self.__IC_ADS1015):
             # Shift right 4 bits for the 12-bit ADS1015 and convert to mV
             return (((result[0] << 8) | (result[1] & 0xFF)) >> 4) * pga / 2048.0
@@ -520,7 +629,7 @@ class ADS1x15:
         The sps controls the sample rate. \
         The pga must be given in mV, see datasheet page 13 for the supported values. \
         Use getLastConversionResults() to read the next values and \
-        stopContinuousConversion() to stop converting."
+        stopContinuousConversion() to stop converting. Returns None on bus errors."
 
 
         # Disable comparator, Non-latching, Alert/Rdy active low
@@ -536,16 +645,16 @@ class ADS1x15:
         # If sps is in the dictionary (defined in init()) it returns the value of the constant
         # othewise it returns the value for 250sps. This saves a lot of if/elif/else code!
         if (self.ic == self.__IC_ADS1015):
-            config |= self.spsADS1015.setdefault(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
+            config |= self.spsADS1015.get(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
         else:
             if ((sps not in self.spsADS1115) & self.debug):
                 print("ADS1x15: Invalid pga specified: {}, using 6144mV".format(sps))
-            config |= self.spsADS1115.setdefault(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
+            config |= self.spsADS1115.get(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
 
         # Set PGA/voltage range, defaults to +-6.144V
         if ((pga not in self.pgaADS1x15) & self.debug):
             print("ADS1x15: Invalid pga specified: {}, using 6144mV".format(sps))
-        config |= self.pgaADS1x15.setdefault(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
+        config |= self.pgaADS1x15.get(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
         self.pga = pga
 
         # Set channels
@@ -571,18 +680,18 @@ class ADS1x15:
         # we can read the next values using getLastConversionResult
         bytes = [(config >> 8) & 0xFF, config & 0xFF]
 
-        with self._i2c_lock:
-            self.i2c.writeList(self.__ADS1015_REG_POINTER_CONFIG, bytes)
+        with self._conversion_lock:
+            self._startConversion(bytes)
 
-            # Wait for the ADC conversion to complete
+            # Wait for the first conversion to complete, the OS bit can not be polled in continuous mode
             # The minimum delay depends on the sps: delay >= 1/sps
             # We add 0.5ms to be sure
-            delay = 1.0 / sps + 0.0005
-            time.sleep(delay)
+            time.sleep(1.0 / sps + 0.0005)
 
-            # Read the conversion results
-            result = self.i2c.readList(self.__ADS1015_REG_POINTER_CONVERT, 2)
+            result = self._readConversion()
 
+        if result == -1:
+            return None
         if (self.ic == self.__IC_ADS1015):
             # Shift right 4 bits for the 12-bit ADS1015 and convert to mV
             return (((result[0] << 8) | (result[1] & 0xFF)) >> 4) * pga / 2048.0
@@ -604,20 +713,18 @@ class ADS1x15:
         # enter power-off mode.
         config = 0x8583  # Page 18 datasheet.
         bytes = [(config >> 8) & 0xFF, config & 0xFF]
-        # acquire the i2cLock to allow proper multi threading
-
-        with self._i2c_lock:
-            self.i2c.writeList(self.__ADS1015_REG_POINTER_CONFIG, bytes)
+        with self._conversion_lock:
+            self._startConversion(bytes)
 
         return True
 
     def getLastConversionResults(self):
-        "Returns the last ADC conversion result in mV"
+        "Returns the last ADC conversion result in mV or None on bus errors"
 
-        # acquire the i2cLock to allow proper multi threading
-        with self._i2c_lock:
-            # Read the conversion results
-            result = self.i2c.readList(self.__ADS1015_REG_POINTER_CONVERT, 2)
+        # Read the conversion results
+        result = self._readConversion()
+        if result == -1:
+            return None
 
         if (self.ic == self.__IC_ADS1015):
             # Shift right 4 bits for the 12-bit ADS1015 and convert to mV
@@ -684,16 +791,16 @@ class ADS1x15:
         if (self.ic == self.__IC_ADS1015):
             if ((sps not in self.spsADS1015) & self.debug):
                 print("ADS1x15: Invalid sps specified: {}, using 1600sps".format(sps))
-            config |= self.spsADS1015.setdefault(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
+            config |= self.spsADS1015.get(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
         else:
             if ((sps not in self.spsADS1115) & self.debug):
                 print("ADS1x15: Invalid sps specified: {}, using 250sps".format(sps))
-            config |= self.spsADS1115.setdefault(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
+            config |= self.spsADS1115.get(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
 
         # Set PGA/voltage range, defaults to +-6.144V
         if ((pga not in self.pgaADS1x15) & self.debug):
             print("ADS1x15: Invalid pga specified: {}, using 6144mV".format(pga))
-        config |= self.pgaADS1x15.setdefault(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
+        config |= self.pgaADS1x15.get(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
         self.pga = pga
 
         # Set the channel to be converted
@@ -710,7 +817,7 @@ class ADS1x15:
         config |= self.__ADS1015_REG_CONFIG_OS_SINGLE
 
 
-        with self._i2c_lock:
+        with self._conversion_lock, self._i2c_lock:
             # Write threshold high and low registers to the ADC
             # V_digital = (2^(n-1)-1)/pga*V_analog
             if (self.ic == self.__IC_ADS1015):
@@ -781,16 +888,16 @@ class ADS1x15:
         if (self.ic == self.__IC_ADS1015):
             if ((sps not in self.spsADS1015) & self.debug):
                 print("ADS1x15: Invalid sps specified: {}, using 1600sps".format(sps))
-            config |= self.spsADS1015.setdefault(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
+            config |= self.spsADS1015.get(sps, self.__ADS1015_REG_CONFIG_DR_1600SPS)
         else:
             if ((sps not in self.spsADS1115) & self.debug):
                 print("ADS1x15: Invalid sps specified: {}, using 250sps".format(sps))
-            config |= self.spsADS1115.setdefault(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
+            config |= self.spsADS1115.get(sps, self.__ADS1115_REG_CONFIG_DR_250SPS)
 
         # Set PGA/voltage range, defaults to +-6.144V
         if ((pga not in self.pgaADS1x15) & self.debug):
             print("ADS1x15: Invalid pga specified: {}, using 6144mV".format(pga))
-        config |= self.pgaADS1x15.setdefault(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
+        config |= self.pgaADS1x15.get(pga, self.__ADS1015_REG_CONFIG_PGA_6_144V)
         self.pga = pga
 
         # Set channels
@@ -810,7 +917,7 @@ class ADS1x15:
         # Set 'start single-conversion' bit to begin conversions
         config |= self.__ADS1015_REG_CONFIG_OS_SINGLE
 
-        with self._i2c_lock:
+        with self._conversion_lock, self._i2c_lock:
             # Write threshold high and low registers to the ADC
             # V_digital = (2^(n-1)-1)/pga*V_analog
             if (self.ic == self.__IC_ADS1015):
@@ -886,3 +993,620 @@ class ADConverter:
         # is the address valid?
         if address not in ADConverter._types.keys():
             raise ValueError(f'Address \'{address}\ seems to be invalid. Please double check!')
+
+
+class ADScanner:
+    """The ADScanner reads single-ended channels of several ADS1x15 chips with overlapping conversions. It starts a
+    conversion on every chip, collects each result as soon as the chip is done and immediately starts the next
+    conversion of that chip. Scanning N chips therefore takes about as long as scanning the chip with the most
+    channels."""
+
+    def __init__(self, channels: list, pga=6144, sps=250):
+        """Constructor
+
+        :param channels: (mandatory, list) list of (ADS1x15, channel) tuples which shall be scanned. A channel with its
+        own settings is given as (ADS1x15, channel, pga, sps) tuple.
+        :param pga: (optional, uint) Voltage gain of the channels without own settings (Default: 6144)
+        :param sps: (optional, uint) samples per second of the channels without own settings (Default: 250)
+        """
+
+        self.pga = pga
+        self.sps = sps
+
+        # the (channel, pga, sps) to scan per chip, ordered by the address to always lock the chips in the same order
+        self._chips = dict()
+        for chip, channel, *settings in channels:
+            ADS1x15.validate_channel(channel)
+            channel_pga, channel_sps = settings if settings else (pga, sps)
+            self._chips.setdefault(chip, list()).append((channel, channel_pga, channel_sps))
+        self._chips = dict(sorted(self._chips.items(), key=lambda item: item[0].address))
+
+    @classmethod
+    def from_addresses(cls, channels: list, pga=6144, sps=250):
+        """Alternative constructor based on i2c addresses.
+
+        :param channels: (mandatory, list) list of (i2c address, channel) tuples which shall be scanned
+        :param pga: (optional, uint) Voltage gain (Default: 6144)
+        :param sps: (optional, uint) samples per second (Default: 250)
+        :return: ADScanner
+        """
+
+        return cls([(ADConverter(address), channel) for address, channel in channels], pga=pga, sps=sps)
+
+    def scan(self):
+        """Converts all channels once.
+
+        :return: dict with (i2c address, channel) as keys and the voltages in mV (None on bus errors or when the
+        conversion did not complete) as values
+        """
+
+        results = dict()
+
+        with ExitStack() as stack:
+            # own all chips for the whole scan
+            for chip in self._chips.keys():
+                stack.enter_context(chip._conversion_lock)
+
+            # chip -> (remaining channels, current (channel, pga, sps), time the conversion is due)
+            pending = dict()
+            for chip, channels in self._chips.items():
+                remaining = deque(channels)
+                pending[chip] = (remaining, ) + self._start(chip, remaining.popleft())
+
+            while pending:
+                # sleep until the next conversion is due, the i2c bus is free in the mean time
+                sleep_time = min(due for _, _, due in pending.values()) - time.monotonic()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+
+                now = time.monotonic()
+                for chip, (remaining, current, due) in list(pending.items()):
+                    if now < due:
+                        continue
+
+                    # poll the OS bit, give up waiting after twice the nominal conversion time. The conversion
+                    # register still holds the previous result then, the channel is invalid.
+                    channel, pga, sps = current
+                    result = chip._pollConversion()
+                    if result is None and now < due + 1.1 / sps:
+                        pending[chip] = (remaining, current, now + 0.05 / sps)
+                        continue
+
+                    results[(chip.address, channel)] = None if result is None else chip._convertResult(result, pga)
+
+                    if remaining:
+                        pending[chip] = (remaining, ) + self._start(chip, remaining.popleft())
+                    else:
+                        del pending[chip]
+
+        return results
+
+    def _start(self, chip: ADS1x15, current: tuple):
+        """Starts the conversion of the channel.
+
+        :param chip: (mandatory, ADS1x15) the a/d converter
+        :param current: (mandatory, tuple) the (channel, pga, sps) to convert
+        :return: ((channel, pga, sps), time the conversion is due)
+        """
+
+        channel, pga, sps = current
+        chip._startConversion(chip._singleEndedConfig(channel, pga, sps))
+        return current, time.monotonic() + 0.9 / sps
+
+
+class ADSampler(Thread):
+    """The ADSampler converts single-ended channels of an ADS1x15 continuously in the background and stores the results
+    in a ring buffer per channel. Readers take the buffered values without any i2c transaction. Several channels are
+    converted round robin by switching the input multiplexer. If the ALERT/RDY pin of the chip is connected to a gpio,
+    the chip signals the end of each conversion, otherwise the sampler waits for the nominal conversion time.
+
+    The sampler owns the chip while it is running, single-shot reads of the chip block until it has been stopped."""
+
+    # the running sampler of each i2c address
+    _instances = dict()
+
+    # continuous: sampled by the ADSampler, comparator: converts one channel and asserts ALERT/RDY at a threshold
+    MODES = ['single-shot', 'continuous', 'comparator']
+
+    # read() returns None when a channel did not get a new value for this many sampling rounds
+    STALE_ROUNDS = 4
+
+    def __init__(self, chip: ADS1x15, channels: list, pga=6144, sps=860, alert_pin=None, buffer_size=64, settle=1):
+        """Constructor
+
+        :param chip: (mandatory, ADS1x15) the a/d converter
+        :param channels: (mandatory, list) the single-ended channels to sample
+        :param pga: (optional, uint or dict) Voltage gain, or the voltage gain per channel (Default: 6144)
+        :param sps: (optional, uint) samples per second (Default: 860)
+        :param alert_pin: (optional, int) gpio connected to the ALERT/RDY pin (Default: None)
+        :param buffer_size: (optional, int) number of values buffered per channel (Default: 64)
+        :param settle: (optional, int) conversions discarded after switching the multiplexer (Default: 1)
+        """
+
+        super().__init__(name=f'ADSampler_0x{chip.address:02X}', daemon=True)
+
+        for channel in channels:
+            ADS1x15.validate_channel(channel)
+
+        self.chip = chip
+        self.channels = list(channels)
+        self.pga = pga if isinstance(pga, dict) else {channel: pga for channel in self.channels}
+        self.sps = sps
+        self.alert_pin = alert_pin
+        self.settle = settle
+
+        # number of conversions the ALERT/RDY pin did not signal in time and of samples lost to bus errors
+        self.missed = 0
+        self.errors = 0
+
+        # time of one round over all channels, including the settling conversions after switching the multiplexer
+        conversions = len(self.channels) * (1 + settle) if len(self.channels) > 1 else 1
+        self._stale_time = self.STALE_ROUNDS * 1.1 * conversions / sps
+
+        self._lock = Lock()
+        self._stop_event = Event()
+        # the subscription to the ALERT/RDY edges while the sampler is running
+        self._watcher = None
+        self._buffers = {channel: deque(maxlen=buffer_size) for channel in self.channels}
+        # number of values added to each buffer since its last read() and the time of the last value
+        self._new = {channel: 0 for channel in self.channels}
+        self._updated = {channel: 0.0 for channel in self.channels}
+
+    @classmethod
+    def from_config(cls, chip: ADS1x15, channels: list, pga: int, config: dict):
+        """Alternative constructor based on the config of the a/d converter.
+
+        :param chip: (mandatory, ADS1x15) the a/d converter
+        :param channels: (mandatory, list) the single-ended channels to sample
+        :param pga: (mandatory, uint or dict) Voltage gain, or the voltage gain per channel
+        :param config: (mandatory, dict) the config of the a/d converter
+        :return: ADSampler
+        """
+
+        return cls(chip, channels, pga=pga, sps=config.get('sps', 860), alert_pin=config.get('alert-gpio', None),
+                   buffer_size=config.get('buffer-size', 64))
+
+    @classmethod
+    def get(cls, address: int):
+        """Returns the running sampler of the a/d converter or None.
+
+        :param address: (mandatory, hex) the i2c address of the a/d converter
+        :return: ADSampler
+        """
+
+        return cls._instances.get(address, None)
+
+    def start(self):
+        """Starts the sampling."""
+
+        ADSampler._instances[self.chip.address] = self
+        super().start()
+
+    def stop(self):
+        """Stops the sampling."""
+
+        self._deregister()
+        self._stop_event.set()
+
+    def _deregister(self):
+        """Removes the sampler from the running samplers, single-shot reads access the chip again afterwards."""
+
+        if ADSampler._instances.get(self.chip.address, None) is self:
+            del ADSampler._instances[self.chip.address]
+
+    def read(self, channel: int):
+        """Returns the mean of the values converted since the last read of the channel. If there are no new values,
+        the last one is returned as long as it is not older than STALE_ROUNDS sampling rounds.
+
+        :param channel: (mandatory, uint) the channel
+        :return: the voltage in mV or None if no recent value has been converted
+        """
+
+        with self._lock:
+            buffer = self._buffers[channel]
+            if not buffer:
+                return None
+            if not self._new[channel] and time.monotonic() - self._updated[channel] > self._stale_time:
+                return None
+            cnt = max(self._new[channel], 1)
+            self._new[channel] = 0
+            values = [buffer[-i] for i in range(1, cnt + 1)]
+
+        return sum(values) / len(values)
+
+    def values(self, channel: int):
+        """Returns all buffered values of the channel, the oldest first.
+
+        :param channel: (mandatory, uint) the channel
+        :return: list of voltages in mV
+        """
+
+        with self._lock:
+            return list(self._buffers[channel])
+
+    def run(self):
+        """The Thread method."""
+
+        chip = self.chip
+        delay = 1.0 / self.sps
+        conversion_ready = self.alert_pin is not None
+        configs = {channel: chip._singleEndedConfig(channel, self.pga[channel], self.sps, True, conversion_ready)
+                   for channel in self.channels}
+        # with a single channel the multiplexer is never switched
+        switching = len(self.channels) > 1
+
+        with chip._conversion_lock:
+            try:
+                if conversion_ready:
+                    # subscribe once, edges signalled while a result is read are kept for the next wait
+                    # ALERT/RDY is an open drain output
+                    self._watcher = gpio.watch_edges(self.alert_pin, edge=gpio.FALLING, pull=gpio.PUD_UP)
+                    chip._enableConversionReady()
+                # a failed start of a single channel is repeated in the loop below
+                started = switching or self._start(configs[self.channels[0]])
+
+                while not self._stop_event.is_set():
+                    for channel in self.channels:
+                        try:
+                            if switching or not started:
+                                started = self._start(configs[channel])
+                                if not started:
+                                    # the chip still converts the previous channel
+                                    self._error()
+                                    continue
+                                # the conversions right after switching the multiplexer may not be settled
+                                for i in range(self.settle if switching else 0):
+                                    self._wait(delay)
+
+                            if not self._wait(delay):
+                                continue
+
+                            # readInto() returns -1 on bus errors
+                            result = chip._readConversion()
+                            if result is not chip._conversionBuffer:
+                                self._error()
+                                continue
+
+                            value = chip._convertResult(result, self.pga[channel])
+                            with self._lock:
+                                self._buffers[channel].append(value)
+                                self._new[channel] = min(self._new[channel] + 1, self._buffers[channel].maxlen)
+                                self._updated[channel] = time.monotonic()
+                        except IOError:
+                            self._error()
+            finally:
+                self._deregister()
+                if self._watcher is not None:
+                    self._watcher.close()
+                    self._watcher = None
+                chip.stopContinuousConversion()
+
+    def _start(self, config: list):
+        """Starts the continuous conversion, edges of ALERT/RDY signalled before belong to the previous settings.
+
+        :param config: (mandatory, list) the bytes of the config register
+        :return: False on bus errors
+        """
+
+        if self.chip._startConversion(config) == -1:
+            return False
+        if self._watcher is not None:
+            self._watcher.clear()
+        return True
+
+    def _error(self):
+        """Counts a sample lost to a bus error and backs off before the next transaction."""
+
+        self.errors += 1
+        self._stop_event.wait(1.0 / self.sps)
+
+    def _wait(self, delay: float):
+        """Waits for the end of the current conversion.
+
+        :param delay: (mandatory, float) the nominal conversion time in seconds
+        :return: False if the sampler has been stopped or ALERT/RDY did not signal the conversion in time
+        """
+
+        if self.alert_pin is None:
+            # the oscillator is accurate to 10%, see datasheet page 7
+            return not self._stop_event.wait(1.1 * delay)
+
+        if self._watcher.wait(2 * delay) is not None:
+            return not self._stop_event.is_set()
+
+        self.missed += 1
+        return False
+
+    @staticmethod
+    def validate_config(config: dict):
+        """Checks whether the config of an a/d converter is valid. If the config does not contain valid information, a
+        exception will be raised.
+
+        :param config: (mandatory, dict) the config of the a/d converter
+        :raises ValueError: Config did not contain valid information
+        """
+
+        if config.get('mode', 'single-shot') not in ADSampler.MODES:
+            raise ValueError(f'Mode \'{config["mode"]}\' is not supported. Please select one: {", ".join(ADSampler.MODES)}')
+
+        if 'sps' in config and config['sps'] not in ADS1x15.spsADS1115:
+            raise ValueError(f'Samples per second \'{config["sps"]}\' are not supported. Please select one: '
+                             f'{", ".join(str(sps) for sps in ADS1x15.spsADS1115)}')
+
+        if config.get('mode', 'single-shot') == 'comparator' and 'alert-gpio' not in config:
+            raise ValueError('The comparator mode of the a/d converter requires the alert-gpio.')
+
+        if 'alert-gpio' in config and not isinstance(config['alert-gpio'], int):
+            raise ValueError('The alert-gpio of the a/d converter needs to be a gpio number.')
+
+        if 'buffer-size' in config and (not isinstance(config['buffer-size'], int) or config['buffer-size'] < 1):
+            raise ValueError('The buffer-size of the a/d converter needs to be a positive integer.')
+
+
+class ADAutoTuner:
+    """The ADAutoTuner learns the voltage range and the noise of single-ended channels from bursts of conversions. It
+    selects the narrowest programmable gain which does not clip the signal and the fastest data rate which still meets
+    the noise target of the channel. Narrowing the gain or speeding up the data rate requires several consecutive
+    bursts to agree, while a clipping or too noisy signal falls back immediately. The selected settings are stored in
+    a yaml file and restored after a restart."""
+
+    _instances = dict()
+
+    # the margin between the largest observed voltage and the full scale range of the gain
+    _HEADROOM = 1.25
+
+    # fraction of the full scale range from which on a conversion is considered to be clipped
+    _CLIPPING = 0.98
+
+    # number of consecutive bursts which need to agree before a setting is narrowed or sped up
+    _STABLE_CNT = 5
+
+    # weight of a new burst in the moving averages of the peak voltage and the noise
+    _ALPHA = 0.2
+
+    def __new__(cls, path: str = 'ad-tuning.yaml'):  # __new__ always a classmethod
+        """One tuner per file.
+
+        :param path: (optional, str) the yaml file the settings are stored in (Default: 'ad-tuning.yaml')
+        :return: ADAutoTuner
+        """
+
+        if path not in ADAutoTuner._instances:
+            tuner = super().__new__(cls)
+            tuner._path = path
+            tuner._lock = Lock()
+            # (address, channel) -> state of the channel
+            tuner._channels = dict()
+            tuner._stored = tuner._load()
+            ADAutoTuner._instances[path] = tuner
+        return ADAutoTuner._instances[path]
+
+    def register(self, address: int, channel: int, pga: int, sps: int, noise: float):
+        """Registers a channel for tuning.
+
+        :param address: (mandatory, hex) the i2c address of the a/d converter
+        :param channel: (mandatory, uint) the channel
+        :param pga: (mandatory, uint) Voltage gain used until the channel has been tuned
+        :param sps: (mandatory, uint) samples per second used until the channel has been tuned
+        :param noise: (mandatory, float) the max standard deviation of the conversions in mV
+        :return: (pga, sps) the settings to use
+        """
+
+        with self._lock:
+            stored = self._stored.get(address, dict()).get(channel, dict())
+            self._channels[(address, channel)] = {'pga': stored.get('pga', pga), 'sps': stored.get('sps', sps),
+                                                  'noise-target': noise, 'peak': None, 'noise-density': None,
+                                                  'candidate': None, 'votes': 0}
+            return self._settings(address, channel)
+
+    @classmethod
+    def clipped(cls, values: np.ndarray, pga: int):
+        """Checks whether a burst reached the full scale range of the gain. The actual voltage of a clipped burst is
+        unknown, it may be far beyond the range.
+
+        :param values: (mandatory, numpy.ndarray) the voltages of the burst in mV
+        :param pga: (mandatory, uint) Voltage gain the burst has been converted with
+        :return: bool
+        """
+
+        return float(np.max(np.abs(values))) >= cls._CLIPPING * pga
+
+    def update(self, address: int, channel: int, values: np.ndarray):
+        """Learns from a burst of conversions converted with the current settings of the channel and re-tunes it.
+
+        :param address: (mandatory, hex) the i2c address of the a/d converter
+        :param channel: (mandatory, uint) the channel
+        :param values: (mandatory, numpy.ndarray) the voltages of the burst in mV
+        :return: (pga, sps) the settings to use for the next burst
+        """
+
+        with self._lock:
+            state = self._channels[(address, channel)]
+            pgas = sorted(ADS1x15.pgaADS1x15)
+            rates = sorted(ADS1x15.spsADS1115)
+
+            peak = float(np.max(np.abs(values)))
+            # white noise scales with the square root of the data rate
+            density = float(np.std(values)) / np.sqrt(state['sps'])
+
+            # a clipped signal says nothing about the actual range, widen the gain immediately
+            if self.clipped(values, state['pga']):
+                wider = [pga for pga in pgas if pga > state['pga']]
+                if wider:
+                    self._apply(address, channel, wider[0], state['sps'])
+                    state['peak'] = None
+                return self._settings(address, channel)
+
+            # the peak follows rising voltages immediately and decays slowly
+            if state['peak'] is None or peak > state['peak']:
+                state['peak'] = peak
+            else:
+                state['peak'] += self._ALPHA * (peak - state['peak'])
+            if state['noise-density'] is None:
+                state['noise-density'] = density
+            else:
+                state['noise-density'] += self._ALPHA * (density - state['noise-density'])
+
+            pga = next((pga for pga in pgas if pga >= self._HEADROOM * state['peak']), pgas[-1])
+            sps = max([sps for sps in rates if state['noise-density'] * np.sqrt(sps) <= state['noise-target']],
+                      default=rates[0])
+
+            if (pga, sps) == (state['pga'], state['sps']):
+                state['votes'] = 0
+            elif pga >= state['pga'] and sps <= state['sps']:
+                # wider and slower is always safe
+                self._apply(address, channel, pga, sps)
+            else:
+                state['votes'] = state['votes'] + 1 if state['candidate'] == (pga, sps) else 1
+                state['candidate'] = (pga, sps)
+                if state['votes'] >= self._STABLE_CNT:
+                    self._apply(address, channel, pga, sps)
+
+            return self._settings(address, channel)
+
+    def _settings(self, address: int, channel: int):
+        """Returns the current (pga, sps) of the channel."""
+
+        state = self._channels[(address, channel)]
+        return state['pga'], state['sps']
+
+    def _apply(self, address: int, channel: int, pga: int, sps: int):
+        """Changes the settings of the channel and stores them."""
+
+        state = self._channels[(address, channel)]
+        state['pga'], state['sps'] = pga, sps
+        state['candidate'], state['votes'] = None, 0
+
+        self._stored.setdefault(address, dict())[channel] = {'pga': pga, 'sps': sps}
+        self._store()
+
+    def _load(self):
+        """Reads the stored settings.
+
+        :return: dict {address: {channel: {'pga': pga, 'sps': sps}}}
+        """
+
+        if not os.path.exists(self._path):
+            return dict()
+
+        with open(self._path, 'r') as document:
+            return yaml.safe_load(document) or dict()
+
+    def _store(self):
+        """Writes the settings, the file is replaced at once to never leave a partially written file behind."""
+
+        tmp_path = f'{self._path}.tmp'
+        with open(tmp_path, 'w') as document:
+            yaml.safe_dump(self._stored, document)
+        os.replace(tmp_path, self._path)
+
+
+if __name__ == '__main__':
+    # Throughput benchmark of the ADScanner compared to serial reads based on a simulated ADS1115
+    #   python -m sensors.ad_converter [chips] [sps]
+    import sys
+
+    class SimulatedADS1115:
+        """Register model of the ADS1115 with the interface of Adafruit_I2C. A single-shot conversion is started by
+        writing the config register with the OS bit set and takes 1/sps. Each transaction takes 0.2ms."""
+
+        _DATA_RATES = [8, 16, 32, 64, 128, 250, 475, 860]
+        _TRANSACTION_TIME = 0.0002
+
+        def __init__(self, value=0x4000):
+            self.registers = [value, 0x8583, 0x8000, 0x7FFF]
+            self.transactions = 0
+            self._done = 0
+
+        def writeList(self, reg, data):
+            if self._TRANSACTION_TIME:
+                time.sleep(self._TRANSACTION_TIME)
+            self.transactions += 1
+            self.registers[reg] = (data[0] << 8) | data[1]
+            if reg == 1 and data[0] & 0x80:
+                self._done = time.monotonic() + 1.0 / self._DATA_RATES[(self.registers[1] >> 5) & 0x07]
+
+        def readList(self, reg, length):
+            if self._TRANSACTION_TIME:
+                time.sleep(self._TRANSACTION_TIME)
+            self.transactions += 1
+            value = self.registers[reg]
+            if reg == 1:
+                value = (value & 0x7FFF) | (0x8000 if time.monotonic() >= self._done else 0)
+            return [(value >> 8) & 0xFF, value & 0xFF]
+
+        def readInto(self, regs, buffer):
+            # one combined transaction, the repeated starts take no extra round trip
+            if self._TRANSACTION_TIME:
+                time.sleep(self._TRANSACTION_TIME)
+            self.transactions += 1
+            offset = 0
+            for reg, length in regs:
+                value = self.registers[reg]
+                if reg == 1:
+                    value = (value & 0x7FFF) | (0x8000 if time.monotonic() >= self._done else 0)
+                buffer[offset:offset + 2] = bytes([(value >> 8) & 0xFF, value & 0xFF])
+                offset += length
+            return buffer
+
+    chip_cnt = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    sps = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    chips = [ADS1x15(address=0x48 + i, i2c=SimulatedADS1115()) for i in range(chip_cnt)]
+    channels = [(chip, channel) for chip in chips for channel in ADS1x15.CHANNELS]
+    rounds = 5
+
+    t0 = time.monotonic()
+    for i in range(rounds):
+        for chip, channel in channels:
+            chip.readADCSingleEnded(channel=channel, pga=4096, sps=sps)
+    serial = (time.monotonic() - t0) / rounds
+    transactions = sum(chip.i2c.transactions for chip in chips) / (rounds * len(channels))
+
+    scanner = ADScanner(channels, pga=4096, sps=sps)
+    t0 = time.monotonic()
+    for i in range(rounds):
+        scanner.scan()
+    pipelined = (time.monotonic() - t0) / rounds
+
+    print(f'### {len(channels)} channels on {chip_cnt} chips at {sps}sps')
+    print(f'serial    : {serial * 1000:.1f}ms per scan, {len(channels) / serial:.0f} channels/s, '
+          f'{transactions:.1f} transactions per read')
+    print(f'pipelined : {pipelined * 1000:.1f}ms per scan, {len(channels) / pipelined:.0f} channels/s')
+
+    # the sampler serves reads from its buffers while it owns the chip
+    sampler = ADSampler(chips[0], ADS1x15.CHANNELS, pga=4096, sps=860)
+    sampler.start()
+    time.sleep(0.5)
+    t0 = time.monotonic()
+    for i in range(1000):
+        sampler.read(i % len(ADS1x15.CHANNELS))
+    buffered = (time.monotonic() - t0) / 1000
+    sampler.stop()
+    sampler.join()
+    print(f'sampler   : {buffered * 1e6:.1f}us per read, {len(sampler.values(0))} values buffered per channel')
+
+    # CPU time per read without the time the chip needs for the conversions (which is the same for all variants)
+    import timeit
+    SimulatedADS1115._TRANSACTION_TIME = 0
+    chip = ADS1x15(address=0x48, i2c=SimulatedADS1115(value=0x4123))
+    chip._waitForConversion = lambda sps: chip._readConversion()
+    calls = 20000
+
+    built = timeit.timeit(lambda: chip._buildSingleEndedConfig(1, 4096, 860, False, False), number=calls) / calls
+    cached = timeit.timeit(lambda: chip._singleEndedConfig(1, 4096, 860), number=calls) / calls
+    print(f'config    : {built * 1e6:.2f}us built, {cached * 1e6:.2f}us cached')
+
+    def read_single():
+        return [chip.readADCSingleEnded(channel=channel, pga=4096, sps=860) for channel in ADS1x15.CHANNELS]
+
+    out = np.empty(len(ADS1x15.CHANNELS))
+    single = timeit.timeit(read_single, number=calls) / calls / len(ADS1x15.CHANNELS)
+    bulk = timeit.timeit(lambda: chip.read_channels(ADS1x15.CHANNELS, pga=4096, sps=860, out=out),
+                         number=calls) / calls / len(ADS1x15.CHANNELS)
+    assert np.allclose(out, read_single())
+
+    # the config register built on every read as before
+    chip._singleEndedConfig = lambda channel, pga, sps: chip._buildSingleEndedConfig(channel, pga, sps, False, False)
+    uncached = timeit.timeit(read_single, number=calls) / calls / len(ADS1x15.CHANNELS)
+    print(f'cpu/read  : {uncached * 1e6:.2f}us built config, {single * 1e6:.2f}us cached config, '
+          f'{bulk * 1e6:.2f}us read_channels()')
@@ -16,3 +16,9 @@ class SmartSensor():
         :return: dict
         """
         pass
+
+    @property
+    def bus_time(self):
+        """The expected time in seconds a measurement occupies the bus of the sensor (i2c or the data line). The
+        periodic measurements of the sensors are staggered by it, see Auxiliary.PhasePlan."""
+        return 0.0
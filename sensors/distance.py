@@ -1,9 +1,9 @@
 #!/usr/bin/python
 
-import sys
 import time
-import RPi.GPIO as GPIO
+import statistics
 
+from sensors import gpio
 from sensors.auxiliary import SmartSensor
 
 usleep = lambda x: time.sleep(x / 1000000.0)
@@ -27,78 +27,91 @@ class SeeedUltraSonicRanger(SmartSensor):
     # Therefore the max timeout range should be returned after 0.1029 seconds
     _TIMEOUT = 0.15
 
-    def __init__(self, pin):
+    # the min time between two measurements (to let the echoes of the previous ping fade away)
+    _CYCLE_TIME = 0.06
+
+    # speed of sound in m/s
+    _SPEED_OF_SOUND = 340
+
+    def __init__(self, pin, samples=1):
         """Constructor
 
         :param pin: (mandatory, int) pin number
+        :param samples: (optional, int) number of measurements per call of get_distance(), the median is returned
         """
 
         self._pin = pin
+        self._samples = samples
+
+    def _capture_edges(self, count: int):
+        """Captures the edges of the echo pulse. Each microsecond of the pulse is 0.17mm, backends without precise
+        edge time stamps (RPi.GPIO) have to poll the level for the duration of the pulse instead.
+
+        :param count: (mandatory, int) number of edges to capture
+        :return: list of (timestamp in ns, level after the edge) tuples
+        """
+
+        if gpio.precise_edges():
+            return gpio.capture_edges(self._pin, count=count, timeout=SeeedUltraSonicRanger._TIMEOUT)
+        return gpio.poll_edges(self._pin, count=count, timeout=SeeedUltraSonicRanger._TIMEOUT)
 
     def _get_distance(self):
         """Internal method to measure the distance with the ultra sonic ranger."""
 
-        # set the mode to GPIO pin layout
-        GPIO.setmode(GPIO.BCM)
-
         # set the channel as output
-        GPIO.setup(self._pin, GPIO.OUT)
+        gpio.setup(self._pin, gpio.OUT)
 
         # write a special activation sequence
         # Note: I have no idea why this has to be performed
-        GPIO.output(self._pin, GPIO.LOW)
+        gpio.output(self._pin, gpio.LOW)
         usleep(2)
-        GPIO.output(self._pin, GPIO.HIGH)
+        gpio.output(self._pin, gpio.HIGH)
         usleep(11)
-        GPIO.output(self._pin, GPIO.LOW)
-
-        # turn the chanel to in and wait for a response
-        GPIO.setup(self._pin, GPIO.IN)
-
-        # wait for any previous pulse to end
-        t0 = time.time()
-        while GPIO.input(self._pin):
-            if time.time() - t0 > SeeedUltraSonicRanger._TIMEOUT:
-                return None
-
-        # wait for the pulse to start
-        t0 = time.time()
-        while not GPIO.input(self._pin):
-            # wait .15 second at most
-            if time.time() - t0 > SeeedUltraSonicRanger._TIMEOUT:
-                return None
-
-        # wait for the pulse to stop
-        t1 = time.time()
-        while GPIO.input(self._pin):
-            # wait .15 second at most
-            if time.time() - t0 > SeeedUltraSonicRanger._TIMEOUT:
-                return None
-
-        # measure the time it took for the pulse to stop
-        t2 = time.time()
+        gpio.output(self._pin, gpio.LOW)
+
+        # turn the channel to in and sleep until the echo pulse started and stopped
+        edges = self._capture_edges(count=2)
+
+        # the end of any previous pulse has been captured, wait for the actual pulse
+        if edges and not edges[0][1]:
+            edges = edges[1:] + self._capture_edges(count=3 - len(edges))
+
+        if len(edges) < 2 or not edges[0][1] or edges[1][1]:
+            return None
 
         # calculate the length of the high signal in seconds
-        duration = t2 - t1
+        duration = (edges[1][0] - edges[0][0]) / 1e9
 
         # calculate the distance in m
         # time * speed of sound divided by 2 because the echo has to come back
-        distance = duration * 340 / 2
+        distance = duration * SeeedUltraSonicRanger._SPEED_OF_SOUND / 2
 
         # return the distance
         return distance
 
     def get_distance(self, retries=5):
-        """Measures the distance to the next object in m.
+        """Measures the distance to the next object in m. When configured with multiple samples, the median of the
+        valid measurements is returned.
 
+        :param retries: (optional, int) max number of failed measurements
         :return: distance in m
         """
 
-        for cnt in range(retries):
+        distances = list()
+        for cnt in range(self._samples + retries):
+            if cnt:
+                time.sleep(SeeedUltraSonicRanger._CYCLE_TIME)
             dist = self._get_distance()
             if dist:
-                return dist
-        return None
+                distances.append(dist)
+                if len(distances) == self._samples:
+                    break
+            elif cnt + 1 - len(distances) >= retries:
+                break
+
+        if not distances:
+            return None
+        return statistics.median(distances)
 
     def measure(self):
         """Performs a measurement and returns all available values in a dictionary.
@@ -0,0 +1,876 @@
+#!/usr/bin/python
+
+import os
+import abc
+import time
+import mmap
+import fcntl
+import select
+import struct
+from functools import partial
+from collections import deque
+from threading import Event, Lock
+
+# pin directions
+IN = 'in'
+OUT = 'out'
+
+# pin levels
+LOW = 0
+HIGH = 1
+
+# pull up/down resistors
+PUD_OFF = None
+PUD_UP = 'up'
+PUD_DOWN = 'down'
+
+# edges
+RISING = 'rising'
+FALLING = 'falling'
+BOTH = 'both'
+
+
+def validate_config(config: dict):
+    """Checks whether the optional gpio section of the config is valid.
+
+    example config:
+
+        gpio:
+          backend: gpiochip
+          chip: /dev/gpiochip0
+
+    or
+
+        gpio:
+          backend: mmap
+          path: /dev/gpiomem
+          soc: bcm2711
+
+    :param config: (mandatory, dict) the loaded config as dictionary
+    :raises ValueError: The configured backend is not supported
+    """
+
+    if 'gpio' not in config.keys():
+        return None
+
+    backend = config['gpio'].get('backend', RPiGpioBackend.NAME)
+    if backend not in _backends.keys():
+        raise ValueError(f"GPIO backend '{backend}' is not supported. Please select one of: "
+                         f"{', '.join(_backends.keys())}")
+
+
+def get_backend(config: dict):
+    """Creates the GPIO backend defined in the config. The RPi.GPIO backend is used when nothing is configured.
+
+    :param config: (mandatory, dict) the loaded config as dictionary
+    :return: GpioBackend
+    """
+
+    gpio_cfg = dict(config.get('gpio', dict()))
+    backend = gpio_cfg.pop('backend', RPiGpioBackend.NAME)
+    return _backends[backend](**gpio_cfg)
+
+
+def _poll_edges(read, count: int, timeout: float, edge: str = BOTH):
+    """Busy polls the level of a pin and time stamps every change.
+
+    :param read: (mandatory, callable) reader of the pin level, see GpioBackend.reader()
+    :param count: (mandatory, int) number of edges after which the polling stops
+    :param timeout: (mandatory, float) max time in seconds to poll
+    :param edge: (optional, str) RISING, FALLING or BOTH
+    :return: list of (timestamp in ns, level after the edge) tuples, may be shorter than count on timeout
+    """
+
+    now = time.monotonic_ns
+    deadline = now() + int(timeout * 1e9)
+
+    edges = list()
+    level = read()
+    while len(edges) < count:
+        cur = read()
+        if cur != level:
+            level = cur
+            if edge == BOTH or bool(cur) == (edge == RISING):
+                edges.append((now(), HIGH if cur else LOW))
+        elif now() > deadline:
+            break
+
+    return edges
+
+
+class GpioBackend():
+    """The GpioBackend is the super class of all GPIO implementations. The backends only perform the actual hardware
+    access, the bookkeeping of the pin configuration is done by the Gpio class."""
+
+    # whether the time stamps of capture_edges() resolve pulses of a few microseconds
+    PRECISE_EDGES = False
+
+    @abc.abstractmethod
+    def setup(self, pin: int, direction: str, pull: str = PUD_OFF, initial: int = None):
+        """Configures the direction of the pin.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param direction: (mandatory, str) IN or OUT
+        :param pull: (optional, str) PUD_OFF, PUD_UP or PUD_DOWN (inputs only)
+        :param initial: (optional, int) the initial level of an output
+        """
+        pass
+
+    @abc.abstractmethod
+    def output(self, pin: int, value: int):
+        """Sets the level of an output pin.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param value: (mandatory, int) HIGH or LOW
+        """
+        pass
+
+    @abc.abstractmethod
+    def input(self, pin: int):
+        """Reads the level of the pin.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :return: int HIGH or LOW
+        """
+        pass
+
+    def reader(self, pin: int):
+        """Returns a callable without arguments reading the level of the pin. Use it in tight polling loops to avoid
+        the lookup of the pin on every call. The result is truthy when the level is HIGH.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :return: callable
+        """
+
+        return partial(self.input, pin)
+
+    @abc.abstractmethod
+    def capture_edges(self, pin: int, count: int, timeout: float, edge: str = BOTH):
+        """Waits for edges on an input pin without busy polling.
+
+        :param pin: (mandatory, int) BCM number of the pin. The pin is already configured as input.
+        :param count: (mandatory, int) number of edges after which the capture stops
+        :param timeout: (mandatory, float) max time in seconds to wait for the edges
+        :param edge: (optional, str) RISING, FALLING or BOTH
+        :return: list of (timestamp in ns, level after the edge) tuples, may be shorter than count on timeout
+        """
+        pass
+
+    def watch_edges(self, pin: int, edge: str = BOTH):
+        """Subscribes to the edges of an input pin for repeated waits. Backends with interrupts keep the subscription
+        until the watcher is closed, hence no edge is missed in between two waits.
+
+        :param pin: (mandatory, int) BCM number of the pin. The pin is already configured as input.
+        :param edge: (optional, str) RISING, FALLING or BOTH
+        :return: EdgeWatcher
+        """
+
+        return EdgeWatcher(self, pin, edge)
+
+    def cleanup(self):
+        """Releases all resources of the backend."""
+        pass
+
+
+class EdgeWatcher():
+    """Subscription to the edges of an input pin, see GpioBackend.watch_edges(). This implementation captures the edges
+    on every wait() and therefore misses the edges in between two waits."""
+
+    def __init__(self, backend: GpioBackend, pin: int, edge: str):
+        """Constructor
+
+        :param backend: (mandatory, GpioBackend) the backend of the pin
+        :param pin: (mandatory, int) BCM number of the pin
+        :param edge: (mandatory, str) RISING, FALLING or BOTH
+        """
+
+        self.backend = backend
+        self.pin = pin
+        self.edge = edge
+
+    def wait(self, timeout: float):
+        """Waits for the next edge. An edge which occurred since the previous wait() is returned immediately, of
+        several only the latest one.
+
+        :param timeout: (mandatory, float) max time in seconds to wait
+        :return: (timestamp in ns, level after the edge) or None on timeout
+        """
+
+        edges = self.backend.capture_edges(self.pin, count=1, timeout=timeout, edge=self.edge)
+        return edges[-1] if edges else None
+
+    def clear(self):
+        """Drops the edges which occurred since the previous wait()."""
+        pass
+
+    def close(self):
+        """Ends the subscription."""
+        pass
+
+
+class RPiGpioBackend(GpioBackend):
+    """Backend using the RPi.GPIO library. Edge time stamps are taken in the event callback thread of RPi.GPIO, which
+    is too late for pulses shorter than a few hundred microseconds. Use Gpio.poll_edges() for those."""
+
+    NAME = 'RPi.GPIO'
+
+    def __init__(self):
+        """Constructor."""
+
+        import RPi.GPIO
+
+        self._gpio = RPi.GPIO
+        self._gpio.setmode(self._gpio.BCM)
+        self._gpio.setwarnings(False)
+
+        self._pulls = {PUD_OFF: self._gpio.PUD_OFF, PUD_UP: self._gpio.PUD_UP, PUD_DOWN: self._gpio.PUD_DOWN}
+        self._edges = {RISING: self._gpio.RISING, FALLING: self._gpio.FALLING, BOTH: self._gpio.BOTH}
+
+    def setup(self, pin: int, direction: str, pull: str = PUD_OFF, initial: int = None):
+        if direction == OUT:
+            if initial is None:
+                self._gpio.setup(pin, self._gpio.OUT)
+            else:
+                self._gpio.setup(pin, self._gpio.OUT, initial=initial)
+        else:
+            self._gpio.setup(pin, self._gpio.IN, pull_up_down=self._pulls[pull])
+
+    def output(self, pin: int, value: int):
+        self._gpio.output(pin, value)
+
+    def input(self, pin: int):
+        return self._gpio.input(pin)
+
+    def reader(self, pin: int):
+        return partial(self._gpio.input, pin)
+
+    def capture_edges(self, pin: int, count: int, timeout: float, edge: str = BOTH):
+        edges = list()
+        done = Event()
+
+        def on_edge(channel):
+            edges.append((time.monotonic_ns(), self._gpio.input(channel)))
+            if len(edges) >= count:
+                done.set()
+
+        self._gpio.add_event_detect(pin, self._edges[edge], callback=on_edge)
+        try:
+            done.wait(timeout)
+        finally:
+            self._gpio.remove_event_detect(pin)
+
+        return edges[:count]
+
+    def watch_edges(self, pin: int, edge: str = BOTH):
+        return _RPiGpioEdgeWatcher(self, pin, edge)
+
+    def cleanup(self):
+        self._gpio.cleanup()
+
+
+class _RPiGpioEdgeWatcher(EdgeWatcher):
+    """The event detection of RPi.GPIO stays enabled until the watcher is closed, the callback keeps the latest edge."""
+
+    def __init__(self, backend: RPiGpioBackend, pin: int, edge: str):
+        super().__init__(backend, pin, edge)
+
+        self._lock = Lock()
+        self._event = Event()
+        self._latest = None
+
+        backend._gpio.add_event_detect(pin, backend._edges[edge], callback=self._on_edge)
+
+    def _on_edge(self, channel):
+        edge = (time.monotonic_ns(), self.backend._gpio.input(channel))
+        with self._lock:
+            self._latest = edge
+            self._event.set()
+
+    def wait(self, timeout: float):
+        if not self._event.wait(timeout):
+            return None
+        with self._lock:
+            self._event.clear()
+            return self._latest
+
+    def clear(self):
+        with self._lock:
+            self._event.clear()
+
+    def close(self):
+        self.backend._gpio.remove_event_detect(self.pin)
+
+
+def _gpio_iowr(nr: int, size: int):
+    """Returns the number of a read/write ioctl of the gpio character device (linux/gpio.h)."""
+
+    return (3 << 30) | (size << 16) | (0xB4 << 8) | nr
+
+
+class GpioChipBackend(GpioBackend):
+    """Backend using the GPIO character device (/dev/gpiochipN) of the linux kernel. Edge events are time stamped by
+    the kernel in the interrupt handler and therefore do not suffer from the scheduling of python threads."""
+
+    NAME = 'gpiochip'
+    PRECISE_EDGES = True
+
+    # linux/gpio.h (ABI v1)
+    _GPIOHANDLES_MAX = 64
+    _GPIOHANDLE_REQUEST_INPUT = 1 << 0
+    _GPIOHANDLE_REQUEST_OUTPUT = 1 << 1
+    _GPIOHANDLE_REQUEST_BIAS_PULL_UP = 1 << 5
+    _GPIOHANDLE_REQUEST_BIAS_PULL_DOWN = 1 << 6
+    _GPIOHANDLE_REQUEST_BIAS_DISABLE = 1 << 7
+    _GPIOEVENT_REQUEST_RISING_EDGE = 1 << 0
+    _GPIOEVENT_REQUEST_FALLING_EDGE = 1 << 1
+    _GPIOEVENT_EVENT_RISING_EDGE = 0x01
+
+    # struct gpiohandle_request, struct gpioevent_request, struct gpiohandle_data and struct gpioevent_data
+    _HANDLE_REQUEST = struct.Struct(f'={_GPIOHANDLES_MAX}II{_GPIOHANDLES_MAX}B32sIi')
+    _EVENT_REQUEST = struct.Struct('=III32si')
+    _HANDLE_DATA_SIZE = _GPIOHANDLES_MAX
+    _EVENT_DATA = struct.Struct('=QI4x')
+
+    _GPIO_GET_LINEHANDLE_IOCTL = _gpio_iowr(0x03, _HANDLE_REQUEST.size)
+    _GPIO_GET_LINEEVENT_IOCTL = _gpio_iowr(0x04, _EVENT_REQUEST.size)
+    _GPIOHANDLE_GET_LINE_VALUES_IOCTL = _gpio_iowr(0x08, _HANDLE_DATA_SIZE)
+    _GPIOHANDLE_SET_LINE_VALUES_IOCTL = _gpio_iowr(0x09, _HANDLE_DATA_SIZE)
+
+    _CONSUMER = b'carlos'
+
+    def __init__(self, chip: str = '/dev/gpiochip0'):
+        """Constructor
+
+        :param chip: (optional, str) path to the gpio character device
+        """
+
+        self._chip_fd = os.open(chip, os.O_RDWR | os.O_CLOEXEC)
+
+        # line handle (or event) file descriptor per pin
+        self._line_fds = dict()
+        # pins requested for edge events
+        self._event_pins = dict()
+        # the last written output level and the configured pull per pin
+        self._levels = dict()
+        self._pulls = dict()
+
+        # reused buffer to read and write the line values
+        self._values = bytearray(self._HANDLE_DATA_SIZE)
+
+        # the edge flags of the event request
+        self._edge_flags = {RISING: self._GPIOEVENT_REQUEST_RISING_EDGE,
+                            FALLING: self._GPIOEVENT_REQUEST_FALLING_EDGE,
+                            BOTH: self._GPIOEVENT_REQUEST_RISING_EDGE | self._GPIOEVENT_REQUEST_FALLING_EDGE}
+
+    def _handle_flags(self, direction: str, pull: str):
+        """Returns the gpiohandle request flags of the given configuration."""
+
+        flags = self._GPIOHANDLE_REQUEST_OUTPUT if direction == OUT else self._GPIOHANDLE_REQUEST_INPUT
+        if direction == IN:
+            if pull == PUD_UP:
+                flags |= self._GPIOHANDLE_REQUEST_BIAS_PULL_UP
+            elif pull == PUD_DOWN:
+                flags |= self._GPIOHANDLE_REQUEST_BIAS_PULL_DOWN
+        return flags
+
+    def _release(self, pin: int):
+        """Releases the line of the pin to allow a new request."""
+
+        fd = self._line_fds.pop(pin, None)
+        self._event_pins.pop(pin, None)
+        if fd is not None:
+            os.close(fd)
+
+    def setup(self, pin: int, direction: str, pull: str = PUD_OFF, initial: int = None):
+        self._release(pin)
+
+        self._pulls[pin] = pull
+        if initial is not None:
+            self._levels[pin] = initial
+
+        offsets = [0] * self._GPIOHANDLES_MAX
+        offsets[0] = pin
+        defaults = [0] * self._GPIOHANDLES_MAX
+        defaults[0] = self._levels.get(pin, LOW)
+        request = bytearray(self._HANDLE_REQUEST.pack(*offsets, self._handle_flags(direction, pull), *defaults,
+                                                      self._CONSUMER, 1, 0))
+        fcntl.ioctl(self._chip_fd, self._GPIO_GET_LINEHANDLE_IOCTL, request, True)
+        self._line_fds[pin] = self._HANDLE_REQUEST.unpack(request)[-1]
+
+    def output(self, pin: int, value: int):
+        self._levels[pin] = value
+        self._values[0] = value
+        fcntl.ioctl(self._line_fds[pin], self._GPIOHANDLE_SET_LINE_VALUES_IOCTL, self._values, True)
+
+    def input(self, pin: int):
+        fcntl.ioctl(self._line_fds[pin], self._GPIOHANDLE_GET_LINE_VALUES_IOCTL, self._values, True)
+        return self._values[0]
+
+    def _request_events(self, pin: int, edge: str):
+        """Requests the line of the pin as input with edge events. An existing event request for the same edges is
+        reused and drained from stale events."""
+
+        if self._event_pins.get(pin) == edge:
+            fd = self._line_fds[pin]
+            while select.select([fd], [], [], 0)[0]:
+                os.read(fd, self._EVENT_DATA.size * 16)
+            return fd
+
+        self._release(pin)
+        request = bytearray(self._EVENT_REQUEST.pack(pin, self._handle_flags(IN, self._pulls.get(pin, PUD_OFF)),
+                                                     self._edge_flags[edge], self._CONSUMER, 0))
+        fcntl.ioctl(self._chip_fd, self._GPIO_GET_LINEEVENT_IOCTL, request, True)
+        fd = self._EVENT_REQUEST.unpack(request)[-1]
+        self._line_fds[pin] = fd
+        self._event_pins[pin] = edge
+        return fd
+
+    def watch_edges(self, pin: int, edge: str = BOTH):
+        return _GpioChipEdgeWatcher(self, pin, edge)
+
+    def capture_edges(self, pin: int, count: int, timeout: float, edge: str = BOTH):
+        fd = self._request_events(pin, edge)
+
+        edges = list()
+        poller = select.poll()
+        poller.register(fd, select.POLLIN | select.POLLPRI)
+        deadline = time.monotonic() + timeout
+        while len(edges) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not poller.poll(remaining * 1000):
+                break
+            data = os.read(fd, self._EVENT_DATA.size * (count - len(edges)))
+            for timestamp, event_id in self._EVENT_DATA.iter_unpack(data):
+                edges.append((timestamp, HIGH if event_id == self._GPIOEVENT_EVENT_RISING_EDGE else LOW))
+
+        return edges[:count]
+
+    def cleanup(self):
+        for pin in list(self._line_fds.keys()):
+            self._release(pin)
+        os.close(self._chip_fd)
+
+
+class _GpioChipEdgeWatcher(EdgeWatcher):
+    """The line is requested for edge events once, the kernel queues the time stamped edges in between two waits. The
+    line stays requested after the watcher is closed."""
+
+    def __init__(self, backend: GpioChipBackend, pin: int, edge: str):
+        super().__init__(backend, pin, edge)
+
+        self._fd = backend._request_events(pin, edge)
+        self._poller = select.poll()
+        self._poller.register(self._fd, select.POLLIN | select.POLLPRI)
+        self._size = GpioChipBackend._EVENT_DATA.size
+
+    def _read(self):
+        """Reads all queued events and returns the latest one or None."""
+
+        latest = None
+        while self._poller.poll(0):
+            data = os.read(self._fd, self._size * 16)
+            for timestamp, event_id in GpioChipBackend._EVENT_DATA.iter_unpack(data):
+                latest = timestamp, HIGH if event_id == GpioChipBackend._GPIOEVENT_EVENT_RISING_EDGE else LOW
+        return latest
+
+    def wait(self, timeout: float):
+        if not self._poller.poll(timeout * 1000):
+            return None
+        return self._read()
+
+    def clear(self):
+        self._read()
+
+
+class MmapGpioBackend(GpioBackend):
+    """Backend accessing the GPIO register block of the BCM283x/BCM2711 directly through a memory map of /dev/gpiomem.
+    The level register is read through a zero copy memoryview, which is several times faster than a call into
+    RPi.GPIO and therefore allows a much higher polling rate of bit banged protocols. Any regular file of at least
+    the size of the register block can be used instead of the device (e.g. to test the protocols). There are no
+    interrupts: capture_edges() polls the level register."""
+
+    NAME = 'mmap'
+    PRECISE_EDGES = True
+
+    # the register offsets in 32 bit words
+    _GPFSEL0 = 0x00 // 4
+    _GPSET0 = 0x1C // 4
+    _GPCLR0 = 0x28 // 4
+    _GPLEV0 = 0x34 // 4
+    _GPPUD = 0x94 // 4
+    _GPPUDCLK0 = 0x98 // 4
+    _GPIO_PUP_PDN_CNTRL_REG0 = 0xE4 // 4
+
+    # the size of the register block in bytes
+    _BLOCK_SIZE = 0xF4
+
+    # the function select values
+    _FSEL_INPUT = 0b000
+    _FSEL_OUTPUT = 0b001
+
+    # the pull values of the BCM2835 (GPPUD) and the BCM2711 (GPIO_PUP_PDN_CNTRL_REG)
+    _PULLS_BCM2835 = {PUD_OFF: 0b00, PUD_DOWN: 0b01, PUD_UP: 0b10}
+    _PULLS_BCM2711 = {PUD_OFF: 0b00, PUD_UP: 0b01, PUD_DOWN: 0b10}
+
+    def __init__(self, path: str = '/dev/gpiomem', soc: str = 'bcm2835'):
+        """Constructor
+
+        :param path: (optional, str) path to the gpio memory device or a file with the same layout
+        :param soc: (optional, str) bcm2835 (Pi 1-3) or bcm2711 (Pi 4), required to select the pull registers
+        """
+
+        if soc not in ('bcm2835', 'bcm2711'):
+            raise ValueError(f"SoC '{soc}' is not supported. Please select bcm2835 or bcm2711.")
+        self._bcm2711 = soc == 'bcm2711'
+
+        fd = os.open(path, os.O_RDWR | os.O_SYNC | os.O_CLOEXEC)
+        try:
+            # the gpiomem device reports a size of zero but allows to map one page
+            size = os.fstat(fd).st_size or mmap.PAGESIZE
+            if size < self._BLOCK_SIZE:
+                raise ValueError(f"'{path}' is too small to hold the GPIO register block.")
+            self._mmap = mmap.mmap(fd, size - size % 4, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+        # 32 bit word access to the registers
+        self._words = memoryview(self._mmap).cast('I')
+        self._lock = Lock()
+
+    def setup(self, pin: int, direction: str, pull: str = PUD_OFF, initial: int = None):
+        if direction == OUT and initial is not None:
+            self.output(pin, initial)
+
+        reg = self._GPFSEL0 + pin // 10
+        shift = (pin % 10) * 3
+        fsel = self._FSEL_OUTPUT if direction == OUT else self._FSEL_INPUT
+
+        # the function select registers are shared by ten pins
+        with self._lock:
+            self._words[reg] = (self._words[reg] & ~(0b111 << shift)) | (fsel << shift)
+            if direction == IN:
+                self._set_pull(pin, pull)
+
+    def _set_pull(self, pin: int, pull: str):
+        """Configures the pull up/down resistor of the pin."""
+
+        if self._bcm2711:
+            reg = self._GPIO_PUP_PDN_CNTRL_REG0 + pin // 16
+            shift = (pin % 16) * 2
+            self._words[reg] = (self._words[reg] & ~(0b11 << shift)) | (self._PULLS_BCM2711[pull] << shift)
+        else:
+            # control signal, then clock it into the pin, both have to be held for 150 cycles
+            self._words[self._GPPUD] = self._PULLS_BCM2835[pull]
+            time.sleep(0.00001)
+            self._words[self._GPPUDCLK0 + pin // 32] = 1 << (pin % 32)
+            time.sleep(0.00001)
+            self._words[self._GPPUD] = 0
+            self._words[self._GPPUDCLK0 + pin // 32] = 0
+
+    def output(self, pin: int, value: int):
+        # the set and clear registers only affect the pins written as 1, no lock needed
+        self._words[(self._GPSET0 if value else self._GPCLR0) + pin // 32] = 1 << (pin % 32)
+
+    def input(self, pin: int):
+        return (self._words[self._GPLEV0 + pin // 32] >> (pin % 32)) & 1
+
+    def reader(self, pin: int):
+        words = self._words
+        reg = self._GPLEV0 + pin // 32
+        mask = 1 << (pin % 32)
+        return lambda: words[reg] & mask
+
+    def capture_edges(self, pin: int, count: int, timeout: float, edge: str = BOTH):
+        return _poll_edges(self.reader(pin), count, timeout, edge)
+
+    def cleanup(self):
+        self._words.release()
+        self._mmap.close()
+
+
+class FakeGpioBackend(GpioBackend):
+    """In memory backend to run the code without any hardware. Inputs can be driven by set_input() and edges can be
+    queued with queue_edges(). All writes are recorded in the outputs list."""
+
+    NAME = 'fake'
+    PRECISE_EDGES = True
+
+    def __init__(self):
+        """Constructor."""
+
+        self.directions = dict()
+        self.levels = dict()
+        self.outputs = list()
+        self.setup_cnt = 0
+        self._edges = dict()
+
+    def setup(self, pin: int, direction: str, pull: str = PUD_OFF, initial: int = None):
+        self.setup_cnt += 1
+        self.directions[pin] = direction
+        if initial is not None:
+            self.levels[pin] = initial
+        elif direction == IN and pull is not PUD_OFF:
+            self.levels[pin] = HIGH if pull == PUD_UP else LOW
+
+    def output(self, pin: int, value: int):
+        self.levels[pin] = value
+        self.outputs.append((pin, value))
+
+    def input(self, pin: int):
+        return self.levels.get(pin, LOW)
+
+    def set_input(self, pin: int, value: int):
+        """Drives the level of the pin from outside.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param value: (mandatory, int) HIGH or LOW
+        """
+
+        self.levels[pin] = value
+
+    def queue_edges(self, pin: int, edges: list):
+        """Queues edges which are returned by the next capture_edges() call of the pin.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param edges: (mandatory, list) list of (timestamp in ns, level after the edge) tuples
+        """
+
+        self._edges.setdefault(pin, deque()).append(list(edges))
+
+    def capture_edges(self, pin: int, count: int, timeout: float, edge: str = BOTH):
+        queued = self._edges.get(pin)
+        if not queued:
+            return list()
+
+        edges = [e for e in queued.popleft() if edge == BOTH or (e[1] == HIGH) == (edge == RISING)]
+        if edges:
+            self.levels[pin] = edges[-1][1]
+        return edges[:count]
+
+
+_backends = {RPiGpioBackend.NAME: RPiGpioBackend,
+             GpioChipBackend.NAME: GpioChipBackend,
+             MmapGpioBackend.NAME: MmapGpioBackend,
+             FakeGpioBackend.NAME: FakeGpioBackend}
+
+
+class Gpio():
+    """The Gpio owns the registry of all used pins and forwards the pin access to the selected backend. A pin is only
+    reconfigured when its direction (or pull) actually changes."""
+
+    def __init__(self, backend: GpioBackend):
+        """Constructor
+
+        :param backend: (mandatory, GpioBackend) the backend performing the hardware access
+        """
+
+        self.backend = backend
+
+        # configuration per pin: (direction, pull)
+        self._pins = dict()
+        self._lock = Lock()
+
+    def setup(self, pin: int, direction: str, pull: str = PUD_OFF, initial: int = None):
+        """Configures the pin, unless it is already configured the same way.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param direction: (mandatory, str) IN or OUT
+        :param pull: (optional, str) PUD_OFF, PUD_UP or PUD_DOWN (inputs only)
+        :param initial: (optional, int) the initial level of an output
+        """
+
+        with self._lock:
+            if self._pins.get(pin) == (direction, pull):
+                if initial is not None:
+                    self.backend.output(pin, initial)
+                return
+            self.backend.setup(pin, direction, pull, initial)
+            self._pins[pin] = (direction, pull)
+
+    def output(self, pin: int, value: int):
+        """Sets the level of an output pin.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param value: (mandatory, int) HIGH or LOW
+        """
+
+        self.backend.output(pin, value)
+
+    def input(self, pin: int):
+        """Reads the level of the pin.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :return: int HIGH or LOW
+        """
+
+        return self.backend.input(pin)
+
+    def reader(self, pin: int):
+        """Returns a callable without arguments reading the level of the pin. See GpioBackend.reader().
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :return: callable
+        """
+
+        return self.backend.reader(pin)
+
+    def capture_edges(self, pin: int, count: int, timeout: float, edge: str = BOTH, pull: str = PUD_OFF):
+        """Configures the pin as input and waits for edges without busy polling.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param count: (mandatory, int) number of edges after which the capture stops
+        :param timeout: (mandatory, float) max time in seconds to wait for the edges
+        :param edge: (optional, str) RISING, FALLING or BOTH
+        :param pull: (optional, str) PUD_OFF, PUD_UP or PUD_DOWN
+        :return: list of (timestamp in ns, level after the edge) tuples, may be shorter than count on timeout
+        """
+
+        self.setup(pin, IN, pull)
+        return self.backend.capture_edges(pin, count, timeout, edge)
+
+    def watch_edges(self, pin: int, edge: str = BOTH, pull: str = PUD_OFF):
+        """Configures the pin as input and subscribes to its edges, see GpioBackend.watch_edges(). Close the returned
+        watcher before the pin is used otherwise.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param edge: (optional, str) RISING, FALLING or BOTH
+        :param pull: (optional, str) PUD_OFF, PUD_UP or PUD_DOWN
+        :return: EdgeWatcher
+        """
+
+        self.setup(pin, IN, pull)
+        return self.backend.watch_edges(pin, edge)
+
+    def poll_edges(self, pin: int, count: int, timeout: float, edge: str = BOTH, pull: str = PUD_OFF):
+        """Configures the pin as input and busy polls its level via reader(). Blocks a CPU core for the duration of
+        the capture, but resolves short pulses with backends whose capture_edges() is not PRECISE_EDGES.
+
+        :param pin: (mandatory, int) BCM number of the pin
+        :param count: (mandatory, int) number of edges after which the capture stops
+        :param timeout: (mandatory, float) max time in seconds to poll
+        :param edge: (optional, str) RISING, FALLING or BOTH
+        :param pull: (optional, str) PUD_OFF, PUD_UP or PUD_DOWN
+        :return: list of (timestamp in ns, level after the edge) tuples, may be shorter than count on timeout
+        """
+
+        self.setup(pin, IN, pull)
+        return _poll_edges(self.backend.reader(pin), count, timeout, edge)
+
+    def cleanup(self):
+        """Releases all pins."""
+
+        with self._lock:
+            self.backend.cleanup()
+            self._pins = dict()
+
+
+_gpio = None
+_gpio_lock = Lock()
+
+
+def get_gpio():
+    """Returns the process wide Gpio. The RPi.GPIO backend is used unless set_backend() has been called before.
+
+    :return: Gpio
+    """
+
+    global _gpio
+    with _gpio_lock:
+        if _gpio is None:
+            _gpio = Gpio(RPiGpioBackend())
+        return _gpio
+
+
+def set_backend(backend: GpioBackend):
+    """Selects the backend of the process wide Gpio. Must be called before any pin is used.
+
+    :param backend: (mandatory, GpioBackend) the backend performing the hardware access
+    :return: Gpio
+    """
+
+    global _gpio
+    with _gpio_lock:
+        _gpio = Gpio(backend)
+        return _gpio
+
+
+def setup(pin: int, direction: str, pull: str = PUD_OFF, initial: int = None):
+    """Configures the pin of the process wide Gpio. See Gpio.setup()."""
+
+    get_gpio().setup(pin, direction, pull, initial)
+
+
+def output(pin: int, value: int):
+    """Sets the level of an output pin of the process wide Gpio. See Gpio.output()."""
+
+    get_gpio().backend.output(pin, value)
+
+
+def input(pin: int):
+    """Reads the level of the pin of the process wide Gpio. See Gpio.input()."""
+
+    return get_gpio().backend.input(pin)
+
+
+def reader(pin: int):
+    """Returns a fast level reader of the pin of the process wide Gpio. See Gpio.reader()."""
+
+    return get_gpio().reader(pin)
+
+
+def capture_edges(pin: int, count: int, timeout: float, edge: str = BOTH, pull: str = PUD_OFF):
+    """Waits for edges on the pin of the process wide Gpio. See Gpio.capture_edges()."""
+
+    return get_gpio().capture_edges(pin, count, timeout, edge, pull)
+
+
+def watch_edges(pin: int, edge: str = BOTH, pull: str = PUD_OFF):
+    """Subscribes to the edges of the pin of the process wide Gpio. See Gpio.watch_edges()."""
+
+    return get_gpio().watch_edges(pin, edge, pull)
+
+
+def poll_edges(pin: int, count: int, timeout: float, edge: str = BOTH, pull: str = PUD_OFF):
+    """Busy polls the edges on the pin of the process wide Gpio. See Gpio.poll_edges()."""
+
+    return get_gpio().poll_edges(pin, count, timeout, edge, pull)
+
+
+def precise_edges():
+    """Returns whether capture_edges() of the process wide Gpio resolves pulses of a few microseconds.
+
+    :return: bool
+    """
+
+    return get_gpio().backend.PRECISE_EDGES
+
+
+if __name__ == '__main__':
+    # Benchmark of the per call overhead of the HAL compared to plain RPi.GPIO
+    #   python -m sensors.gpio [pin] [backend]
+    import sys
+    import timeit
+
+    pin = int(sys.argv[1]) if len(sys.argv) > 1 else 17
+    name = sys.argv[2] if len(sys.argv) > 2 else RPiGpioBackend.NAME
+    calls = 100000
+
+    hal = set_backend(_backends[name]())
+    hal.setup(pin, OUT)
+
+    results = dict()
+    if name == RPiGpioBackend.NAME:
+        import RPi.GPIO as GPIO
+        results['RPi.GPIO.setup(OUT)'] = timeit.timeit(lambda: GPIO.setup(pin, GPIO.OUT), number=calls)
+        results['RPi.GPIO.output()'] = timeit.timeit(lambda: GPIO.output(pin, GPIO.LOW), number=calls)
+        results['RPi.GPIO.input()'] = timeit.timeit(lambda: GPIO.input(pin), number=calls)
+    results['gpio.setup(OUT)'] = timeit.timeit(lambda: setup(pin, OUT), number=calls)
+    results['gpio.output()'] = timeit.timeit(lambda: output(pin, LOW), number=calls)
+    results['gpio.input()'] = timeit.timeit(lambda: input(pin), number=calls)
+    read = reader(pin)
+    results['gpio.reader()()'] = timeit.timeit(read, number=calls)
+
+    print(f'### {name} backend, {calls} calls each')
+    for call, duration in results.items():
+        print(f'{call.ljust(22)} : {duration / calls * 1e6:.3f}us per call')
+    hal.cleanup()
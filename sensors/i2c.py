@@ -1,19 +1,530 @@
 #!/usr/bin/python
 
 import re
+import time
+import atexit
+import ctypes
+import heapq
+import itertools
 import smbus2
-from threading import RLock
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Lock, RLock, Thread
 
+# priorities of the transactions of the I2CBusScheduler, lower values are executed first
+PRIORITY_CONTROL = 0
+PRIORITY_TELEMETRY = 10
 
-class i2cLock():
-    """Use this i2c lock to prevent simultaneous access of the i2c bus by different threads."""
+# the supported methods of smbus2.SMBus taking the address as first argument
+SMBUS_OPERATIONS = ['read_byte', 'write_byte', 'read_byte_data', 'write_byte_data', 'read_word_data',
+                    'write_word_data', 'read_i2c_block_data', 'write_i2c_block_data']
+
+# execute the transactions by the I2CBusScheduler of each bus
+_scheduling = False
+
+
+def validate_config(config: dict):
+    """Checks the optional 'i2c' section of the config.
+
+    example config:
+
+        i2c:
+          scheduler: true
+
+    :param config: (mandatory, dict) the loaded config as dictionary
+    :raises ValueError: Config did not contain valid information
+    """
+
+    i2c_cfg = config.get('i2c', dict())
+    if not isinstance(i2c_cfg.get('scheduler', False), bool):
+        raise ValueError('The scheduler of the i2c section needs to be true or false.')
+
+
+def configure(config: dict):
+    """Applies the optional 'i2c' section of the config. Call it before any device is created.
+
+    :param config: (mandatory, dict) the loaded config as dictionary
+    """
+
+    global _scheduling
+    _scheduling = config.get('i2c', dict()).get('scheduler', False)
+
+
+def open_bus(busnum: int, priority: int = PRIORITY_TELEMETRY):
+    """Returns a handle of the bus with the interface of smbus2.SMBus. With the scheduler enabled, the transactions are
+    executed by the I2CBusScheduler of the bus.
+
+    :param busnum: (mandatory, int) number of the i2c bus
+    :param priority: (optional, int) priority of the transactions (Default: PRIORITY_TELEMETRY)
+    :return: SharedSMBus or ScheduledSMBus
+    """
+
+    if _scheduling:
+        return ScheduledSMBus(get_scheduler(busnum), priority)
+    return SMBusPool().acquire(busnum)
+
+
+_schedulers = dict()
+_schedulers_lock = Lock()
+
+
+def get_scheduler(busnum: int):
+    """Returns the running I2CBusScheduler of the bus.
+
+    :param busnum: (mandatory, int) number of the i2c bus
+    :return: I2CBusScheduler
+    """
+
+    with _schedulers_lock:
+        if busnum not in _schedulers:
+            _schedulers[busnum] = I2CBusScheduler(busnum)
+            _schedulers[busnum].start()
+        return _schedulers[busnum]
+
+
+class DeviceLock():
+    """Reentrant lock of a single i2c device, which records how long the threads wait for and hold it."""
+
+    def __init__(self, name: str):
+        """Constructor
+
+        :param name: (mandatory, str) name of the lock used in the statistics
+        """
+
+        self.name = name
+
+        self._lock = RLock()
+        # depth of the reentrant acquisitions and the time of the outermost one
+        self._depth = 0
+        self._acquired = 0
+
+        # statistics, only changed while the lock is held
+        self._cnt = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._hold_total = 0.0
+        self._hold_max = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1):
+        """Acquires the lock, see threading.RLock.acquire()."""
+
+        start = time.perf_counter()
+        if not self._lock.acquire(blocking, timeout):
+            return False
+
+        self._depth += 1
+        if self._depth == 1:
+            self._acquired = time.perf_counter()
+            wait = self._acquired - start
+            self._cnt += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        return True
+
+    def release(self):
+        """Releases the lock, see threading.RLock.release()."""
+
+        self._depth -= 1
+        if self._depth == 0:
+            hold = time.perf_counter() - self._acquired
+            self._hold_total += hold
+            self._hold_max = max(self._hold_max, hold)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def get_statistics(self):
+        """Returns the statistics of the lock.
+
+        :return: dict with the number of acquisitions, the total and max wait and hold times in seconds
+        """
+
+        return {'acquisitions': self._cnt,
+                'wait-total': self._wait_total, 'wait-max': self._wait_max,
+                'hold-total': self._hold_total, 'hold-max': self._hold_max}
+
+
+class I2CLockManager():
+    """The I2CLockManager hands out one lock per i2c device, identified by bus number and address. Transactions of
+    different devices do not wait for each other, the kernel already serializes the transfers of a bus. The lock of a
+    device only keeps sequences of transactions to the device together (e.g. starting a conversion and reading its
+    result). A bus lock is only needed by devices sharing one handle of the bus, because the address of the
+    transactions is a property of the handle."""
+
+    instance = None
+
+    def __new__(cls):  # __new__ always a classmethod
+        if not I2CLockManager.instance:
+            I2CLockManager.instance = super().__new__(cls)
+            I2CLockManager.instance._lock = Lock()
+            I2CLockManager.instance._device_locks = dict()
+            I2CLockManager.instance._bus_locks = dict()
+        return I2CLockManager.instance
+
+    def get_lock(self, address: int, busnum: int):
+        """Returns the lock of the device.
+
+        :param address: (mandatory, hex) i2c address of the device
+        :param busnum: (mandatory, int) number of the i2c bus
+        :return: DeviceLock
+        """
+
+        with self._lock:
+            if (busnum, address) not in self._device_locks:
+                self._device_locks[(busnum, address)] = DeviceLock(name=f'i2c-{busnum}-0x{address:02X}')
+            return self._device_locks[(busnum, address)]
+
+    def get_bus_lock(self, busnum: int):
+        """Returns the lock of the bus for devices which share a handle of the bus.
+
+        :param busnum: (mandatory, int) number of the i2c bus
+        :return: DeviceLock
+        """
+
+        with self._lock:
+            if busnum not in self._bus_locks:
+                self._bus_locks[busnum] = DeviceLock(name=f'i2c-{busnum}')
+            return self._bus_locks[busnum]
+
+    def get_statistics(self):
+        """Returns the statistics of all locks.
+
+        :return: dict with the names of the locks as keys and their statistics as values
+        """
+
+        with self._lock:
+            locks = list(self._device_locks.values()) + list(self._bus_locks.values())
+        return {lock.name: lock.get_statistics() for lock in locks}
+
+
+class SMBusPool():
+    """The SMBusPool opens one smbus2.SMBus per bus number, which is shared by all devices of the bus. The handles are
+    reference counted and closed when the last device released it or at exit."""
 
     instance = None
 
     def __new__(cls):  # __new__ always a classmethod
-        if not i2cLock.instance:
-            i2cLock.instance = RLock()
-        return i2cLock.instance
+        if not SMBusPool.instance:
+            SMBusPool.instance = super().__new__(cls)
+            SMBusPool.instance._lock = Lock()
+            SMBusPool.instance._buses = dict()
+            SMBusPool.instance._references = dict()
+            atexit.register(SMBusPool.instance.close_all)
+        return SMBusPool.instance
+
+    def acquire(self, busnum: int):
+        """Returns a handle of the bus, the bus is opened by the first call.
+
+        :param busnum: (mandatory, int) number of the i2c bus
+        :return: SharedSMBus
+        """
+
+        with self._lock:
+            if busnum not in self._buses:
+                self._buses[busnum] = smbus2.SMBus(busnum)
+                self._references[busnum] = 0
+            self._references[busnum] += 1
+            return SharedSMBus(busnum, self._buses[busnum])
+
+    def release(self, busnum: int):
+        """Releases a handle of the bus, the bus is closed with the last handle.
+
+        :param busnum: (mandatory, int) number of the i2c bus
+        """
+
+        with self._lock:
+            if busnum not in self._buses:
+                return
+            self._references[busnum] -= 1
+            if self._references[busnum] <= 0:
+                self._buses.pop(busnum).close()
+                del self._references[busnum]
+
+    def close_all(self):
+        """Closes all buses."""
+
+        with self._lock:
+            for bus in self._buses.values():
+                bus.close()
+            self._buses.clear()
+            self._references.clear()
+
+    def get_statistics(self):
+        """Returns the number of handles of each open bus.
+
+        :return: dict with the bus numbers as keys
+        """
+
+        with self._lock:
+            return dict(self._references)
+
+
+class SharedSMBus():
+    """Handle of a bus of the SMBusPool with the interface of smbus2.SMBus. The address is a property of the shared
+    smbus2.SMBus which is set before each transaction, hence every transaction holds the bus lock."""
+
+    def __init__(self, busnum: int, bus: smbus2.SMBus):
+        """Constructor
+
+        :param busnum: (mandatory, int) number of the i2c bus
+        :param bus: (mandatory, smbus2.SMBus) the shared handle of the bus
+        """
+
+        self.busnum = busnum
+        self._bus = bus
+        self._bus_lock = I2CLockManager().get_bus_lock(busnum)
+        self._closed = False
+
+    def __getattr__(self, operation):
+        if operation not in SMBUS_OPERATIONS:
+            raise AttributeError(f'{operation} is not supported by the SharedSMBus.')
+        method = getattr(self._bus, operation)
+
+        def transaction(address, *args):
+            with self._bus_lock:
+                return method(address, *args)
+        return transaction
+
+    def i2c_rdwr(self, *messages):
+        """Executes the smbus2.i2c_msg messages in one combined transaction.
+
+        :param messages: the smbus2.i2c_msg messages
+        """
+
+        with self._bus_lock:
+            return self._bus.i2c_rdwr(*messages)
+
+    def close(self):
+        """Releases the handle, the bus is closed with the last handle."""
+
+        if not self._closed:
+            self._closed = True
+            SMBusPool().release(self.busnum)
+
+
+class I2CRequest():
+    """Transactions of a device submitted to the I2CBusScheduler."""
+
+    def __init__(self, address: int, transactions: list, priority: int, batch: bool):
+        """Constructor
+
+        :param address: (mandatory, hex) i2c address of the device
+        :param transactions: (mandatory, list) list of (name of the smbus2.SMBus method, arguments) tuples
+        :param priority: (mandatory, int) priority of the transactions
+        :param batch: (mandatory, bool) the future returns the list of all results instead of the single result
+        """
+
+        self.address = address
+        self.transactions = transactions
+        self.priority = priority
+        self.batch = batch
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+
+class I2CBusScheduler(Thread):
+    """The I2CBusScheduler owns the handle of an i2c bus and executes the transactions of all devices. Transactions are
+    executed in the order of their priority and of their submission within the same priority. Adjacent requests of the
+    same device and priority are executed in a batch without switching the address of the handle. The submitting
+    thread gets a future of the result."""
+
+    # number of latencies per priority kept for the statistics
+    _LATENCIES_CNT = 1000
+
+    # max number of requests executed in a batch
+    _BATCH_SIZE = 8
+
+    def __init__(self, busnum: int, bus=None):
+        """Constructor
+
+        :param busnum: (mandatory, int) number of the i2c bus
+        :param bus: (optional, smbus2.SMBus) the handle of the bus, acquired from the SMBusPool by default (e.g. a
+        simulation)
+        """
+
+        super().__init__(name=f'I2CBusScheduler_{busnum}', daemon=True)
+
+        self.busnum = busnum
+        self._bus = SMBusPool().acquire(busnum) if bus is None else bus
+
+        # heap of (priority, sequence number, request)
+        self._condition = Condition()
+        self._heap = list()
+        self._sequence = itertools.count()
+        self._stopped = False
+
+        # statistics
+        self._start_time = time.monotonic()
+        self._busy = 0.0
+        self._executed_cnt = 0
+        self._batch_cnt = 0
+        self._latencies = dict()
+
+    def submit(self, address: int, operation: str, *args, priority: int = PRIORITY_TELEMETRY):
+        """Submits a transaction.
+
+        :param address: (mandatory, hex) i2c address of the device
+        :param operation: (mandatory, str) name of the smbus2.SMBus method, e.g. 'read_i2c_block_data'
+        :param args: the arguments of the method following the address
+        :param priority: (optional, int) priority of the transaction (Default: PRIORITY_TELEMETRY)
+        :return: concurrent.futures.Future of the result
+        """
+
+        return self._push(I2CRequest(address, [(operation, args)], priority, batch=False))
+
+    def submit_batch(self, address: int, transactions: list, priority: int = PRIORITY_TELEMETRY):
+        """Submits transactions which are executed one after another without other transactions in between.
+
+        :param address: (mandatory, hex) i2c address of the device
+        :param transactions: (mandatory, list) list of (name of the smbus2.SMBus method, arguments) tuples
+        :param priority: (optional, int) priority of the transactions (Default: PRIORITY_TELEMETRY)
+        :return: concurrent.futures.Future of the list of results
+        """
+
+        return self._push(I2CRequest(address, list(transactions), priority, batch=True))
+
+    def _push(self, request: I2CRequest):
+        """Queues the request and wakes the scheduler."""
+
+        with self._condition:
+            heapq.heappush(self._heap, (request.priority, next(self._sequence), request))
+            self._condition.notify()
+        return request.future
+
+    def stop(self):
+        """Stops the scheduler once all queued requests have been executed."""
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def run(self):
+        """The Thread method."""
+
+        while True:
+            with self._condition:
+                while not self._heap and not self._stopped:
+                    self._condition.wait()
+                if not self._heap:
+                    if isinstance(self._bus, SharedSMBus):
+                        self._bus.close()
+                    return
+
+                batch = [heapq.heappop(self._heap)[2]]
+                while self._heap and len(batch) < self._BATCH_SIZE and \
+                        self._heap[0][0] == batch[0].priority and self._heap[0][2].address == batch[0].address:
+                    batch.append(heapq.heappop(self._heap)[2])
+
+            start = time.perf_counter()
+            latencies = list()
+            for request in batch:
+                if not request.future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    results = [self._execute(request.address, operation, args)
+                               for operation, args in request.transactions]
+                except Exception as e:
+                    request.future.set_exception(e)
+                else:
+                    request.future.set_result(results if request.batch else results[0])
+                latencies.append((request.priority, time.monotonic() - request.submitted))
+
+            with self._condition:
+                self._busy += time.perf_counter() - start
+                self._batch_cnt += 1
+                self._executed_cnt += len(latencies)
+                for priority, latency in latencies:
+                    self._latencies.setdefault(priority, deque(maxlen=self._LATENCIES_CNT)).append(latency)
+
+    def _execute(self, address: int, operation: str, args: tuple):
+        """Executes a transaction on the bus, the messages of i2c_rdwr carry their addresses themselves."""
+
+        if operation == 'i2c_rdwr':
+            return self._bus.i2c_rdwr(*args)
+        return getattr(self._bus, operation)(address, *args)
+
+    def get_statistics(self):
+        """Returns the statistics of the scheduler as dictionary. The latencies from the submission until the
+        completion of the requests are given per priority.
+
+        :return: dict
+        """
+
+        with self._condition:
+            stats = {
+                'queue-depth': len(self._heap),
+                'executed-requests': self._executed_cnt,
+                'batches': self._batch_cnt,
+                'utilization': self._busy / max(time.monotonic() - self._start_time, 1e-9),
+            }
+            latencies = {priority: sorted(values) for priority, values in self._latencies.items()}
+
+        for priority, values in latencies.items():
+            stats[f'latency-median-{priority}'] = values[len(values) // 2]
+            stats[f'latency-p95-{priority}'] = values[int(0.95 * (len(values) - 1))]
+            stats[f'latency-max-{priority}'] = values[-1]
+
+        return stats
+
+
+class ScheduledSMBus():
+    """Handle with the interface of smbus2.SMBus, which lets the I2CBusScheduler execute the transactions and waits for
+    their results."""
+
+    def __init__(self, scheduler: I2CBusScheduler, priority: int):
+        """Constructor
+
+        :param scheduler: (mandatory, I2CBusScheduler) the scheduler of the bus
+        :param priority: (mandatory, int) priority of the transactions
+        """
+
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def __getattr__(self, operation):
+        if operation not in SMBUS_OPERATIONS:
+            raise AttributeError(f'{operation} is not supported by the ScheduledSMBus.')
+
+        def transaction(address, *args):
+            return self.scheduler.submit(address, operation, *args, priority=self.priority).result()
+        return transaction
+
+    def i2c_rdwr(self, *messages):
+        """Executes the smbus2.i2c_msg messages in one combined transaction.
+
+        :param messages: the smbus2.i2c_msg messages
+        """
+
+        return self.scheduler.submit(messages[0].addr, 'i2c_rdwr', *messages, priority=self.priority).result()
+
+    def batch(self, address: int, transactions: list):
+        """Executes the transactions one after another without other transactions in between.
+
+        :param address: (mandatory, hex) i2c address of the device
+        :param transactions: (mandatory, list) list of (name of the smbus2.SMBus method, arguments) tuples
+        :return: list of results
+        """
+
+        return self.scheduler.submit_batch(address, transactions, priority=self.priority).result()
+
+
+class i2cLock():
+    """Use this i2c lock to prevent simultaneous access of an i2c device by different threads."""
+
+    def __new__(cls, address: int, busnum: int = -1):  # __new__ always a classmethod
+        """Returns the lock of the device.
+
+        :param address: (mandatory, hex) i2c address of the device
+        :param busnum: (optional, int) number of the i2c bus, auto-detected by default
+        :return: DeviceLock
+        """
+
+        return I2CLockManager().get_lock(address, busnum if busnum >= 0 else Adafruit_I2C.getPiI2CBusNumber())
 
 # ===========================================================================
 # Adafruit_I2C Class
@@ -22,9 +533,19 @@ class i2cLock():
 
 class Adafruit_I2C(object):
 
+    # revision of the Raspberry Pi board, read once by getPiRevision()
+    _piRevision = None
+
     @staticmethod
     def getPiRevision():
         "Gets the version number of the Raspberry Pi board"
+        if Adafruit_I2C._piRevision is None:
+            Adafruit_I2C._piRevision = Adafruit_I2C._readPiRevision()
+        return Adafruit_I2C._piRevision
+
+    @staticmethod
+    def _readPiRevision():
+        "Reads the version number of the Raspberry Pi board from /proc/cpuinfo"
         # Revision list available at: http://elinux.org/RPi_HardwareHistory#Board_Revision_History
         try:
             with open('/proc/cpuinfo', 'r') as infile:
@@ -48,15 +569,19 @@ class Adafruit_I2C(object):
         # Gets the I2C bus number /dev/i2c#
         return 1 if Adafruit_I2C.getPiRevision() > 1 else 0
 
-    def __init__(self, address, busnum=-1, debug=False):
+    def __init__(self, address, busnum=-1, debug=False, priority=PRIORITY_TELEMETRY):
         self.address = address
         # By default, the correct I2C bus is auto-detected using /proc/cpuinfo
         # Alternatively, you can hard-code the bus version below:
-        # self.bus = smbus2.SMBus(0); # Force I2C0 (early 256MB Pi's)
-        # self.bus = smbus2.SMBus(1); # Force I2C1 (512MB Pi's)
-        self.bus = smbus2.SMBus(busnum if busnum >= 0 else Adafruit_I2C.getPiI2CBusNumber())
+        # self.bus = open_bus(0); # Force I2C0 (early 256MB Pi's)
+        # self.bus = open_bus(1); # Force I2C1 (512MB Pi's)
+        # All devices of a bus share one handle, the priority is used by the I2CBusScheduler, see open_bus()
+        self.bus = open_bus(busnum if busnum >= 0 else Adafruit_I2C.getPiI2CBusNumber(), priority)
         self.debug = debug
 
+        # messages of readInto() by (regs, id(buffer))
+        self._messages = dict()
+
     def reverseByteOrder(self, data):
         "Reverses the byte order of an int (16-bit) or long (32-bit) value"
         # Courtesy Vishal Sapre
@@ -121,6 +646,36 @@ class Adafruit_I2C(object):
         except IOError as err:
             return self.errMsg()
 
+    def readInto(self, regs, buffer):
+        "Reads registers into the bytearray in one combined transaction. For each (reg, length) of the tuple regs \
+        the register pointer is written and the register is read with a repeated start, the bytes are stored one \
+        after another. The messages are built once per regs and buffer and read directly into the buffer, hence \
+        nothing is allocated per call. Returns the buffer."
+        try:
+            key = (regs, id(buffer))
+            if key not in self._messages:
+                self._messages[key] = (buffer, self._buildMessages(regs, buffer))
+            self.bus.i2c_rdwr(*self._messages[key][1])
+            if self.debug:
+                print("I2C: Device 0x%02X returned the following from regs %s" % (self.address, regs))
+                print(list(buffer))
+            return buffer
+        except IOError as err:
+            return self.errMsg()
+
+    def _buildMessages(self, regs, buffer):
+        "Returns the messages of readInto(), the read messages point into the buffer"
+        if sum(length for reg, length in regs) > len(buffer):
+            raise ValueError("The buffer is too small for the registers %s" % (regs, ))
+        messages = list()
+        offset = 0
+        for reg, length in regs:
+            read = smbus2.i2c_msg.read(self.address, length)
+            read.buf = (ctypes.c_char * length).from_buffer(buffer, offset)
+            messages += [smbus2.i2c_msg.write(self.address, [reg]), read]
+            offset += length
+        return messages
+
     def readU8(self, reg):
         "Read an unsigned byte from the I2C device"
         try:
@@ -174,3 +729,55 @@ if __name__ == '__main__':
         print("Default I2C bus is accessible")
     except:
         print("Error accessing default I2C bus")
+
+    # Lock contention of four devices polled by one thread each, every sequence takes two transactions of 0.2ms
+    from threading import Thread
+
+    def poll(lock):
+        for i in range(100):
+            with lock:
+                time.sleep(0.0002)
+                time.sleep(0.0002)
+
+    for title, locks in [('single lock', [DeviceLock('i2c-all')] * 4),
+                         ('device locks', [I2CLockManager().get_lock(0x48 + i, busnum=1) for i in range(4)])]:
+        threads = [Thread(target=poll, args=(lock, )) for lock in locks]
+        t0 = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - t0
+        statistics = [lock.get_statistics() for lock in set(locks)]
+        wait = sum(stat['wait-total'] for stat in statistics) / sum(stat['acquisitions'] for stat in statistics)
+        print(f'{title.ljust(12)} : {duration * 1000:.0f}ms, {wait * 1000:.2f}ms mean wait per acquisition')
+
+    # Latencies of a control device polled next to three flooding telemetry devices, every transaction takes 0.2ms
+    class SimulatedBus():
+        def __getattr__(self, operation):
+            def transaction(address, *args):
+                time.sleep(0.0002)
+                return 0
+            return transaction
+
+    scheduler = I2CBusScheduler(1, bus=SimulatedBus())
+    scheduler.start()
+
+    def flood(address):
+        for i in range(200):
+            futures = [scheduler.submit(address, 'read_byte_data', 0x22 + j) for j in range(4)]
+            futures[-1].result()
+
+    def control():
+        for i in range(100):
+            scheduler.submit(0x48, 'read_word_data', 0x00, priority=PRIORITY_CONTROL).result()
+            time.sleep(0.001)
+
+    threads = [Thread(target=flood, args=(0x60 + i, )) for i in range(3)] + [Thread(target=control)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.stop()
+    for key, value in scheduler.get_statistics().items():
+        print(f'{key.ljust(20)} : {value * 1000:.2f}ms' if key.startswith('latency') else f'{key.ljust(20)} : {value}')
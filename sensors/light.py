@@ -1,33 +1,56 @@
 #!/usr/bin/python
 
 import time
-import smbus2
-from sensors.i2c import i2cLock
+import struct
+import numpy as np
+from threading import Event, Lock, Thread
+from sensors import gpio
+from sensors.i2c import i2cLock, open_bus, PRIORITY_TELEMETRY
 
 from sensors.auxiliary import SmartSensor
 
-def validate_config(type: str):
+def validate_config(config: (str, dict)):
     """Checks if all required parameter are available in the passed config dictionary.
 
-    :param type: (mandatory, str) type of the light sensor
+    :param config: (mandatory, str or dict) type of the light sensor or dictionary with the type and the optional
+    'int-gpio' and 'buffer-size' of the high rate sampling
     :return: None
+    :raises KeyError: When the type is missing.
     :raises ValueError: When the passed type was not found.
     """
 
+    if isinstance(config, str):
+        config = {'type': config}
+
+    if 'type' not in config:
+        raise KeyError('Config is missing mandatory field ''type'' of the light sensor.')
+
+    type = config['type']
     if type.upper() != 'SDL_Pi_SI1145' and type.upper() != 'SI1145':
         raise ValueError(f'Light Sensor {type} is not supported.')
 
+    if 'int-gpio' in config and not isinstance(config['int-gpio'], int):
+        raise ValueError('The int-gpio of the light sensor needs to be a gpio number.')
+
+    if 'buffer-size' in config and (not isinstance(config['buffer-size'], int) or config['buffer-size'] < 2):
+        raise ValueError('The buffer-size of the light sensor needs to be an integer of at least 2.')
+
 
-def get_sensor(type: str):
+def get_sensor(config: (str, dict)):
     """Returns a instance of a Light sensor based on the given type
 
-    :param type: (mandatory, str) type of the light sensor
+    :param config: (mandatory, str or dict) type of the light sensor or dictionary with the type and the optional
+    'int-gpio' and 'buffer-size' of the high rate sampling
     :return: None
     :raises ValueError: When the passed type was not found.
     """
 
+    if isinstance(config, str):
+        config = {'type': config}
+
+    type = config['type']
     if type.upper() == 'SDL_Pi_SI1145' or type.upper() == 'SI1145':
-        return SDL_Pi_SI1145()
+        return SDL_Pi_SI1145(int_pin=config.get('int-gpio', None), buffer_size=config.get('buffer-size', 4096))
     else:
         raise ValueError(f'Light Sensor {type} is not supported.')
 
@@ -187,15 +210,18 @@ class SDL_Pi_SI1145(SmartSensor):
     DARKOFFSETVIS = 259
     DARKOFFSETIR = 253
 
-    def __init__(self):
+    def __init__(self, int_pin: int = None, buffer_size: int = 4096):
         """Constructor.
+
+        :param int_pin: (optional, int) gpio connected to INT, enables the high rate sampling (Default: None)
+        :param buffer_size: (optional, int) number of samples buffered by the high rate sampling (Default: 4096)
         """
 
         # store lock
-        self._lock = i2cLock()
+        self._lock = i2cLock(SDL_Pi_SI1145.ADDR, busnum=1)
 
         # Create I2C device.
-        self._device = smbus2.SMBus(1)
+        self._device = open_bus(1, PRIORITY_TELEMETRY)
 
         # reset device
         self._reset()
@@ -203,6 +229,12 @@ class SDL_Pi_SI1145(SmartSensor):
         # Load calibration values.
         self._load_calibration()
 
+        # the sensor measures every 8ms and signals each measurement on INT
+        self._sampler = None
+        if int_pin is not None:
+            self._sampler = SI1145Sampler(sensor=self, pin=int_pin, buffer_size=buffer_size)
+            self._sampler.start()
+
     # device reset
     def _reset(self):
         """Resets the device
@@ -210,7 +242,7 @@ class SDL_Pi_SI1145(SmartSensor):
         :return:
         """
 
-        # acquire the i2cLock to allow proper multi threading
+        # acquire the lock of the device to allow proper multi threading
         with self._lock:
             self._device.write_byte_data(SDL_Pi_SI1145.ADDR, SDL_Pi_SI1145.REG_MEASRATE0, 0)
             self._device.write_byte_data(SDL_Pi_SI1145.ADDR, SDL_Pi_SI1145.REG_MEASRATE1, 0)
@@ -229,7 +261,7 @@ class SDL_Pi_SI1145(SmartSensor):
     def writeParam(self, p, v):
         """Write Parameter to the Sensor."""
 
-        # acquire the i2cLock to allow proper multi threading
+        # acquire the lock of the device to allow proper multi threading
         with self._lock:
             self._device.write_byte_data(SDL_Pi_SI1145.ADDR, SDL_Pi_SI1145.REG_PARAMWR, v)
             self._device.write_byte_data(SDL_Pi_SI1145.ADDR, SDL_Pi_SI1145.REG_COMMAND, p | SDL_Pi_SI1145.PARAM_SET)
@@ -240,7 +272,7 @@ class SDL_Pi_SI1145(SmartSensor):
     def _load_calibration(self):
         """Load calibration data."""
 
-        # acquire the i2cLock to allow proper multi threading
+        # acquire the lock of the device to allow proper multi threading
         with self._lock:
             # /***********************************/
             # Enable UVindex measurement coefficients!
@@ -309,7 +341,7 @@ class SDL_Pi_SI1145(SmartSensor):
     def readIR(self):
         """returns IR light levels"""
 
-        # acquire the i2cLock to allow proper multi threading
+        # acquire the lock of the device to allow proper multi threading
         with self._lock:
             data = self._device.read_i2c_block_data(SDL_Pi_SI1145.ADDR, 0x24, 2)
         return data[1] * 256 + data[0]
@@ -322,7 +354,7 @@ class SDL_Pi_SI1145(SmartSensor):
     def readProx(self):
         """Returns "Proximity" - assumes an IR LED is attached to LED"""
 
-        # acquire the i2cLock to allow proper multi threading
+        # acquire the lock of the device to allow proper multi threading
         with self._lock:
             data = self._device.read_i2c_block_data(SDL_Pi_SI1145.ADDR, 0x26, 2)
         return data[1] * 256 + data[0]
@@ -330,7 +362,7 @@ class SDL_Pi_SI1145(SmartSensor):
     def readUV(self):
         """Returns the UV index * 100 (divide by 100 to get the index)
         """
-        # acquire the i2cLock to allow proper multi threading
+        # acquire the lock of the device to allow proper multi threading
         with self._lock:
             data = self._device.read_i2c_block_data(SDL_Pi_SI1145.ADDR, 0x2C, 2)
         # apply additional calibration of /10 based on sunlight
@@ -344,11 +376,53 @@ class SDL_Pi_SI1145(SmartSensor):
     def readVisible(self):
         """returns visible + IR light levels"""
 
-        # acquire the i2cLock to allow proper multi threading
+        # acquire the lock of the device to allow proper multi threading
         with self._lock:
             data = self._device.read_i2c_block_data(SDL_Pi_SI1145.ADDR, 0x22, 2)
         return data[1] * 256 + data[0]
 
+    def readAll(self):
+        """Reads the data registers of all channels (0x22-0x2D) in a single transaction, so all values stem from the
+        same measurement cycle.
+
+        :return: dict with the 'visible', 'ir', 'prox' and 'uv' (see readUV()) levels
+        """
+
+        # acquire the lock of the device to allow proper multi threading
+        with self._lock:
+            data = self._device.read_i2c_block_data(SDL_Pi_SI1145.ADDR, SDL_Pi_SI1145.REG_ALSVISDATA0,
+                                                    SDL_Pi_SI1145.REG_UVINDEX1 - SDL_Pi_SI1145.REG_ALSVISDATA0 + 1)
+
+        return self._decode(data)
+
+    def readInterrupt(self):
+        """Reads all channels like readAll() and clears the ALS interrupt afterwards, which releases INT.
+
+        :return: dict with the 'visible', 'ir', 'prox' and 'uv' (see readUV()) levels
+        """
+
+        # acquire the lock of the device to allow proper multi threading
+        with self._lock:
+            data = self._device.read_i2c_block_data(SDL_Pi_SI1145.ADDR, SDL_Pi_SI1145.REG_ALSVISDATA0,
+                                                    SDL_Pi_SI1145.REG_UVINDEX1 - SDL_Pi_SI1145.REG_ALSVISDATA0 + 1)
+            self._device.write_byte_data(SDL_Pi_SI1145.ADDR, SDL_Pi_SI1145.REG_IRQSTAT, SDL_Pi_SI1145.REG_IRQSTAT_ALS)
+
+        return self._decode(data)
+
+    @staticmethod
+    def _decode(data: list):
+        """Decodes the data registers 0x22-0x2D.
+
+        :param data: (mandatory, list) the bytes of the registers
+        :return: dict with the 'visible', 'ir', 'prox' and 'uv' (see readUV()) levels
+        """
+
+        # little endian words: visible, IR, PS1, PS2, PS3 and UV index
+        vis, ir, prox, _, _, uv = struct.unpack('<6H', bytes(data))
+
+        # apply additional calibration of /10 based on sunlight
+        return {'visible': vis, 'ir': ir, 'prox': prox, 'uv': uv / 10}
+
     def readVisibleLux(self):
         """returns visible + IR light levels in lux"""
 
@@ -358,10 +432,8 @@ class SDL_Pi_SI1145(SmartSensor):
         """Converts IR levels to lux."""
 
         # irlux = ir * 14.5 / 2.44 for range = high and gain = 1
-        # apply dark offset
-        ir = ir - SDL_Pi_SI1145.DARKOFFSETIR
-        if ir < 0:
-            ir = 0
+        # apply dark offset (works on numpy arrays as well)
+        ir = np.maximum(ir - SDL_Pi_SI1145.DARKOFFSETIR, 0)
 
         lux = 2.44
         irlux = 0
@@ -412,10 +484,8 @@ class SDL_Pi_SI1145(SmartSensor):
         """Converts the visible light level to lux."""
 
         # vislux = vis * 14.5 / 2.44 for range = high and gain = 1
-        # apply dark offset
-        vis = vis - SDL_Pi_SI1145.DARKOFFSETVIS
-        if vis < 0:
-            vis = 0
+        # apply dark offset (works on numpy arrays as well)
+        vis = np.maximum(vis - SDL_Pi_SI1145.DARKOFFSETVIS, 0)
 
         lux = 2.44
         vislux = 0
@@ -457,19 +527,143 @@ class SDL_Pi_SI1145(SmartSensor):
         vislux = vis * (gain / (lux * multiplier)) * 100
         return vislux
 
+    @property
+    def bus_time(self):
+        """A measurement takes one block read, with the high rate sampling it only takes the buffered samples."""
+        return 0.0 if self._sampler is not None else 0.001
+
     def measure(self):
         """Performs a measurement and returns all available values in a dictionary.
         The keys() are the names of the measurement and the values the corresponding values.
 
+        With the high rate sampling, the values are the means of all samples since the last measurement, completed by
+        their min, max, percentiles and the lux-seconds of the visible and infrared light.
+
         :return: dict
         """
 
-        vis_raw = self.readVisible()
+        if self._sampler is not None:
+            samples = self._sampler.take()
+            # fall back to a single measurement if the sampler did not get anything (e.g. INT not connected)
+            if len(samples) >= 2:
+                return self._aggregate(samples)
+
+        # read all channels at once
+        data = self.readAll()
+
+        vis_raw = data['visible']
         vis_lux = self.convertVisibleToLux(vis_raw)
-        ir_raw = self.readIR()
+        ir_raw = data['ir']
         ir_lux = self.convertIrToLux(ir_raw)
-        uv_idx = self.readUVindex()
+        uv_idx = self.convertUvToIdx(data['uv'])
 
         return {'visual-light-raw': float(vis_raw), 'visual-light': float(vis_lux),
                 'infrared-light-raw': float(ir_raw), 'infrared-light': float(ir_lux),
                 'uv-index': float(uv_idx)}
+
+    def _aggregate(self, samples: np.ndarray):
+        """Aggregates the samples of the high rate sampling.
+
+        :param samples: (mandatory, numpy.ndarray) the samples as returned by SI1145Sampler.take()
+        :return: dict
+        """
+
+        times = samples[:, SI1145Sampler.TIME]
+        values = np.column_stack((samples[:, SI1145Sampler.VISIBLE],
+                                  self.convertVisibleToLux(samples[:, SI1145Sampler.VISIBLE]),
+                                  samples[:, SI1145Sampler.IR],
+                                  self.convertIrToLux(samples[:, SI1145Sampler.IR]),
+                                  self.convertUvToIdx(samples[:, SI1145Sampler.UV])))
+        names = ['visual-light-raw', 'visual-light', 'infrared-light-raw', 'infrared-light', 'uv-index']
+
+        data = {name: float(mean) for name, mean in zip(names, values.mean(axis=0))}
+
+        # distribution of the converted values
+        converted = [1, 3, 4]
+        minimum = values[:, converted].min(axis=0)
+        maximum = values[:, converted].max(axis=0)
+        percentiles = np.percentile(values[:, converted], [10, 50, 90], axis=0)
+        for i, col in enumerate(converted):
+            data[f'{names[col]}-min'] = float(minimum[i])
+            data[f'{names[col]}-max'] = float(maximum[i])
+            for percentile, value in zip([10, 50, 90], percentiles[:, i]):
+                data[f'{names[col]}-p{percentile}'] = float(value)
+
+        # integral of the light levels over time (trapezoidal rule)
+        lux = values[:, [1, 3]]
+        lux_seconds = np.sum((lux[1:] + lux[:-1]) * np.diff(times)[:, np.newaxis] / 2, axis=0)
+        data['visual-light-lux-seconds'] = float(lux_seconds[0])
+        data['infrared-light-lux-seconds'] = float(lux_seconds[1])
+
+        data['samples'] = len(samples)
+
+        return data
+
+
+class SI1145Sampler(Thread):
+    """The SI1145Sampler services the INT line of the SI1145. The sensor measures autonomously every 8ms and asserts INT
+    after each ALS measurement until the interrupt has been cleared. The sampler reads all channels of each
+    measurement and stores them in a ring buffer, which SDL_Pi_SI1145.measure() aggregates."""
+
+    # the columns of the ring buffer
+    TIME, VISIBLE, IR, UV = range(4)
+
+    def __init__(self, sensor: SDL_Pi_SI1145, pin: int, buffer_size: int = 4096):
+        """Constructor
+
+        :param sensor: (mandatory, SDL_Pi_SI1145) the sensor
+        :param pin: (mandatory, int) gpio connected to INT
+        :param buffer_size: (optional, int) number of buffered samples (Default: 4096)
+        """
+
+        super().__init__(name='SI1145Sampler', daemon=True)
+
+        self.sensor = sensor
+        self.pin = pin
+
+        self._ring = np.zeros((buffer_size, 4))
+        # number of samples stored and taken so far
+        self._stored_cnt = 0
+        self._taken_cnt = 0
+
+        self._lock = Lock()
+        self._stop_event = Event()
+
+    def stop(self):
+        """Stops the sampling."""
+
+        self._stop_event.set()
+
+    def take(self):
+        """Returns the samples stored since the last call (at most the size of the ring buffer), the oldest first.
+
+        :return: numpy.ndarray with the columns TIME (monotonic in s), VISIBLE, IR and UV
+        """
+
+        with self._lock:
+            size = len(self._ring)
+            first = max(self._taken_cnt, self._stored_cnt - size)
+            indices = np.arange(first, self._stored_cnt) % size
+            self._taken_cnt = self._stored_cnt
+            return self._ring[indices]
+
+    def run(self):
+        """The Thread method."""
+
+        while not self._stop_event.is_set():
+            # INT is an open drain output and stays low until the interrupt is cleared, checking the level as well
+            # recovers from edges missed while the previous sample was read
+            if not gpio.capture_edges(self.pin, count=1, timeout=0.1, edge=gpio.FALLING, pull=gpio.PUD_UP) \
+                    and gpio.input(self.pin) != gpio.LOW:
+                continue
+
+            try:
+                data = self.sensor.readInterrupt()
+            except OSError:
+                # the next interrupt will be serviced anyway
+                continue
+
+            with self._lock:
+                self._ring[self._stored_cnt % len(self._ring)] = (time.monotonic(), data['visible'], data['ir'],
+                                                                  data['uv'])
+                self._stored_cnt += 1
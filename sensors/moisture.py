@@ -1,12 +1,14 @@
 #!/usr/bin/python
 
+import numpy as np
+
 from sensors.auxiliary import SmartSensor
-from sensors.ad_converter import ADConverter
+from sensors.ad_converter import ADAutoTuner, ADConverter, ADSampler
 
 class CapacitiveSoilMoistureSensor(SmartSensor):
     """This class is an interface to the Capacitive Soil Moisture Sensor v1.2"""
 
-    # the PGA of the capacitive moisture sensor
+    # the PGA of the capacitive moisture sensor (unless it is tuned)
     __PGA = 4096  # +/- 4.096V
 
     # the minimum voltage the sensor will return
@@ -21,19 +23,37 @@ class CapacitiveSoilMoistureSensor(SmartSensor):
     # the max voltage which will be interpreted as valid reading
     __MAX_VALID_VOLTAGE = 3
 
+    # the reductions of the samples of a burst to a single voltage
+    REDUCTIONS = ['median', 'trimmed-mean']
 
-    def __init__(self, address, channel, sps=250):
+    def __init__(self, address, channel, sps=250, samples=1, reduction='median', tuner=None, noise=None):
         """Constructor
 
         :param address: (mandatory, hex) the i2c address of the ADS1x15 a/d converter
         :param channel: (mandatory, uint) the channel to which the sensor is connected to
         :param sps: samples per second
+        :param samples: (optional, int) number of samples per measurement (Default: 1)
+        :param reduction: (optional, str) 'median' or 'trimmed-mean' of the samples (Default: 'median')
+        :param tuner: (optional, ADAutoTuner) tunes the gain and data rate based on the bursts (Default: None)
+        :param noise: (optional, float) the max standard deviation of the samples in mV (mandatory for the tuner)
         """
 
         # store properties
         self._adconv = ADConverter(address)
         self._chan = channel
+        self._pga = self.__PGA
         self._sps = sps
+        self._samples = samples
+        self._reduction = reduction
+
+        # the channels and voltages of a burst in mV
+        self._burst_channels = [channel] * samples
+        self._burst = np.empty(samples)
+
+        # the tuner selects the gain and the data rate of the channel
+        self._tuner = tuner
+        if tuner is not None:
+            self._pga, self._sps = tuner.register(self._adconv.address, channel, pga=self._pga, sps=sps, noise=noise)
 
         # perform a first read because some time there seems to be some sort of glitch where the internal memory
         self._read()
@@ -48,11 +68,66 @@ class CapacitiveSoilMoistureSensor(SmartSensor):
         return 1 - ((v - self.__MIN_VOLTAGE) / (self.__MAX_VOLTAGE - self.__MIN_VOLTAGE))
 
 
+    def convertMoistureToVoltage(self, moisture: float):
+        """Converts a moisture level to the voltage the sensor returns at that level (inverse of the conversion done by
+        measure()).
+
+        :param moisture: (mandatory, float) moisture level from 0-1
+        :return: voltage in V
+        """
+
+        return self.__MIN_VOLTAGE + (1 - moisture) * (self.__MAX_VOLTAGE - self.__MIN_VOLTAGE)
+
     def _read(self):
-        """Reads the sensor voltage."""
+        """Reads the sensor voltage. If a ADSampler is running on the a/d converter, the voltage is taken from its
+        buffers without accessing the i2c bus.
+
+        :return: voltage in V or None if the sampler did not convert the channel yet or on bus errors
+        """
 
+        sampler = ADSampler.get(self._adconv.address)
+        if sampler is not None and self._chan in sampler.channels:
+            millivolts = sampler.read(self._chan)
+            return None if millivolts is None else millivolts / 1000
+
+        millivolts = self._adconv.readADCSingleEnded(channel=self._chan, pga=self._pga, sps=self._sps)
         # convert from mV to V
-        return self._adconv.readADCSingleEnded(channel=self._chan, pga=self.__PGA, sps=self._sps) / 1000
+        return None if millivolts is None else millivolts / 1000
+
+    def _readBurst(self):
+        """Converts a burst of samples and reduces the valid ones to a single voltage. Glitches outside the valid
+        voltage range are dropped. The trimmed mean is the mean of the samples in between the quartiles. A burst which
+        clipped at the full scale range of the gain is invalid, the actual voltage is unknown.
+
+        :return: (voltage in V, interquartile range in V) or (None, None) if less than half of the samples are valid
+        """
+
+        pga = self._pga
+        millivolts = self._adconv.read_channels(self._burst_channels, pga=pga, sps=self._sps, out=self._burst)
+
+        # conversions lost to bus errors are NaN
+        converted = millivolts[~np.isnan(millivolts)]
+        if not len(converted):
+            return None, None
+
+        # the settings of the next burst
+        if self._tuner is not None:
+            self._pga, self._sps = self._tuner.update(self._adconv.address, self._chan, converted)
+
+        if ADAutoTuner.clipped(converted, pga):
+            return None, None
+
+        # convert from mV to V
+        volts = np.divide(millivolts, 1000, out=millivolts)
+
+        valid = volts[(volts >= self.__MIN_VALID_VOLTAGE) & (volts <= self.__MAX_VALID_VOLTAGE)]
+        if 2 * len(valid) < self._samples:
+            return None, None
+
+        q1, median, q3 = np.percentile(valid, [25, 50, 75])
+        if self._reduction == 'median':
+            return float(median), float(q3 - q1)
+        return float(valid[(valid >= q1) & (valid <= q3)].mean()), float(q3 - q1)
 
     def readMoistureLevel(self):
         """Returns the moisture level from 0-1.
@@ -64,7 +139,7 @@ class CapacitiveSoilMoistureSensor(SmartSensor):
         # read the voltage
         volts = self._read()
         # check if the values are within boundaries one would expect
-        if volts < self.__MIN_VALID_VOLTAGE or volts > self.__MAX_VALID_VOLTAGE:
+        if volts is None or volts < self.__MIN_VALID_VOLTAGE or volts > self.__MAX_VALID_VOLTAGE:
             return None
         # return the converted voltage value
         return self._convertVoltageToMoisture(volts)
@@ -76,16 +151,65 @@ class CapacitiveSoilMoistureSensor(SmartSensor):
         :return: dict
         """
 
-        # read the voltage
-        volts = self._read()
+        # the sampler buffers single conversions
+        sampler = ADSampler.get(self._adconv.address)
+        if self._samples == 1 or (sampler is not None and self._chan in sampler.channels):
+            return self.convert(self._read())
+
+        return self.convert(*self._readBurst())
+
+    def convert(self, volts: float, spread: float = None):
+        """Converts a voltage reading into the dictionary returned by measure(). Use this to process voltages which
+        have been read outside of this class (e.g. by a scan of all channels of the ADC).
+
+        :param volts: (mandatory, float) voltage in V or None
+        :param spread: (optional, float) the spread of the samples of a burst in V
+        :return: dict
+        """
+
+        data = {'volts': None, 'percentage': None}
+        if self._samples > 1:
+            data['spread'] = spread
+
         # check if the values are within boundaries one would expect
-        if volts < self.__MIN_VALID_VOLTAGE or volts > self.__MAX_VALID_VOLTAGE:
-            return {'volts': None, 'percentage': None}
+        if volts is None or volts < self.__MIN_VALID_VOLTAGE or volts > self.__MAX_VALID_VOLTAGE:
+            return data
 
         # convert the volts to moisture level
-        moisture = self._convertVoltageToMoisture(volts)
+        data['volts'] = float(volts)
+        data['percentage'] = float(self._convertVoltageToMoisture(volts))
+
+        return data
+
+    @property
+    def adconv(self):
+        """The ADS1x15 a/d converter the sensor is connected to."""
+        return self._adconv
+
+    @property
+    def channel(self):
+        """The channel of the a/d converter the sensor is connected to."""
+        return self._chan
+
+    @property
+    def pga(self):
+        """The programmable gain of the a/d converter in mV."""
+        return self._pga
 
-        return {'volts': float(volts), 'percentage': float(moisture)}
+    @property
+    def sps(self):
+        """The samples per second of the a/d converter."""
+        return self._sps
+
+    @property
+    def samples(self):
+        """The number of samples per measurement."""
+        return self._samples
+
+    @property
+    def bus_time(self):
+        """The conversions of a measurement occupy the a/d converter."""
+        return self._samples / self._sps
 
     @classmethod
     def from_config(cls, config: dict):
@@ -95,7 +219,15 @@ class CapacitiveSoilMoistureSensor(SmartSensor):
         :return: CapacitiveSoilMoistureSensor
         """
 
-        return cls(address=config['i2c-address'], channel=config['channel'])
+        tuner = None
+        noise = None
+        if 'auto-tune' in config:
+            tuner = ADAutoTuner(config['auto-tune'].get('file', 'ad-tuning.yaml'))
+            noise = config['auto-tune']['noise']
+
+        return cls(address=config['i2c-address'], channel=config['channel'], sps=config.get('sps', 250),
+                   samples=config.get('samples', 1), reduction=config.get('reduction', 'median'), tuner=tuner,
+                   noise=noise)
 
     @staticmethod
     def validate_config(config: dict):
@@ -124,3 +256,28 @@ class CapacitiveSoilMoistureSensor(SmartSensor):
 
         # check value
         ADConverter._types[config['i2c-address']].validate_channel(config['channel'])
+
+        # burst ############################
+
+        if 'sps' in config and config['sps'] not in ADConverter._types[config['i2c-address']].spsADS1115:
+            raise ValueError(f'Samples per second \'{config["sps"]}\' of the moisture sensor are not supported.')
+
+        if 'samples' in config and (not isinstance(config['samples'], int) or config['samples'] < 1):
+            raise ValueError('The samples of the moisture sensor need to be a positive integer.')
+
+        if config.get('reduction', 'median') not in CapacitiveSoilMoistureSensor.REDUCTIONS:
+            raise ValueError(f'Reduction \'{config["reduction"]}\' of the moisture sensor is not supported. Please '
+                             f'select one: {", ".join(CapacitiveSoilMoistureSensor.REDUCTIONS)}')
+
+        # auto-tune ########################
+
+        if 'auto-tune' in config:
+            # the noise is estimated from the bursts
+            if config.get('samples', 1) < 4:
+                raise ValueError('The auto-tune of the moisture sensor requires at least 4 samples per measurement.')
+
+            if 'noise' not in config['auto-tune']:
+                raise KeyError('Config is missing mandatory field ''noise'' of the auto-tune.')
+
+            if not isinstance(config['auto-tune']['noise'], (int, float)) or config['auto-tune']['noise'] <= 0:
+                raise ValueError('The noise of the auto-tune needs to be a positive number in mV.')
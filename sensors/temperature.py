@@ -1,14 +1,11 @@
 #!/usr/bin/python
 
-import RPi.GPIO as GPIO
 from time import sleep
 from enum import Enum
 
+from sensors import gpio
 from sensors.auxiliary import SmartSensor
 
-def set_max_priority(): pass
-def set_default_priority(): pass
-
 def validate_config(config: dict):
     """Checks if all required parameter are available in the passed config dictionary.
 
@@ -138,9 +135,23 @@ class DHT(SmartSensor):
     http://wiki.seeedstudio.com/Grove-TemperatureAndHumidity_Sensor/
     """
 
-    PULSES_CNT = 41
+    # number of data bits send by the sensor
+    BITS_CNT = 40
+
+    # edges of one transmission: response low & high, 40 bits (low & high) and the final low & release
+    EDGES_CNT = 2 * BITS_CNT + 4
+
+    # max duration of one transmission in seconds (~4.5ms)
+    TIMEOUT = 0.01
+
+    # a high pulse of a 0 bit lasts 26-28us, of a 1 bit 70us
+    BIT_THRESHOLD_NS = 48000
 
-    MAX_CNT = 320
+    # the time the host pulls the line low to start the transmission in seconds
+    START_TIME = .018
+
+    # the time between two attempts in seconds
+    RETRY_DELAY = .2
 
     def __init__(self, dht_type: [DHTtype, str, int], pin: int):
         """
@@ -153,10 +164,13 @@ class DHT(SmartSensor):
         self.pin = pin
         self.dht_type = dht_type
 
-        # setup the GPIO mode
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        GPIO.setup(self.pin, GPIO.OUT)
+        # setup the GPIO mode, the line is idle high
+        gpio.setup(self.pin, gpio.OUT, initial=gpio.HIGH)
+
+    @property
+    def bus_time(self):
+        """The start signal and the transmission occupy the data line."""
+        return self.START_TIME + self.TIMEOUT
 
     @property
     def dht_type(self):
@@ -168,101 +182,86 @@ class DHT(SmartSensor):
         self._last_temp = 0.0
         self._last_humi = 0.0
 
+    @classmethod
+    def decode_edges(cls, edges: list):
+        """Decodes the 5 data bytes from the captured edges. The bits are classified by the width of their high
+        pulses, only the last 40 complete high pulses are taken into account. Therefore it does not matter whether
+        the edges of the response signal have been captured or not.
+
+        :param edges: (mandatory, list) list of (timestamp in ns, level after the edge) tuples
+        :return: (int with the 40 data bits or None, error message or None)
+        """
+
+        # the widths of all complete high pulses
+        widths = list()
+        rise = None
+        for timestamp, level in edges:
+            if level:
+                rise = timestamp
+            elif rise is not None:
+                widths.append(timestamp - rise)
+                rise = None
+
+        if len(widths) < cls.BITS_CNT:
+            return None, f'received {len(widths)} of {cls.BITS_CNT} bits'
+        widths = widths[-cls.BITS_CNT:]
+
+        data = 0
+        for width in widths:
+            data = (data << 1) | (width > cls.BIT_THRESHOLD_NS)
+
+        # the last byte is the checksum of the first four
+        if (data & 0xFF) != (((data >> 32) + (data >> 24) + (data >> 16) + (data >> 8)) & 0xFF):
+            return None, 'checksum error!'
+
+        return data, None
+
+    def _convert(self, data: int):
+        """Converts the data bits to humidity and temperature.
+
+        :param data: (mandatory, int) the 40 data bits
+        :return: (humidity in %, temperature in °C)
+        """
+
+        if self._dht_type == DHTtype.DHT11:
+            return int(data >> 32), int((data >> 16) & 0xFF)
+
+        humi = ((data >> 24) & 0xFFFF) * 0.1
+        temp = ((data >> 8) & 0x7FFF) * 0.1
+        if data & 0x800000:
+            temp = -temp
+        return float(humi), float(temp)
+
     def _read(self):
         """Internal read method.
 
-        :returns (humidity in %, temperature in °C)"""
-
-        # Send Falling signal to trigger sensor output data
-        # Wait for 20ms to collect 42 bytes data
-        GPIO.setup(self.pin, GPIO.OUT)
-        set_max_priority()
-
-        GPIO.output(self.pin, GPIO.HIGH)
-        sleep(.2)
-
-        GPIO.output(self.pin, GPIO.LOW)
-        sleep(.018)
-
-        GPIO.setup(self.pin, GPIO.IN)
-
-        # a short delay needed
-        for i in range(10):
-            pass
-
-        # pullup by host 20-40 us
-        count = 0
-        while GPIO.input(self.pin):
-            count += 1
-            if count > self.MAX_CNT:
-                # print("pullup by host 20-40us failed")
-                set_default_priority()
-                return None, "pullup by host 20-40us failed"
-
-        pulse_cnt = [0] * (2 * self.PULSES_CNT)
-        fix_crc = False
-        for i in range(0, self.PULSES_CNT * 2, 2):
-            while not GPIO.input(self.pin):
-                pulse_cnt[i] += 1
-                if pulse_cnt[i] > self.MAX_CNT:
-                    # print("pulldown by DHT timeout %d" % i))
-                    set_default_priority()
-                    return None, "pulldown by DHT timeout {}".format(i)
-
-            while GPIO.input(self.pin):
-                pulse_cnt[i + 1] += 1
-                if pulse_cnt[i + 1] > self.MAX_CNT:
-                    # print("pullup by DHT timeout {}".format((i + 1)))
-                    if i == (self.PULSES_CNT - 1) * 2:
-                        # fix_crc = True
-                        # break
-                        pass
-                    set_default_priority()
-                    return None, "pullup by DHT timeout {}".format(i)
-
-        # back to normal priority
-        set_default_priority()
-
-        total_cnt = 0
-        for i in range(2, 2 * self.PULSES_CNT, 2):
-            total_cnt += pulse_cnt[i]
-
-        # Low level ( 50 us) average counter
-        average_cnt = total_cnt / (self.PULSES_CNT - 1)
-        # print("low level average loop = {}".format(average_cnt))
-
-        data = ''
-        for i in range(3, 2 * self.PULSES_CNT, 2):
-            if pulse_cnt[i] > average_cnt:
-                data += '1'
-            else:
-                data += '0'
-
-        data0 = int(data[0: 8], 2)
-        data1 = int(data[8:16], 2)
-        data2 = int(data[16:24], 2)
-        data3 = int(data[24:32], 2)
-        data4 = int(data[32:40], 2)
-
-        if fix_crc and data4 != ((data0 + data1 + data2 + data3) & 0xFF):
-            data4 = data4 ^ 0x01
-            data = data[0: self.PULSES_CNT - 2] + ('1' if data4 & 0x01 else '0')
-
-        if data4 == ((data0 + data1 + data2 + data3) & 0xFF):
-            if self._dht_type == DHTtype.DHT11:
-                humi = int(data0)
-                temp = int(data2)
-            elif self._dht_type == DHTtype.DHT22:
-                humi = float(int(data[0:16], 2) * 0.1)
-                temp = float(int(data[17:32], 2) * 0.2 * (0.5 - int(data[16], 2)))
+        :returns (humidity in %, temperature in °C) or (None, error message)"""
+
+        # pull the line low to trigger the sensor output data
+        gpio.setup(self.pin, gpio.OUT)
+        gpio.output(self.pin, gpio.LOW)
+        sleep(self.START_TIME)
+
+        # release the line and time stamp the edges of the transmission. The bits are only 26-70us wide, backends
+        # without precise edge time stamps (RPi.GPIO) have to poll the level instead
+        if gpio.precise_edges():
+            edges = gpio.capture_edges(self.pin, count=self.EDGES_CNT, timeout=self.TIMEOUT)
         else:
-            # print("checksum error!")
-            return None, "checksum error!"
+            edges = gpio.poll_edges(self.pin, count=self.EDGES_CNT, timeout=self.TIMEOUT)
 
-        return humi, temp
+        # idle high until the next read
+        gpio.setup(self.pin, gpio.OUT, initial=gpio.HIGH)
+
+        data, error = self.decode_edges(edges)
+        if data is None:
+            return None, error
+
+        return self._convert(data)
 
     def read(self, retries=15):
         for i in range(retries):
+            if i:
+                sleep(self.RETRY_DELAY)
             humi, temp = self._read()
             if not humi is None:
                 break
@@ -271,7 +270,6 @@ class DHT(SmartSensor):
         self._last_humi, self._last_temp = humi, temp
         return humi, temp
 
-
     def measure(self):
         """Performs a measurement and returns all available values in a dictionary.
         The keys() are the names of the measurement and the values the corresponding values.
@@ -283,3 +281,64 @@ class DHT(SmartSensor):
         if humi == 0 and temp == 0:
             return {'humidity': None, 'temperature': None}
         return {'humidity': float(humi), 'temperature': float(temp)}
+
+
+if __name__ == '__main__':
+    # Benchmark of the CPU time and success rate per read based on waveforms of the DHT timing
+    #   python -m sensors.temperature [reads]
+    import sys
+    import time
+    import random
+
+    def waveform(data: bytes, jitter_ns: int = 0, t0: int = 0, release: bool = True):
+        """Edges of a transmission of the data bytes, optional with the rising edge of the host release."""
+
+        rnd = lambda ns: ns + random.randint(-jitter_ns, jitter_ns)
+        edges = list()
+        t = t0
+        if release:
+            edges.append((t, gpio.HIGH))
+            t += rnd(30000)
+        # response: 80us low, 80us high
+        for level, width in ((gpio.LOW, 80000), (gpio.HIGH, 80000)):
+            edges.append((t, level))
+            t += rnd(width)
+        for bit in bin(int.from_bytes(data, 'big'))[2:].zfill(DHT.BITS_CNT):
+            edges.append((t, gpio.LOW))
+            t += rnd(50000)
+            edges.append((t, gpio.HIGH))
+            t += rnd(70000 if bit == '1' else 27000)
+        edges.append((t, gpio.LOW))
+        t += rnd(50000)
+        edges.append((t, gpio.HIGH))
+        return edges
+
+    # 45%, 23°C (DHT11), 65.2%, 35.1°C and 40.0%, -10.1°C (DHT22)
+    fixtures = {
+        'dht11': (DHTtype.DHT11, bytes([0x2D, 0x00, 0x17, 0x00, 0x44]), (45, 23)),
+        'dht22': (DHTtype.DHT22, bytes([0x02, 0x8C, 0x01, 0x5F, 0xEE]), (65.2, 35.1)),
+        'dht22-negative': (DHTtype.DHT22, bytes([0x01, 0x90, 0x80, 0x65, 0x76]), (40.0, -10.1)),
+    }
+
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    backend = gpio.FakeGpioBackend()
+    gpio.set_backend(backend)
+    pin = 5
+
+    for name, (dht_type, data, expected) in fixtures.items():
+        sensor = DHT(dht_type=dht_type, pin=pin)
+        sensor.START_TIME = 0
+
+        # noisy waveforms, every 10th transmission misses the last bit
+        for i in range(reads):
+            edges = waveform(data, jitter_ns=8000, release=bool(i % 2))
+            backend.queue_edges(pin, edges[:-3] if i % 10 == 9 else edges)
+
+        ok = 0
+        t0 = time.process_time()
+        for i in range(reads):
+            humi, temp = sensor._read()
+            ok += humi is not None and (round(humi, 1), round(temp, 1)) == expected
+        cpu = time.process_time() - t0
+
+        print(f'{name.ljust(14)} : {cpu / reads * 1e6:.1f}us CPU per read, {ok / reads * 100:.1f}% successful reads')
@@ -2,6 +2,7 @@
 
 import sys
 import signal
+import asyncio
 from CarlosOnEdge import CarlosOnEdge
 
 # Keyboard interrupt handler
@@ -11,5 +12,8 @@ def signal_handler(signal, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 my_carlos = CarlosOnEdge()
-my_carlos.start()
-my_carlos.wait()
+if my_carlos.config.get('runtime', dict()).get('mode', 'threads') == 'asyncio':
+    asyncio.run(my_carlos.run_async())
+else:
+    my_carlos.start()
+    my_carlos.wait()